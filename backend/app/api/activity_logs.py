@@ -1,10 +1,16 @@
 from typing import List, Optional
 from datetime import datetime
-from fastapi import APIRouter, Depends
-from sqlmodel import Session, select, SQLModel, Field
-from app.database import get_session
-from app.models import ActivityLog, User
+from fastapi import APIRouter, Depends, HTTPException, Query, Response
+from starlette.concurrency import run_in_threadpool
+from sqlalchemy import tuple_
+from sqlmodel import select, SQLModel, Field
+from sqlmodel.ext.asyncio.session import AsyncSession
+from app.database import get_async_session
+from app.models import ActivityLog, User, Role
 from app.api.deps import get_current_admin_user, get_current_user
+from app.api.pagination import decode_cursor, parse_datetime, set_next_cursor, to_utc_naive
+from app.services.log_archive import query_archive, archive_summary
+from app.services.log_search import parse_query, search_statement
 
 router = APIRouter()
 
@@ -17,16 +23,103 @@ class ActivityLogRead(SQLModel):
     username: str
 
 @router.get("/", response_model=List[ActivityLogRead])
-def read_activity_logs(
-    skip: int = 0, 
-    limit: int = 50, 
-    session: Session = Depends(get_session),
+async def read_activity_logs(
+    response: Response,
+    limit: int = Query(50, ge=1, le=500),
+    cursor: Optional[str] = None,
+    user_id: Optional[int] = None,
+    action: Optional[str] = None,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    include_archive: bool = False,
+    session: AsyncSession = Depends(get_async_session),
     current_user: User = Depends(get_current_user)
 ):
-    logs = session.exec(select(ActivityLog).order_by(ActivityLog.timestamp.desc()).offset(skip).limit(limit)).all()
-    return [
+    """
+    Newest first. Pass the X-Next-Cursor response header back as `cursor` for the next page.
+    With include_archive (admins), paging continues into the archived logs once the table is exhausted.
+    """
+    if include_archive and current_user.role != Role.ADMIN:
+        raise HTTPException(status_code=403, detail="Only admins can read archived logs")
+    start, end = to_utc_naive(start), to_utc_naive(end)
+    before = None
+    # Join the username instead of lazy-loading log.user (not possible on an async session)
+    query = (
+        select(ActivityLog, User.username)
+        .outerjoin(User, ActivityLog.user_id == User.id)
+        .order_by(ActivityLog.timestamp.desc(), ActivityLog.id.desc())
+        .limit(limit + 1)
+    )
+    if user_id is not None:
+        query = query.where(ActivityLog.user_id == user_id)
+    if action:
+        query = query.where(ActivityLog.action == action)
+    if start:
+        query = query.where(ActivityLog.timestamp >= start)
+    if end:
+        query = query.where(ActivityLog.timestamp < end)
+    if cursor:
+        timestamp, log_id = decode_cursor(cursor, 2)
+        before = (parse_datetime(timestamp), log_id)
+        query = query.where(tuple_(ActivityLog.timestamp, ActivityLog.id) < before)
+
+    rows = (await session.exec(query)).all()
+    logs = [
         ActivityLogRead(
             **log.dict(), 
-            username=log.user.username if log.user else "Unknown"
-        ) for log in logs
+            username=username or "Unknown"
+        ) for log, username in rows
     ]
+    if include_archive and len(logs) <= limit:
+        # Archived logs are all older than the table's, continue below the last row served
+        if logs:
+            before = (logs[-1].timestamp, logs[-1].id)
+        archived = await run_in_threadpool(
+            query_archive, limit + 1 - len(logs), before, user_id=user_id, action=action, start=start, end=end
+        )
+        logs += [ActivityLogRead(**{**record, "username": record["username"] or "Unknown"}) for record in archived]
+    return set_next_cursor(response, logs, limit, lambda log: (log.timestamp, log.id))
+
+class ActivityLogSearchResult(ActivityLogRead):
+    rank: float
+    snippet: Optional[str] = None
+
+@router.get("/search", response_model=List[ActivityLogSearchResult])
+async def search_activity_logs(
+    response: Response,
+    q: str = Query(..., min_length=1, max_length=200),
+    limit: int = Query(50, ge=1, le=500),
+    cursor: Optional[str] = None,
+    user_id: Optional[int] = None,
+    action: Optional[str] = None,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    session: AsyncSession = Depends(get_async_session),
+    current_user: User = Depends(get_current_user)
+):
+    """
+    Full-text search over action and details, best matches first.
+    q: words (all must match), "quoted phrases" and prefix* terms. Paginated like the listing (X-Next-Cursor).
+    """
+    terms = parse_query(q)
+    if not terms:
+        raise HTTPException(status_code=400, detail="Search query has no searchable words")
+    after = None
+    if cursor:
+        rank, log_id = decode_cursor(cursor, 2)
+        after = (float(rank), int(log_id))
+    statement, params = search_statement(
+        session.bind.dialect.name, terms, limit + 1, after,
+        user_id=user_id, action=action, start=to_utc_naive(start), end=to_utc_naive(end),
+    )
+    rows = (await session.execute(statement, params)).mappings().all()
+    results = [
+        ActivityLogSearchResult(**{**row, "username": row["username"] or "Unknown"})
+        for row in rows
+    ]
+    return set_next_cursor(response, results, limit, lambda r: (r.rank, r.id))
+
+@router.get("/archive")
+def read_archive_summary(current_user: User = Depends(get_current_admin_user)):
+    """Archived months with row counts and time ranges."""
+    return archive_summary()
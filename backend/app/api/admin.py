@@ -0,0 +1,55 @@
+from fastapi import APIRouter, Depends, HTTPException
+from app.api.deps import get_current_admin_user
+from app.database import writer_stats, is_sqlite, engine, read_engine
+from app.models import User
+from app.services.db_maintenance import database_stats
+from app.core.instrumentation import recent_slow_queries, recent_n_plus_one
+from app.core.scheduler import jobs
+
+router = APIRouter()
+
+@router.get("/db/writer")
+def get_writer_stats(current_user: User = Depends(get_current_admin_user)):
+    """Queue wait times for the database writer connection."""
+    return {
+        "split": read_engine is not engine,
+        "dialect": "sqlite" if is_sqlite else engine.dialect.name,
+        "writer_pool": engine.pool.status(),
+        "reader_pool": read_engine.pool.status(),
+        **writer_stats.snapshot(),
+    }
+
+@router.get("/db/stats")
+def get_database_stats(current_user: User = Depends(get_current_admin_user)):
+    """File, WAL, page and cache statistics of the database."""
+    return database_stats()
+
+@router.get("/db/slow-queries")
+def get_slow_queries(current_user: User = Depends(get_current_admin_user)):
+    """Most recent statements slower than SLOW_QUERY_MS, newest first."""
+    return recent_slow_queries()
+
+@router.get("/db/n-plus-one")
+def get_n_plus_one(current_user: User = Depends(get_current_admin_user)):
+    """Most recent requests that repeated the same statement N_PLUS_ONE_THRESHOLD times or more."""
+    return recent_n_plus_one()
+
+@router.get("/jobs")
+def get_jobs(current_user: User = Depends(get_current_admin_user)):
+    """Scheduled jobs with their next run time and last run."""
+    return jobs.job_status()
+
+@router.get("/jobs/{name}/runs")
+def get_job_runs(name: str, limit: int = 20, current_user: User = Depends(get_current_admin_user)):
+    if name not in jobs.jobs:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return jobs.recent_runs(name, min(limit, 200))
+
+@router.post("/jobs/{name}/run", status_code=202)
+def run_job_now(name: str, current_user: User = Depends(get_current_admin_user)):
+    """Starts a job in the background; its run shows up in /jobs/{name}/runs."""
+    if name not in jobs.jobs:
+        raise HTTPException(status_code=404, detail="Job not found")
+    if not jobs.trigger_job(name):
+        raise HTTPException(status_code=409, detail="Job is already running")
+    return {"job": name, "started": True}
@@ -7,9 +7,14 @@ from app.models import User, Role
 from app.api.deps import get_current_user
 from app.core.security import create_access_token, verify_password, get_password_hash, needs_rehash
 from app.core.config import settings
+from app.services.token_service import issue_refresh_token, rotate_refresh_token, revoke_refresh_token
+from pydantic import BaseModel
 
 router = APIRouter()
 
+class RefreshRequest(BaseModel):
+    refresh_token: str
+
 @router.post("/token")
 async def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends(), session: Session = Depends(get_session)):
     user = session.exec(select(User).where(User.username == form_data.username)).first()
@@ -23,16 +28,40 @@ async def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends(
     if needs_rehash(user.password_hash):
         user.password_hash = get_password_hash(form_data.password)
         session.add(user)
-        session.commit()
-        session.refresh(user)
+
+    refresh_token = issue_refresh_token(session, user)
+    session.commit()
+    session.refresh(user)
+
+    access_token_expires = timedelta(minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES)
+    access_token = create_access_token(
+        data={"sub": user.username, "role": user.role, "id": user.id}, expires_delta=access_token_expires
+    )
+    return {"access_token": access_token, "token_type": "bearer", "refresh_token": refresh_token}
+
+@router.post("/refresh")
+def refresh_access_token(request: RefreshRequest, session: Session = Depends(get_session)):
+    # No password hashing here: the refresh token is looked up by its SHA-256 and rotated
+    result = rotate_refresh_token(session, request.refresh_token)
+    if not result:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Invalid or expired refresh token",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    user, refresh_token = result
 
     access_token_expires = timedelta(minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES)
     access_token = create_access_token(
         data={"sub": user.username, "role": user.role, "id": user.id}, expires_delta=access_token_expires
     )
-    return {"access_token": access_token, "token_type": "bearer"}
+    return {"access_token": access_token, "token_type": "bearer", "refresh_token": refresh_token}
 
-    return {"access_token": access_token, "token_type": "bearer"}
+@router.post("/logout")
+def logout(request: RefreshRequest, session: Session = Depends(get_session)):
+    revoke_refresh_token(session, request.refresh_token)
+    session.commit()
+    return {"ok": True}
 
 @router.post("/login-as/{user_id}")
 async def login_as_user(
@@ -1,17 +1,30 @@
-from fastapi import APIRouter, Depends, HTTPException, status
-from typing import List
 import os
+from fastapi import APIRouter, Depends, HTTPException, Request, status
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import FileResponse
+from python_multipart.exceptions import MultipartParseError
+from python_multipart.multipart import MultipartParser, parse_options_header
+from typing import Dict, List, Optional, Tuple
 from pydantic import BaseModel
 from app.api.deps import get_current_admin_user
-from app.services.backup_service import backup_database, restore_database, verify_super_code, BACKUP_DIR
+from app.core.config import settings
+from app.core.scheduler import jobs
+from app.services.backup_service import restore_database, backup_status, request_cancel, verify_super_code, BackupUpload, RestoreBusy, UploadTooLarge
+from app.services.backup_store import load_manifest, find_entry, BACKUP_DIR
 from app.models import User
 
 router = APIRouter()
 
 class BackupFile(BaseModel):
     filename: str
+    kind: str = "scheduled"
     size: int
+    raw_size: Optional[int] = None
+    sha256: Optional[str] = None
     created_at: str
+    schema_version: Optional[int] = None
+    row_counts: Optional[Dict[str, int]] = None
+    uploaded_as: Optional[str] = None
 
 class RestoreRequest(BaseModel):
     filename: str
@@ -19,29 +32,29 @@ class RestoreRequest(BaseModel):
 
 @router.get("/", response_model=List[BackupFile])
 def list_backups(current_user: User = Depends(get_current_admin_user)):
-    """List available backup files."""
-    if not os.path.exists(BACKUP_DIR):
-        return []
-        
-    backups = []
-    for filename in sorted(os.listdir(BACKUP_DIR), reverse=True):
-        if filename.endswith(".sqlite"):
-            filepath = os.path.join(BACKUP_DIR, filename)
-            stats = os.stat(filepath)
-            backups.append(BackupFile(
-                filename=filename,
-                size=stats.st_size,
-                created_at=str(stats.st_ctime) # Client can format this
-            ))
-    return backups
-
-@router.post("/run", status_code=201)
+    """List available backup files, newest first (from the backup manifest)."""
+    return load_manifest()
+
+@router.post("/run", status_code=202)
 def run_manual_backup(current_user: User = Depends(get_current_admin_user)):
-    """Trigger a manual backup immediately."""
-    path = backup_database()
-    if path:
-        return {"message": "Backup created successfully", "path": path}
-    raise HTTPException(status_code=500, detail="Backup failed")
+    """Starts a manual backup in the background; /backups/status reports its progress and outcome."""
+    # Through the job runner so it never overlaps the nightly backup or other heavy jobs
+    if not jobs.trigger_job("backup"):
+        raise HTTPException(status_code=409, detail="A backup is already running")
+    return {"message": "Backup started", "started": True}
+
+@router.get("/status")
+def get_backup_status(current_user: User = Depends(get_current_admin_user)):
+    """Progress of the running backup, or the outcome of the last one."""
+    return {**backup_status(), "running": jobs.is_running("backup")}
+
+@router.post("/cancel", status_code=202)
+def cancel_backup(current_user: User = Depends(get_current_admin_user)):
+    """Asks the running backup to stop after its current step."""
+    if not jobs.is_running("backup"):
+        raise HTTPException(status_code=409, detail="No backup is running")
+    request_cancel()
+    return {"message": "Cancellation requested"}
 
 @router.post("/restore")
 def restore_backup(
@@ -54,9 +67,115 @@ def restore_backup(
         raise HTTPException(status_code=403, detail="Invalid Super Pass Code")
         
     try:
-        restore_database(request.filename)
-        return {"message": "Database restored successfully. Please restart the backend server to ensure consistence."}
+        result = restore_database(request.filename)
+        return {"message": "Database restored successfully", **result}
+    except RestoreBusy as e:
+        raise HTTPException(status_code=409, detail=str(e))
     except FileNotFoundError:
         raise HTTPException(status_code=404, detail="Backup file not found")
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+
+# Room for the multipart boundaries and part headers on top of the file itself
+UPLOAD_ENVELOPE_BYTES = 64 * 1024
+# The only other form field is a hex SHA-256
+MAX_FIELD_BYTES = 1024
+
+async def receive_upload(request: Request) -> Tuple[BackupUpload, Optional[str]]:
+    """
+    Parses the multipart body as it arrives and writes the `file` part straight into the backup
+    directory, so the upload is written once and an oversized one is cut off at the limit instead of
+    being spooled in full first. Returns the upload and the `sha256` field.
+    """
+    content_type, params = parse_options_header(request.headers.get("content-type", ""))
+    if content_type != b"multipart/form-data" or b"boundary" not in params:
+        raise HTTPException(status_code=400, detail="Expected a multipart/form-data upload")
+    events = []
+    parser = MultipartParser(params[b"boundary"], {
+        "on_part_begin": lambda: events.append(("begin", b"")),
+        "on_header_field": lambda data, start, end: events.append(("field", data[start:end])),
+        "on_header_value": lambda data, start, end: events.append(("value", data[start:end])),
+        "on_header_end": lambda: events.append(("header_end", b"")),
+        "on_headers_finished": lambda: events.append(("headers", b"")),
+        "on_part_data": lambda data, start, end: events.append(("data", data[start:end])),
+    })
+    upload, fields, headers, header, value, part, writing = None, {}, {}, b"", b"", None, False
+    try:
+        async for chunk in request.stream():
+            parser.write(chunk)
+            file_data = []
+            for kind, data in events:
+                if kind == "begin":
+                    headers, part, writing = {}, None, False
+                elif kind == "field":
+                    header += data
+                elif kind == "value":
+                    value += data
+                elif kind == "header_end":
+                    headers[header.lower()] = value
+                    header, value = b"", b""
+                elif kind == "headers":
+                    _, disposition = parse_options_header(headers.get(b"content-disposition", b""))
+                    part = disposition.get(b"name", b"").decode()
+                    writing = part == "file" and upload is None
+                    if writing:
+                        filename = os.path.basename(disposition.get(b"filename", b"").decode(errors="replace"))
+                        upload = await run_in_threadpool(BackupUpload, filename)
+                    else:
+                        fields[part] = b""
+                elif kind == "data" and writing:
+                    file_data.append(data)
+                elif kind == "data":
+                    fields[part] += data
+                    if len(fields[part]) > MAX_FIELD_BYTES:
+                        raise HTTPException(status_code=400, detail=f"Form field {part} is too long")
+            events.clear()
+            if file_data:
+                await run_in_threadpool(upload.write, b"".join(file_data))
+        parser.finalize()
+    except BaseException:
+        if upload is not None:
+            upload.discard()
+        raise
+    if upload is None:
+        raise HTTPException(status_code=400, detail="No file in the upload")
+    sha256 = fields.get("sha256", b"").decode(errors="replace").strip()
+    return upload, sha256 or None
+
+@router.post("/upload", status_code=201, response_model=BackupFile, openapi_extra={
+    "requestBody": {"required": True, "content": {"multipart/form-data": {"schema": {
+        "type": "object", "required": ["file"],
+        "properties": {"file": {"type": "string", "format": "binary"}, "sha256": {"type": "string"}},
+    }}}},
+})
+async def upload_backup_file(request: Request, current_user: User = Depends(get_current_admin_user)):
+    """
+    Adds a backup from another server (or an offsite copy) to the restorable set: a multipart upload
+    with a `file` and, optionally, its `sha256` to have the transfer verified. The file is rejected
+    unless it passes the integrity checks.
+    """
+    length = request.headers.get("content-length", "")
+    if length.isdigit() and int(length) > settings.BACKUP_UPLOAD_MAX_MB * 1024 * 1024 + UPLOAD_ENVELOPE_BYTES:
+        raise HTTPException(status_code=413, detail=f"Upload exceeds {settings.BACKUP_UPLOAD_MAX_MB} MB")
+    try:
+        upload, sha256 = await receive_upload(request)
+        return await run_in_threadpool(upload.finish, sha256)
+    except UploadTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except MultipartParseError as e:
+        raise HTTPException(status_code=400, detail=f"Malformed upload: {e}")
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+# Last, so /status and the other fixed paths are matched first
+@router.get("/{filename}")
+def download_backup(filename: str, current_user: User = Depends(get_current_admin_user)):
+    """Streams a backup file. Supports Range requests, so interrupted transfers can resume."""
+    # Only files in the manifest, which also rules out paths outside BACKUP_DIR
+    entry = find_entry(filename)
+    path = os.path.join(BACKUP_DIR, filename)
+    if entry is None or not os.path.exists(path):
+        raise HTTPException(status_code=404, detail="Backup file not found")
+    return FileResponse(path, media_type="application/octet-stream", filename=filename, headers={"X-Checksum-SHA256": entry["sha256"]})
@@ -0,0 +1,50 @@
+"""
+Conditional GET (ETag / If-None-Match) for slowly changing resources.
+
+The ETag is built from the change counters of the tables a response is read
+from (app/core/cache.py) plus everything else it depends on: path, query
+string and user. That costs one primary key lookup, so an unchanged resource
+is answered with 304 before the endpoint runs its query or serializes a row.
+"""
+import hashlib
+from typing import Dict, Iterable, Optional
+from fastapi import Request, Response
+from sqlalchemy import bindparam, text
+
+VERSIONS = text("SELECT name, version FROM change_counter WHERE name IN :names").bindparams(
+    bindparam("names", expanding=True)
+)
+
+def versions(session, names: Iterable[str]) -> Dict[str, int]:
+    names = list(names)
+    found = dict(session.connection().execute(VERSIONS, {"names": names}).all())
+    return {name: found.get(name, 0) for name in names}
+
+async def versions_async(session, names: Iterable[str]) -> Dict[str, int]:
+    names = list(names)
+    found = dict((await session.execute(VERSIONS, {"names": names})).all())
+    return {name: found.get(name, 0) for name in names}
+
+def make_etag(request: Request, user_id: int, *parts) -> str:
+    key = "|".join([request.url.path, request.url.query, str(user_id)] + [str(p) for p in parts])
+    return '"' + hashlib.sha1(key.encode()).hexdigest()[:20] + '"'
+
+def _matches(header: Optional[str], etag: str) -> bool:
+    if not header:
+        return False
+    for candidate in header.split(","):
+        candidate = candidate.strip()
+        # Weak comparison, as If-None-Match requires
+        if candidate == "*" or candidate.removeprefix("W/") == etag:
+            return True
+    return False
+
+def not_modified(request: Request, response: Response, etag: str) -> Optional[Response]:
+    """Sets the ETag on response; returns a 304 to send instead if the client already has this version."""
+    response.headers["ETag"] = etag
+    # Cached per user, and always revalidated
+    response.headers["Cache-Control"] = "private, no-cache"
+    response.headers["Vary"] = "Authorization"
+    if _matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=dict(response.headers))
+    return None
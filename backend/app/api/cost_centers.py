@@ -1,9 +1,10 @@
-from fastapi import APIRouter, HTTPException, Depends
+from fastapi import APIRouter, HTTPException, Depends, Request, Response
 from pydantic import BaseModel
 from typing import List
 import json
 import os
 from app.api.deps import get_current_user
+from app.api.conditional import make_etag, not_modified
 from app.models import User, Role
 
 router = APIRouter()
@@ -26,8 +27,13 @@ def save_cost_centers(data):
         json.dump(data, f, indent=4)
 
 @router.get("/", response_model=List[str])
-def get_cost_centers(current_user: User = Depends(get_current_user)):
+def get_cost_centers(request: Request, response: Response, current_user: User = Depends(get_current_user)):
     # Any authenticated user can read the list
+    # Not a table: the file's mtime and size stand in for a change counter
+    stat = os.stat(DATA_FILE) if os.path.exists(DATA_FILE) else None
+    etag = make_etag(request, current_user.id, f"{stat.st_mtime_ns}-{stat.st_size}" if stat else "empty")
+    if (cached := not_modified(request, response, etag)) is not None:
+        return cached
     return load_cost_centers()
 
 @router.post("/", response_model=List[str])
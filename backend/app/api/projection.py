@@ -0,0 +1,37 @@
+"""
+`fields=` projections and substring search for list endpoints.
+
+Only the requested columns are selected and the rows are encoded straight to
+JSON, without building a model object per row, for the dropdowns and pickers
+that need two or three columns of every row.
+"""
+from typing import List, Optional
+from fastapi import HTTPException, Response
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+
+def parse_fields(fields: Optional[str], model, allowed=None, required=("id",)) -> Optional[List[str]]:
+    """Column names from a comma-separated `fields`, required ones first; None when no projection was asked for."""
+    if not fields:
+        return None
+    allowed = set(allowed) if allowed is not None else set(model.__table__.columns.keys())
+    names = [name.strip() for name in fields.split(",") if name.strip()]
+    unknown = sorted(set(names) - allowed)
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown fields: {', '.join(unknown)}")
+    return list(required) + [name for name in dict.fromkeys(names) if name not in required]
+
+def columns(model, names: List[str]) -> list:
+    return [getattr(model, name) for name in names]
+
+def rows_response(response: Response, names: List[str], rows) -> JSONResponse:
+    """JSON list of {field: value} objects; keeps the headers already set on the endpoint's response."""
+    return JSONResponse(
+        jsonable_encoder([dict(zip(names, row)) for row in rows]),
+        headers=dict(response.headers),
+    )
+
+def contains(column, text: str):
+    """Case-insensitive substring match, with LIKE wildcards in text matched literally."""
+    escaped = text.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+    return column.ilike(f"%{escaped}%", escape="\\")
@@ -1,52 +1,72 @@
-from typing import List
-from fastapi import APIRouter, Depends, HTTPException
+from typing import List, Optional
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
+from pydantic import BaseModel, Field
+from sqlalchemy import or_
 from sqlmodel import Session, select, col
-from app.database import get_session
-from app.models import Project, User, ActivityLog, Role
+from sqlmodel.ext.asyncio.session import AsyncSession
+from app.database import get_session, get_async_session
+from app.models import Project, ProjectStatus, User, UserProjectLink, ActivityLog, Role
 from app.api.deps import get_current_user, get_current_admin_user
+from app.api.conditional import make_etag, not_modified, versions_async
+from app.api.pagination import decode_cursor, set_next_cursor
+from app.api.projection import columns, contains, parse_fields, rows_response
+from app.services.assignment_service import apply_links, current_links
+from app.services import hierarchy
+from app.core.cache import track_changes
 
 router = APIRouter()
 
+# Change counter behind the ETag of the project list
+track_changes(Project)
+
 @router.get("/", response_model=List[Project])
-def read_projects(
-    skip: int = 0, 
-    limit: int = 100, 
-    session: Session = Depends(get_session),
+async def read_projects(
+    request: Request,
+    response: Response,
+    q: Optional[str] = Query(None, max_length=100),
+    status: Optional[ProjectStatus] = None,
+    assigned_to_me: bool = False,
+    fields: Optional[str] = None,
+    limit: int = Query(100, ge=1, le=1000),
+    cursor: Optional[str] = None,
+    session: AsyncSession = Depends(get_async_session),
     current_user: User = Depends(get_current_user)
 ):
-    query = select(Project).where(Project.is_deleted == False)
-    
-    # Allow all users to see all projects (read-only for non-admins handled in frontend/backend write ops)
-    # if current_user.role != Role.ADMIN:
-    #     # Filter: Default projects OR Assigned projects
-    #     # We need to join with UserProjectLink or check ID in list
-    #     # Easiest way with SQLModel/SQLAlchemy:
-    #     # WHERE is_default = True OR id IN (select project_id from userprojectlink where user_id = current_user.id)
-        
-    #     # Since SQLModel relationships load objects, we can also use python filtering if list is small, 
-    #     # but better to do in DB.
-    #     # Let's use the relationship.
-        
-    #     # Actually, simpler query:
-    #     # Select projects where is_default is True
-    #     # UNION
-    #     # Select projects joined with current_user
-        
-    #     # Let's try to construct a single query if possible, or just fetch both and merge in python (easier for now given complexity)
-    #     # But for pagination, DB query is better.
-        
-    #     # Using `user.projects` relationship from the model
-    #     # But we need to combine with default projects.
-        
-    #     # Let's do it via IDs
-    #     assigned_project_ids = [p.id for p in current_user.projects]
-        
-    #     query = query.where(
-    #         (Project.is_default == True) | 
-    #         (col(Project.id).in_(assigned_project_ids))
-    #     )
-        
-    return session.exec(query.offset(skip).limit(limit)).all()
+    """
+    Projects by id. q matches part of the name, full name, Chinese name or project ID (case-insensitive).
+    assigned_to_me: only projects the current user can log time on, assigned or default.
+    fields: comma-separated columns to return instead of whole projects, e.g. fields=name,is_default.
+    Pass the X-Next-Cursor response header back as `cursor` for the next page.
+    """
+    names = parse_fields(fields, Project)
+    counters = [Project.__tablename__, UserProjectLink.__tablename__] if assigned_to_me else [Project.__tablename__]
+    etag = make_etag(request, current_user.id, await versions_async(session, counters))
+    if (cached := not_modified(request, response, etag)) is not None:
+        return cached
+
+    query = select(*columns(Project, names)) if names else select(Project)
+    query = query.where(Project.is_deleted == False).order_by(Project.id).limit(limit + 1)
+    if q and q.strip():
+        query = query.where(or_(*(
+            contains(column, q.strip())
+            for column in (Project.name, Project.full_name, Project.chinese_name, Project.custom_id)
+        )))
+    if status:
+        query = query.where(Project.status == status)
+    if assigned_to_me:
+        assigned = select(UserProjectLink.project_id).where(UserProjectLink.user_id == current_user.id)
+        query = query.where((Project.is_default == True) | col(Project.id).in_(assigned))
+    if cursor:
+        (after,) = decode_cursor(cursor, 1)
+        if not isinstance(after, int):
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+        query = query.where(Project.id > after)
+
+    if names:
+        rows = set_next_cursor(response, (await session.execute(query)).all(), limit, lambda row: (row[0],))
+        return rows_response(response, names, rows)
+    projects = (await session.exec(query)).all()
+    return set_next_cursor(response, projects, limit, lambda project: (project.id,))
 
 @router.post("/", response_model=Project)
 def create_project(
@@ -135,3 +155,45 @@ def update_project(
     session.commit()
     
     return db_project
+
+class MemberChanges(BaseModel):
+    add: List[int] = Field(default=[], max_length=1000)
+    remove: List[int] = Field(default=[], max_length=1000)
+
+@router.post("/{project_id}/members")
+def update_project_members(
+    project_id: int,
+    changes: MemberChanges,
+    session: Session = Depends(get_session),
+    current_user: User = Depends(get_current_user)
+):
+    """Assigns and unassigns many users in one transaction. Team leaders may only change their own team members."""
+    project = session.get(Project, project_id)
+    if not project or project.is_deleted:
+        raise HTTPException(status_code=404, detail="Project not found")
+    if set(changes.add) & set(changes.remove):
+        raise HTTPException(status_code=400, detail="A user cannot be both added and removed")
+
+    user_ids = set(changes.add) | set(changes.remove)
+    users = {u.id: u for u in session.exec(select(User).where(col(User.id).in_(user_ids)))} if user_ids else {}
+    missing = sorted(user_ids - set(users))
+    if missing:
+        raise HTTPException(status_code=404, detail=f"Users not found: {', '.join(map(str, missing))}")
+    if current_user.role != Role.ADMIN:
+        allowed = current_user.role == Role.TEAM_LEADER and not hierarchy.outside_subtree(session, current_user.id, users)
+        if not allowed:
+            raise HTTPException(status_code=403, detail="Not authorized to assign projects")
+
+    current = {user_id for user_id, _ in current_links(session, user_ids=user_ids, project_ids=[project_id])}
+    added = sorted(set(changes.add) - current)
+    removed = sorted(set(changes.remove) & current)
+    apply_links(session, {(uid, project_id) for uid in added}, {(uid, project_id) for uid in removed})
+    if added or removed:
+        parts = []
+        if added:
+            parts.append(f"added {', '.join(users[uid].username for uid in added)}")
+        if removed:
+            parts.append(f"removed {', '.join(users[uid].username for uid in removed)}")
+        session.add(ActivityLog(user_id=current_user.id, action="UPDATE_PROJECT_MEMBERS", details=f"Members of {project.name}: {'; '.join(parts)}"))
+    session.commit()
+    return {"ok": True, "added": added, "removed": removed}
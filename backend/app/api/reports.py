@@ -2,7 +2,7 @@ from typing import List, Optional
 from datetime import date, timedelta
 from fastapi import APIRouter, Depends
 from sqlmodel import Session, select, func
-from app.database import get_session
+from app.database import get_read_session
 from app.models import Timesheet, User, Project, Role
 from app.api.deps import get_current_admin_user, get_current_user
 
@@ -12,7 +12,7 @@ router = APIRouter()
 def get_weekly_report(
     start_date: date,
     end_date: date,
-    session: Session = Depends(get_session),
+    session: Session = Depends(get_read_session),
     current_user: User = Depends(get_current_user)
 ):
     # Get all users (exclude admins since they cannot log work)
@@ -85,7 +85,7 @@ def get_weekly_report(
 
 @router.get("/stats")
 def get_dashboard_stats(
-    session: Session = Depends(get_session),
+    session: Session = Depends(get_read_session),
     current_user: User = Depends(get_current_admin_user)
 ):
     total_users = session.exec(select(func.count(User.id)).where(User.is_deleted == False)).one()
@@ -101,7 +101,7 @@ def get_dashboard_stats(
 
 @router.get("/user_stats")
 def get_user_stats(
-    session: Session = Depends(get_session),
+    session: Session = Depends(get_read_session),
     current_user: User = Depends(get_current_user)
 ):
     # Get all VERIFIED timesheets for the current user
@@ -1,6 +1,6 @@
 from fastapi import APIRouter, Depends, HTTPException
 from sqlmodel import Session, select
-from app.database import get_session
+from app.database import get_session, get_read_session
 from app.models import SMTPSettings, User, Role
 from app.api.deps import get_current_user
 from pydantic import BaseModel
@@ -20,7 +20,7 @@ class EmailTestRequest(BaseModel):
 
 @router.get("/email", response_model=SMTPSettings)
 def get_email_settings(
-    session: Session = Depends(get_session),
+    session: Session = Depends(get_read_session),
     current_user: User = Depends(get_current_user)
 ):
     if current_user.role != Role.ADMIN:
@@ -101,7 +101,7 @@ def send_test_email(
 
 @router.post("/email/test-no-finish-timesheet")
 def check_timesheet_compliance(
-    session: Session = Depends(get_session),
+    session: Session = Depends(get_read_session),
     current_user: User = Depends(get_current_user)
 ):
     if current_user.role != Role.ADMIN:
@@ -114,7 +114,7 @@ def check_timesheet_compliance(
 
 @router.post("/email/test-no-approval-notify")
 def check_approval_compliance(
-    session: Session = Depends(get_session),
+    session: Session = Depends(get_read_session),
     current_user: User = Depends(get_current_user)
 ):
     if current_user.role != Role.ADMIN:
@@ -2,18 +2,21 @@ from typing import List, Optional
 from datetime import date, timedelta, datetime
 from fastapi import APIRouter, Depends, HTTPException
 from sqlmodel import Session, select, func
-from app.database import get_session
-from app.models import Timesheet, User, ActivityLog, Role, Project, WorkDay, WorkDayType
+from sqlmodel.ext.asyncio.session import AsyncSession
+from app.database import get_session, get_async_session
+from app.models import Timesheet, User, ActivityLog, Role, Project, WorkDayType
 from app.api.deps import get_current_user
+from app.services.calendar_service import get_calendar, day_type, weekly_limit
+from app.services import hierarchy
 
 router = APIRouter()
 
 @router.get("/", response_model=List[Timesheet])
-def read_timesheets(
+async def read_timesheets(
     start_date: Optional[date] = None,
     end_date: Optional[date] = None,
     user_id: Optional[int] = None,
-    session: Session = Depends(get_session),
+    session: AsyncSession = Depends(get_async_session),
     current_user: User = Depends(get_current_user)
 ):
     query = select(Timesheet)
@@ -35,7 +38,7 @@ def read_timesheets(
     if end_date:
         query = query.where(Timesheet.date <= end_date)
         
-    return session.exec(query).all()
+    return (await session.exec(query)).all()
 
 def upsert_timesheet_logic(session: Session, timesheet: Timesheet, current_user: User):
     # Validate user permissions
@@ -65,42 +68,12 @@ def upsert_timesheet_logic(session: Session, timesheet: Timesheet, current_user:
     end_of_week = start_of_week + timedelta(days=6)
     
     # Check for OFF day
-    current_workday = session.get(WorkDay, timesheet.date)
-    if current_workday and current_workday.day_type == WorkDayType.OFF:
+    calendar = get_calendar(session)
+    if calendar.get(timesheet.date) == WorkDayType.OFF:
         raise HTTPException(status_code=400, detail="Cannot log work on an off day")
     
     # Calculate Dynamic Weekly Limit
-    limit = 0.0
-    
-    week_exceptions = session.exec(
-        select(WorkDay)
-        .where(WorkDay.date >= start_of_week)
-        .where(WorkDay.date <= end_of_week)
-    ).all()
-
-    # Create a map of exceptions for easy lookup
-    exceptions_map = {ex.date: ex.day_type for ex in week_exceptions}
-    
-    # Iterate through each day of the week (0=Mon, 6=Sun)
-    current_day_date = start_of_week
-    for i in range(7):
-        day_type = exceptions_map.get(current_day_date)
-        
-        # Default Logic if no exception
-        if not day_type:
-            if i < 5: # Mon-Fri
-                day_type = WorkDayType.WORK
-            else: # Sat-Sun
-                day_type = WorkDayType.OFF
-        
-        # Add hours based on type
-        if day_type == WorkDayType.WORK:
-            limit += 8.0
-        elif day_type == WorkDayType.HALF_OFF:
-            limit += 4.0
-        # OFF adds 0
-        
-        current_day_date += timedelta(days=1)
+    limit = weekly_limit(calendar, start_of_week)
             
     # Calculate current weekly hours
     weekly_hours = session.exec(
@@ -227,31 +200,14 @@ def batch_create_timesheet(
         
     # Process each week
     final_results = []
+    calendar = get_calendar(session)
     
     for start_of_week, batch_updates in updates_by_week.items():
         end_of_week = start_of_week + timedelta(days=6)
         
-        # 1. Fetch WorkDay Exceptions for this week
-        week_exceptions = session.exec(
-            select(WorkDay)
-            .where(WorkDay.date >= start_of_week)
-            .where(WorkDay.date <= end_of_week)
-        ).all()
-        exceptions_map = {ex.date: ex.day_type for ex in week_exceptions}
-        
+        # 1. WorkDay exceptions come from the cached calendar
         # 2. Calculate Weekly Limit for this week
-        limit = 0.0
-        current_day = start_of_week
-        for i in range(7):
-            d_type = exceptions_map.get(current_day)
-            if not d_type:
-                d_type = WorkDayType.WORK if i < 5 else WorkDayType.OFF
-            
-            if d_type == WorkDayType.WORK:
-                limit += 8.0
-            elif d_type == WorkDayType.HALF_OFF:
-                limit += 4.0
-            current_day += timedelta(days=1)
+        limit = weekly_limit(calendar, start_of_week)
             
         # 3. Fetch ALL existing timesheets for this user/week
         existing_logs = session.exec(
@@ -286,11 +242,7 @@ def batch_create_timesheet(
         # Apply updates
         for update in batch_updates:
             # Validate OFF day
-            day_type = exceptions_map.get(update.date)
-            if not day_type:
-                day_type = WorkDayType.WORK if update.date.weekday() < 5 else WorkDayType.OFF
-            
-            if day_type == WorkDayType.OFF and update.hours > 0:
+            if day_type(calendar, update.date) == WorkDayType.OFF and update.hours > 0:
                  raise HTTPException(status_code=400, detail=f"Cannot log work on an off day ({update.date})")
             
             key = (update.date, update.project_id)
@@ -373,7 +325,7 @@ def verify_day(
     if not target_user:
         raise HTTPException(status_code=404, detail="User not found")
         
-    if target_user.team_leader_id != current_user.id:
+    if not hierarchy.is_in_subtree(session, current_user.id, target_user.id):
         raise HTTPException(status_code=403, detail="User is not assigned to you")
         
     # Calculate total hours for that day
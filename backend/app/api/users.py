@@ -1,10 +1,20 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from typing import Optional
+from fastapi import APIRouter, Depends, File, Form, HTTPException, Query, Request, Response, UploadFile, status
 from sqlmodel import Session, select
-from app.database import get_session
+from sqlmodel.ext.asyncio.session import AsyncSession
+from app.database import get_session, get_read_session, get_async_session
 from app.models import User, Role, Project, UserProjectLink, ActivityLog
 from app.api.deps import get_current_admin_user, get_current_user
+from app.api.conditional import make_etag, not_modified, versions
+from app.api.pagination import decode_cursor, set_next_cursor
+from app.api.projection import columns, contains, parse_fields, rows_response
+from app.core.cache import track_changes
 from app.core.security import get_password_hash
+from app.services.token_service import revoke_user_tokens
 from app.services.email_service import check_timesheet_compliance
+from app.services.assignment_service import apply_links, current_links
+from app.services import hierarchy
+from app.services.user_import import import_users
 from datetime import date, timedelta
 from sqlalchemy import func
 from app.models import Timesheet
@@ -13,22 +23,68 @@ from datetime import datetime
 
 router = APIRouter()
 
+# Change counter behind the ETag of a user's project list
+track_changes(UserProjectLink)
+
 class PasswordChange(BaseModel):
     current_password: str
     new_password: str = Field(min_length=6, max_length=16)
 
 @router.get("/", response_model=list[User])
 def read_users(
-    session: Session = Depends(get_session),
+    session: Session = Depends(get_read_session),
     current_user: User = Depends(get_current_user),
 ):
     query = select(User).where(User.is_deleted == False)
     if current_user.role == Role.TEAM_LEADER:
-        query = query.where(User.team_leader_id == current_user.id)
+        # Everyone below them, including the teams of team leaders reporting to them
+        query = query.where(User.id.in_(hierarchy.subtree_query(current_user.id)))
     
     users = session.exec(query).all()
     return users
 
+# Every column but the password hash can be projected
+DIRECTORY_FIELDS = [c for c in User.__table__.columns.keys() if c != "password_hash"]
+DEFAULT_DIRECTORY_FIELDS = "username,full_name,role,cost_center,team_leader_id"
+
+@router.get("/directory")
+async def read_user_directory(
+    response: Response,
+    fields: str = DEFAULT_DIRECTORY_FIELDS,
+    q: Optional[str] = Query(None, max_length=100),
+    role: Optional[Role] = None,
+    limit: int = Query(100, ge=1, le=1000),
+    cursor: Optional[str] = None,
+    session: AsyncSession = Depends(get_async_session),
+    current_user: User = Depends(get_current_user),
+):
+    """
+    The users visible to the caller (same scope as /users/) by username, only with the requested fields
+    (id is always included). q matches part of the username or full name. Paginated by the X-Next-Cursor header.
+    """
+    names = parse_fields(fields, User, allowed=DIRECTORY_FIELDS, required=("id", "username"))
+    query = (
+        select(*columns(User, names))
+        .where(User.is_deleted == False)
+        .order_by(User.username)
+        .limit(limit + 1)
+    )
+    if current_user.role == Role.TEAM_LEADER:
+        query = query.where(User.id.in_(hierarchy.subtree_query(current_user.id)))
+    if q and q.strip():
+        query = query.where(contains(User.username, q.strip()) | contains(User.full_name, q.strip()))
+    if role:
+        query = query.where(User.role == role)
+    if cursor:
+        (after,) = decode_cursor(cursor, 1)
+        if not isinstance(after, str):
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+        query = query.where(User.username > after)
+
+    # Plain row tuples, no User objects
+    rows = set_next_cursor(response, (await session.execute(query)).all(), limit, lambda row: (row[1],))
+    return rows_response(response, names, rows)
+
 @router.post("/", response_model=User)
 def create_user(
     user: User,
@@ -57,6 +113,9 @@ def create_user(
     
     user.password_hash = get_password_hash(user.password_hash)
     session.add(user)
+    session.flush()
+    if user.team_leader_id is not None:
+        hierarchy.set_manager(session, user.id, user.team_leader_id)
     session.commit()
     session.refresh(user)
     
@@ -67,6 +126,27 @@ def create_user(
     
     return user
 
+@router.post("/import")
+def import_users_file(
+    file: UploadFile = File(...),
+    dry_run: bool = Form(False),
+    read_session: Session = Depends(get_read_session),
+    session: Session = Depends(get_session),
+    current_user: User = Depends(get_current_user),
+):
+    """
+    Creates users from a CSV or XLSX file whose first row names the columns: username, password, and
+    optionally full_name, email, role, cost_center, team_leader (a username), start_date, end_date, remark.
+    Valid rows are created in one transaction, invalid ones are skipped; the report lists every row.
+    With dry_run nothing is created.
+    """
+    if current_user.role != Role.ADMIN and current_user.role != Role.TEAM_LEADER:
+        raise HTTPException(status_code=403, detail="Not authorized to create users")
+    try:
+        return import_users(read_session, session, file.file, file.filename or "", current_user, dry_run=dry_run)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
 @router.delete("/{user_id}")
 def delete_user(
     user_id: int,
@@ -81,6 +161,7 @@ def delete_user(
     
     user.is_deleted = True
     session.add(user)
+    revoke_user_tokens(session, user.id)
     session.commit()
     
     # Log activity
@@ -114,7 +195,7 @@ def update_user(
              raise HTTPException(status_code=403, detail="Team Leaders can only edit Employees")
         
         # Check ownership
-        if db_user.team_leader_id != current_user.id:
+        if not hierarchy.is_in_subtree(session, current_user.id, db_user.id):
              raise HTTPException(status_code=403, detail="Can only edit your own team members")
 
         # Check if trying to change role
@@ -123,9 +204,11 @@ def update_user(
              raise HTTPException(status_code=403, detail="Team Leaders cannot change user roles")
              
         # Prevent changing team_leader_id (transferring out)
-        if 'team_leader_id' in user_data_check and user_data_check['team_leader_id'] != current_user.id:
-             # Allow setting to None? Or restrict strictly?
-             # For now, restrict strictly to self.
+        new_leader_id = user_data_check.get('team_leader_id', db_user.team_leader_id)
+        if new_leader_id != current_user.id and not (
+            new_leader_id is not None and hierarchy.is_in_subtree(session, current_user.id, new_leader_id)
+        ):
+             # Moves within their own subtree only
              raise HTTPException(status_code=403, detail="Cannot transfer users out of team")
         
     user_data = user_update.dict(exclude_unset=True, exclude={'id', 'password_hash'})
@@ -137,6 +220,11 @@ def update_user(
              tl = session.get(User, user_data['team_leader_id'])
              if not tl or tl.role != Role.TEAM_LEADER:
                  raise HTTPException(status_code=400, detail="Invalid Team Leader")
+        if user_data['team_leader_id'] != db_user.team_leader_id:
+            try:
+                hierarchy.set_manager(session, db_user.id, user_data['team_leader_id'])
+            except ValueError as e:
+                raise HTTPException(status_code=400, detail=str(e))
     
     # Handle date conversion for updates
     for date_field in ['start_date', 'end_date']:
@@ -168,12 +256,14 @@ def change_password(
     
     current_user.password_hash = get_password_hash(password_data.new_password)
     session.add(current_user)
+    # Sessions on other devices must log in again with the new password
+    revoke_user_tokens(session, current_user.id)
     session.commit()
     return {"ok": True}
 
 @router.get("/me/compliance")
-def get_my_compliance(
-    session: Session = Depends(get_session),
+async def get_my_compliance(
+    session: AsyncSession = Depends(get_async_session),
     current_user: User = Depends(get_current_user)
 ):
     # Calculate date range (last 2 full weeks)
@@ -182,6 +272,16 @@ def get_my_compliance(
     start_date = start_of_current_week - timedelta(days=14)
     end_date = start_of_current_week - timedelta(days=3) # Friday of last week
     
+    # Daily totals for the whole range in one query
+    daily_rows = (await session.exec(
+        select(Timesheet.date, func.sum(Timesheet.hours))
+        .where(Timesheet.user_id == current_user.id)
+        .where(Timesheet.date >= start_date)
+        .where(Timesheet.date <= end_date)
+        .group_by(Timesheet.date)
+    )).all()
+    daily_hours = {day: hours for day, hours in daily_rows}
+    
     first_incomplete_date = None
     is_compliant = True
     
@@ -189,14 +289,7 @@ def get_my_compliance(
     while current_check_date <= end_date:
         # Check only weekdays (Mon-Fri)
         if current_check_date.weekday() < 5:
-            total_hours = session.exec(
-                select(func.sum(Timesheet.hours))
-                .where(Timesheet.user_id == current_user.id)
-                .where(Timesheet.date == current_check_date)
-            ).one()
-            
-            if total_hours is None:
-                total_hours = 0
+            total_hours = daily_hours.get(current_check_date) or 0
             
             if total_hours < 8:
                 is_compliant = False
@@ -211,8 +304,8 @@ def get_my_compliance(
     }
 
 @router.get("/me/pending-approvals")
-def get_pending_approvals(
-    session: Session = Depends(get_session),
+async def get_pending_approvals(
+    session: AsyncSession = Depends(get_async_session),
     current_user: User = Depends(get_current_user)
 ):
     # Only for team leaders
@@ -220,16 +313,59 @@ def get_pending_approvals(
         return {"has_pending": False}
     
     # Check if any employee has unapproved timesheets
-    has_pending = session.exec(
-        select(Timesheet)
+    has_pending = (await session.exec(
+        select(Timesheet.id)
         .join(User)
-        .where(User.team_leader_id == current_user.id)
+        .where(User.id.in_(hierarchy.subtree_query(current_user.id)))
         .where(Timesheet.hours > 0)
         .where(Timesheet.verify == False)
-    ).first()
+        .limit(1)
+    )).first()
     
     return {"has_pending": has_pending is not None}
 
+class ProjectAssignments(BaseModel):
+    project_ids: list[int] = Field(max_length=1000)
+
+@router.put("/{user_id}/projects")
+def set_user_projects(
+    user_id: int,
+    payload: ProjectAssignments,
+    session: Session = Depends(get_session),
+    current_user: User = Depends(get_current_user),
+):
+    """Replaces the user's assigned projects with project_ids in one transaction. Default projects stay as they are."""
+    user = session.get(User, user_id)
+    if not user:
+        raise HTTPException(status_code=404, detail="User not found")
+
+    is_admin = current_user.role == Role.ADMIN
+    is_team_leader = current_user.role == Role.TEAM_LEADER and hierarchy.is_in_subtree(session, current_user.id, user.id)
+    if not (is_admin or is_team_leader):
+        raise HTTPException(status_code=403, detail="Not authorized to assign projects")
+
+    wanted = set(payload.project_ids)
+    current = {project_id for _, project_id in current_links(session, user_ids=[user_id])}
+    involved = wanted | current
+    projects = {p.id: p for p in session.exec(select(Project).where(Project.id.in_(involved)))} if involved else {}
+    # Deleted projects can stay assigned but not be newly assigned
+    missing = sorted(pid for pid in wanted - current if pid not in projects or projects[pid].is_deleted)
+    if missing:
+        raise HTTPException(status_code=404, detail=f"Projects not found: {', '.join(map(str, missing))}")
+
+    added = sorted(wanted - current)
+    removed = sorted(pid for pid in current - wanted if not projects[pid].is_default)
+    apply_links(session, {(user_id, pid) for pid in added}, {(user_id, pid) for pid in removed})
+    if added or removed:
+        parts = []
+        if added:
+            parts.append(f"assigned {', '.join(projects[pid].name for pid in added)}")
+        if removed:
+            parts.append(f"unassigned {', '.join(projects[pid].name for pid in removed)}")
+        session.add(ActivityLog(user_id=current_user.id, action="SET_USER_PROJECTS", details=f"Projects of {user.username}: {'; '.join(parts)}"))
+    session.commit()
+    return {"ok": True, "added": added, "removed": removed}
+
 @router.post("/{user_id}/projects/{project_id}")
 def assign_project(
     user_id: int,
@@ -244,7 +380,7 @@ def assign_project(
         
     # Permission check
     is_admin = current_user.role == Role.ADMIN
-    is_team_leader = current_user.role == Role.TEAM_LEADER and user.team_leader_id == current_user.id
+    is_team_leader = current_user.role == Role.TEAM_LEADER and hierarchy.is_in_subtree(session, current_user.id, user.id)
     
     if not (is_admin or is_team_leader):
         raise HTTPException(status_code=403, detail="Not authorized to assign projects")
@@ -282,7 +418,7 @@ def unassign_project(
          raise HTTPException(status_code=404, detail="User not found")
 
     is_admin = current_user.role == Role.ADMIN
-    is_team_leader = current_user.role == Role.TEAM_LEADER and user.team_leader_id == current_user.id
+    is_team_leader = current_user.role == Role.TEAM_LEADER and hierarchy.is_in_subtree(session, current_user.id, user.id)
     
     if not (is_admin or is_team_leader):
         raise HTTPException(status_code=403, detail="Not authorized to unassign projects")
@@ -313,7 +449,9 @@ def unassign_project(
 @router.get("/{user_id}/projects", response_model=list[Project])
 def get_user_projects(
     user_id: int,
-    session: Session = Depends(get_session),
+    request: Request,
+    response: Response,
+    session: Session = Depends(get_read_session),
     current_user: User = Depends(get_current_user),
 ):
     user = session.get(User, user_id)
@@ -323,11 +461,14 @@ def get_user_projects(
     # Permission check
     is_self = current_user.id == user_id
     is_admin = current_user.role == Role.ADMIN
-    is_team_leader = current_user.role == Role.TEAM_LEADER and user.team_leader_id == current_user.id
+    is_team_leader = current_user.role == Role.TEAM_LEADER and hierarchy.is_in_subtree(session, current_user.id, user.id)
     
     if not (is_self or is_admin or is_team_leader):
         raise HTTPException(status_code=403, detail="Not authorized to view these projects")
-        
+
+    etag = make_etag(request, current_user.id, versions(session, [UserProjectLink.__tablename__, Project.__tablename__]))
+    if (cached := not_modified(request, response, etag)) is not None:
+        return cached
     return user.projects
 
 class ManagerUpdate(BaseModel):
@@ -369,23 +510,24 @@ def update_user_manager(
     # 3. Check Permissions
     is_admin = current_user.role == Role.ADMIN
     is_self = current_user.id == user_id
-    # Is the current user the EXISTING manager of the target user?
+    # Is the current user a manager of the target user (directly or further up)?
     is_current_manager = (
         current_user.role == Role.TEAM_LEADER 
-        and db_user.team_leader_id == current_user.id
+        and hierarchy.is_in_subtree(session, current_user.id, db_user.id)
     )
 
     if not (is_admin or (is_self and current_user.role == Role.TEAM_LEADER) or is_current_manager):
         raise HTTPException(status_code=403, detail="Not authorized to assign manager for this user")
     
-    # 4. Prevent circular dependency (Basic check: A cannot report to A, A cannot report to someone who reports to A)
-    # Simple check: User cannot be their own manager
+    # 4. Prevent circular dependency: nobody can report to themselves or to anyone below them
     if db_user.id == new_manager.id:
         raise HTTPException(status_code=400, detail="Cannot be your own manager")
-        
-    # Deeper circular check could be implemented here (A->B->A), skipping for now as per plan/req unless complexity needed.
+    if hierarchy.is_in_subtree(session, db_user.id, new_manager.id):
+        raise HTTPException(status_code=400, detail=f"{new_manager.username} reports to {db_user.username}")
 
     old_manager_id = db_user.team_leader_id
+    if old_manager_id != new_manager.id:
+        hierarchy.set_manager(session, db_user.id, new_manager.id)
     db_user.team_leader_id = new_manager.id
     
     session.add(db_user)
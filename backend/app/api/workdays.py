@@ -1,26 +1,35 @@
 from typing import List, Optional
 from datetime import date
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, File, Form, HTTPException, Request, Response, UploadFile
+from pydantic import BaseModel, Field
 from sqlmodel import Session, select
-from app.database import get_session
-from app.models import WorkDay, WorkDayType, Role, User
+from sqlmodel.ext.asyncio.session import AsyncSession
+from app.database import get_session, get_async_session
+from app.models import WorkDay, WorkDayType, Role, User, ActivityLog
 from app.api.deps import get_current_user
+from app.api.conditional import make_etag, not_modified, versions_async
+from app.services.calendar_service import import_workdays, parse_ics
 
 router = APIRouter()
 
 @router.get("/", response_model=List[WorkDay])
-def read_workdays(
+async def read_workdays(
+    request: Request,
+    response: Response,
     start_date: Optional[date] = None,
     end_date: Optional[date] = None,
-    session: Session = Depends(get_session),
+    session: AsyncSession = Depends(get_async_session),
     current_user: User = Depends(get_current_user)
 ):
+    etag = make_etag(request, current_user.id, await versions_async(session, [WorkDay.__tablename__]))
+    if (cached := not_modified(request, response, etag)) is not None:
+        return cached
     query = select(WorkDay)
     if start_date:
         query = query.where(WorkDay.date >= start_date)
     if end_date:
         query = query.where(WorkDay.date <= end_date)
-    return session.exec(query).all()
+    return (await session.exec(query)).all()
 
 @router.post("/", response_model=WorkDay)
 def update_workday(
@@ -74,3 +83,60 @@ def delete_workday(
 
     # UPSERT Logic for Exceptions (OFF, HALF_OFF)
 
+# A few years of calendar per request
+MAX_BULK_DAYS = 3660
+
+class WorkDayIn(BaseModel):
+    date: date
+    day_type: WorkDayType
+    remark: Optional[str] = None
+
+class WorkDayBulk(BaseModel):
+    days: List[WorkDayIn] = Field(max_length=MAX_BULK_DAYS)
+    # Delete exceptions between the first and last date that are not in `days` (load a whole year)
+    replace: bool = False
+
+def apply_import(session: Session, current_user: User, rows: List[dict], replace: bool, source: str) -> dict:
+    if current_user.role != Role.ADMIN:
+        raise HTTPException(status_code=403, detail="Only Admins can manage work days")
+    if len(rows) > MAX_BULK_DAYS:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_BULK_DAYS} days per import")
+    diff = import_workdays(session, rows, replace=replace)
+    if diff["added"] or diff["changed"] or diff["removed"]:
+        session.add(ActivityLog(
+            user_id=current_user.id,
+            action="IMPORT_WORKDAYS",
+            details=f"Imported {source}: {len(diff['added'])} added, {len(diff['changed'])} changed, {len(diff['removed'])} removed",
+        ))
+    session.commit()
+    return diff
+
+@router.post("/bulk")
+def bulk_update_workdays(
+    payload: WorkDayBulk,
+    session: Session = Depends(get_session),
+    current_user: User = Depends(get_current_user)
+):
+    """Upserts many days in one transaction and returns what changed."""
+    rows = [day.model_dump() for day in payload.days]
+    return apply_import(session, current_user, rows, payload.replace, f"{len(rows)} days")
+
+@router.post("/bulk/ics")
+def import_workdays_ics(
+    file: UploadFile = File(...),
+    day_type: WorkDayType = Form(WorkDayType.OFF),
+    replace: bool = Form(False),
+    session: Session = Depends(get_session),
+    current_user: User = Depends(get_current_user)
+):
+    """Imports the all-day events of an iCalendar file (e.g. public holidays) as `day_type`."""
+    content = file.file.read(1024 * 1024 + 1)
+    if len(content) > 1024 * 1024:
+        raise HTTPException(status_code=400, detail="ICS file larger than 1 MB")
+    try:
+        rows = parse_ics(content.decode("utf-8-sig", errors="replace"), day_type)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if not rows:
+        raise HTTPException(status_code=400, detail="No all-day events found")
+    return apply_import(session, current_user, rows, replace, file.filename or "ICS file")
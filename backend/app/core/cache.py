@@ -0,0 +1,105 @@
+"""
+Process-local caches that stay coherent across workers.
+
+Every cached table has a row in `change_counter` that is bumped in the same
+transaction as any write to it. A cache compares the counter (one primary key
+lookup) with the version it loaded and reloads when another worker, or this
+one, changed the table.
+
+`PRAGMA data_version` was not used: it is per connection, so with pooled
+connections it cannot tell which data a cache was built from, and it does not
+exist on PostgreSQL.
+"""
+import threading
+from itertools import chain
+from typing import Callable, Dict, List
+from sqlalchemy import event, text
+from sqlalchemy.orm import Session
+
+# table name -> counter name
+tracked_tables: Dict[str, str] = {}
+# Every VersionedCache, so a restore can drop them all
+caches: List["VersionedCache"] = []
+
+def track_changes(model, name: str = None):
+    """Bumps counter `name` (default: the table name) on every flush or bulk statement touching model."""
+    table = model.__table__.name
+    tracked_tables[table] = name or table
+
+def bump(conn, name: str):
+    conn.execute(
+        text(
+            "INSERT INTO change_counter (name, version) VALUES (:name, 1) "
+            "ON CONFLICT (name) DO UPDATE SET version = change_counter.version + 1"
+        ),
+        {"name": name},
+    )
+
+def execute_tracked(session, model, *statements):
+    """
+    Runs Core DML statements on a tracked table in the session's transaction and bumps its counter
+    once. Statements on the connection bypass the ORM listeners below, which would bump per statement.
+    Nothing is bumped when there are no statements.
+    """
+    if not statements:
+        return
+    connection = session.connection()
+    for statement in statements:
+        connection.execute(statement)
+    bump(connection, tracked_tables[model.__table__.name])
+
+def current_version(session, name: str) -> int:
+    return session.connection().execute(
+        text("SELECT version FROM change_counter WHERE name = :name"), {"name": name}
+    ).scalar() or 0
+
+@event.listens_for(Session, "after_flush")
+def _bump_after_flush(session, flush_context):
+    if not tracked_tables:
+        return
+    # new/dirty/deleted still hold the pre-flush state here
+    names = set()
+    for obj in chain(session.new, session.dirty, session.deleted):
+        table = getattr(obj, "__table__", None)
+        if table is not None and table.name in tracked_tables:
+            names.add(tracked_tables[table.name])
+    for name in names:
+        bump(session.connection(), name)
+
+@event.listens_for(Session, "do_orm_execute")
+def _bump_on_bulk_dml(orm_execute_state):
+    # session.execute(update(...)/delete(...)) never goes through flush
+    if not (orm_execute_state.is_update or orm_execute_state.is_delete):
+        return
+    mapper = orm_execute_state.bind_mapper
+    if mapper is not None and mapper.local_table.name in tracked_tables:
+        bump(orm_execute_state.session.connection(), tracked_tables[mapper.local_table.name])
+
+class VersionedCache:
+    """Caches loader(session) until the change counter `name` moves."""
+
+    def __init__(self, name: str, loader: Callable):
+        self.name = name
+        self.loader = loader
+        self.version = None
+        self.value = None
+        self._lock = threading.Lock()
+        caches.append(self)
+
+    def get(self, session):
+        version = current_version(session, self.name)
+        if version != self.version:
+            with self._lock:
+                if version != self.version:
+                    self.value = self.loader(session)
+                    self.version = version
+        return self.value
+
+    def clear(self):
+        with self._lock:
+            self.version = None
+            self.value = None
+
+def clear_all():
+    for cache in caches:
+        cache.clear()
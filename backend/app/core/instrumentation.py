@@ -0,0 +1,109 @@
+"""
+Per-request query accounting on top of SQLAlchemy cursor events.
+
+Every statement executed while a request is active is attributed to that
+request (count, DB time, normalized fingerprint). Requests that repeat the
+same fingerprint many times are reported as likely N+1 patterns, and slow
+statements are kept in a ring buffer for the admin API.
+"""
+import re
+import time
+import logging
+import threading
+from collections import Counter, deque
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from typing import Optional
+from sqlalchemy import event
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+class RequestQueryStats:
+    __slots__ = ("path", "query_count", "db_time", "fingerprints")
+
+    def __init__(self, path: str):
+        self.path = path
+        self.query_count = 0
+        self.db_time = 0.0
+        self.fingerprints = Counter()
+
+current_request_stats: ContextVar[Optional[RequestQueryStats]] = ContextVar("current_request_stats", default=None)
+
+slow_queries = deque(maxlen=settings.SLOW_QUERY_BUFFER_SIZE)
+n_plus_one_reports = deque(maxlen=settings.SLOW_QUERY_BUFFER_SIZE)
+_buffer_lock = threading.Lock()
+
+_WHITESPACE = re.compile(r"\s+")
+_STRING_LITERAL = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_LITERAL = re.compile(r"\b\d+(?:\.\d+)?\b")
+_PARAM_LIST = re.compile(r"\((?:\s*\?\s*,)+\s*\?\s*\)")
+
+def fingerprint(statement: str) -> str:
+    """Normalizes a statement so executions differing only in literals/parameters compare equal."""
+    sql = _WHITESPACE.sub(" ", statement).strip()
+    sql = _STRING_LITERAL.sub("?", sql)
+    sql = _NUMBER_LITERAL.sub("?", sql)
+    sql = _PARAM_LIST.sub("(?)", sql)
+    return sql
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - conn.info["query_start"].pop()
+    stats = current_request_stats.get()
+    if stats is not None:
+        stats.query_count += 1
+        stats.db_time += elapsed
+        stats.fingerprints[fingerprint(statement)] += 1
+
+    if elapsed * 1000 >= settings.SLOW_QUERY_MS:
+        with _buffer_lock:
+            slow_queries.append({
+                "timestamp": datetime.now(timezone.utc).isoformat(),
+                "duration_ms": round(elapsed * 1000, 2),
+                "path": stats.path if stats else None,
+                "statement": fingerprint(statement),
+            })
+
+def instrument_engine(sync_engine):
+    """Attaches the query hooks to a sync Engine (use async_engine.sync_engine for async ones)."""
+    if event.contains(sync_engine, "before_cursor_execute", _before_cursor_execute):
+        return
+    event.listen(sync_engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(sync_engine, "after_cursor_execute", _after_cursor_execute)
+
+def begin_request(path: str):
+    return current_request_stats.set(RequestQueryStats(path))
+
+def end_request(token) -> RequestQueryStats:
+    stats = current_request_stats.get()
+    current_request_stats.reset(token)
+
+    repeated = {fp: count for fp, count in stats.fingerprints.items() if count >= settings.N_PLUS_ONE_THRESHOLD}
+    if repeated:
+        for fp, count in repeated.items():
+            logger.warning(f"Likely N+1 in {stats.path}: {count}x {fp[:200]}")
+        with _buffer_lock:
+            n_plus_one_reports.append({
+                "timestamp": datetime.now(timezone.utc).isoformat(),
+                "path": stats.path,
+                "query_count": stats.query_count,
+                "repeated": [{"statement": fp, "count": count} for fp, count in repeated.items()],
+            })
+    return stats
+
+def server_timing(stats: RequestQueryStats, total: float) -> str:
+    return (
+        f'db;dur={stats.db_time * 1000:.1f};desc="{stats.query_count} queries", '
+        f"app;dur={max(total - stats.db_time, 0) * 1000:.1f}"
+    )
+
+def recent_slow_queries() -> list:
+    with _buffer_lock:
+        return list(reversed(slow_queries))
+
+def recent_n_plus_one() -> list:
+    with _buffer_lock:
+        return list(reversed(n_plus_one_reports))
@@ -0,0 +1,214 @@
+"""
+Job runner on top of APScheduler.
+
+Every execution, scheduled or manual, goes through `run_job()`, which
+- records it in the `job_run` table (start, end, duration, result, error),
+- skips it while the same job is still running, in any worker,
+- makes heavy jobs (backups, VACUUM, compliance scans) wait for each other,
+- feeds the scheduler_job_* metrics.
+
+The locks are files in JOB_LOCK_DIR, so a manual run triggered through any
+worker respects the runs of the scheduler leader and vice versa.
+"""
+import json
+import logging
+import os
+import threading
+import time
+import traceback
+from datetime import datetime, timedelta, timezone
+from typing import Callable, Dict, Optional
+from apscheduler.triggers.cron import CronTrigger
+from sqlmodel import Session, select, delete, func
+from app.core.config import settings
+from app.core.locks import FileLock
+from app.core.metrics import record_job
+from app.database import engine, read_engine
+from app.models import JobRun
+
+logger = logging.getLogger(__name__)
+
+HEAVY_LOCK = "heavy"
+# Statuses that mean "the scheduled run happened", for catch-up
+ATTEMPTED = ("running", "success", "failure")
+
+class Job:
+    def __init__(self, name: str, func: Callable, trigger, heavy: bool = False, catch_up: bool = True, kwargs: dict = None, description: str = ""):
+        self.name = name
+        self.func = func
+        self.trigger = trigger
+        self.heavy = heavy
+        self.catch_up = catch_up
+        self.kwargs = kwargs or {}
+        self.description = description
+
+jobs: Dict[str, Job] = {}
+
+def register(name: str, func: Callable, trigger, **options) -> Job:
+    job = jobs[name] = Job(name, func, trigger, **options)
+    return job
+
+def job_lock(name: str) -> FileLock:
+    os.makedirs(settings.JOB_LOCK_DIR, exist_ok=True)
+    return FileLock(os.path.join(settings.JOB_LOCK_DIR, f"{name}.lock"))
+
+def is_running(name: str) -> bool:
+    lock = job_lock(name)
+    if lock.acquire(blocking=False):
+        lock.release()
+        return False
+    return True
+
+def _serialize(result) -> Optional[str]:
+    if result is None:
+        return None
+    return json.dumps(result, default=str)[:2000]
+
+def _record_start(name: str, trigger: str) -> Optional[int]:
+    # Bookkeeping must never keep a job from running
+    try:
+        with Session(engine) as session:
+            run = JobRun(job=name, trigger=trigger)
+            session.add(run)
+            session.commit()
+            return run.id
+    except Exception as e:
+        logger.error(f"Could not record start of job {name}: {e}")
+        return None
+
+def _record_end(run_id: Optional[int], started: float, status: str, result=None, error: str = None):
+    if run_id is None:
+        return
+    try:
+        with Session(engine) as session:
+            run = session.get(JobRun, run_id)
+            run.status = status
+            run.finished_at = datetime.utcnow()
+            run.duration_ms = int((time.perf_counter() - started) * 1000)
+            run.result = _serialize(result)
+            run.error = error
+            session.add(run)
+            session.commit()
+    except Exception as e:
+        logger.error(f"Could not record end of job {run_id}: {e}")
+
+def _record_skipped(name: str, trigger: str, reason: str):
+    logger.warning(f"Job {name} skipped: {reason}")
+    record_job(name, time.perf_counter(), "skipped")
+    run_id = _record_start(name, trigger)
+    _record_end(run_id, time.perf_counter(), "skipped", error=reason)
+
+def run_job(name: str, trigger: str = "schedule", own_lock: FileLock = None):
+    job = jobs[name]
+    own_lock = own_lock or job_lock(name)
+    if not own_lock.acquire(blocking=False):
+        _record_skipped(name, trigger, "already running")
+        return None
+    heavy_lock = job_lock(HEAVY_LOCK) if job.heavy else None
+    try:
+        if heavy_lock and not heavy_lock.acquire(timeout=settings.JOB_HEAVY_WAIT_SECONDS):
+            _record_skipped(name, trigger, f"another heavy job ran for more than {settings.JOB_HEAVY_WAIT_SECONDS}s")
+            return None
+        # Timed after the heavy-lock wait, so durations are the job's own
+        started = time.perf_counter()
+        run_id = _record_start(name, trigger)
+        try:
+            result = job.func(**job.kwargs)
+        except Exception:
+            logger.exception(f"Job {name} failed")
+            _record_end(run_id, started, "failure", error=traceback.format_exc()[-4000:])
+            record_job(name, started, "failure")
+            return None
+        _record_end(run_id, started, "success", result=result)
+        record_job(name, started, "success")
+        return result
+    finally:
+        if heavy_lock:
+            heavy_lock.release()
+        own_lock.release()
+
+def trigger_job(name: str) -> bool:
+    """Runs a job now in a background thread of this worker. False if it is already running."""
+    # Taken here and handed to the thread, so two quick clicks cannot both start it
+    lock = job_lock(name)
+    if not lock.acquire(blocking=False):
+        return False
+    threading.Thread(target=run_job, args=(name, "manual", lock), name=f"job-{name}", daemon=True).start()
+    return True
+
+def previous_fire_time(trigger, now: datetime) -> Optional[datetime]:
+    """Latest scheduled time within the catch-up window (APScheduler 3 only computes forward)."""
+    fire = trigger.get_next_fire_time(None, now - timedelta(hours=settings.JOB_CATCH_UP_HOURS))
+    last = None
+    while fire is not None and fire <= now:
+        last = fire
+        fire = trigger.get_next_fire_time(fire, fire + timedelta(seconds=1))
+    return last
+
+def missed_jobs() -> list:
+    """
+    Cron jobs whose last scheduled time passed while no scheduler was running.
+    Jobs that never ran are left alone, so a fresh install does not send reminders on first start.
+    """
+    now = datetime.now(timezone.utc)
+    last_attempts = dict(_latest(JobRun.status.in_(ATTEMPTED), JobRun.started_at))
+    missed = []
+    for job in jobs.values():
+        if not job.catch_up or not isinstance(job.trigger, CronTrigger):
+            continue
+        due = previous_fire_time(job.trigger, now)
+        last = last_attempts.get(job.name)
+        if due is None or last is None:
+            continue
+        if last < due.astimezone(timezone.utc).replace(tzinfo=None):
+            missed.append(job.name)
+    return missed
+
+def mark_interrupted():
+    """Closes runs left 'running' by a worker that died, unless someone still holds their lock."""
+    with Session(engine) as session:
+        for run in session.exec(select(JobRun).where(JobRun.status == "running")).all():
+            if not is_running(run.job):
+                run.status = "interrupted"
+                run.finished_at = datetime.utcnow()
+                session.add(run)
+        session.commit()
+
+def prune_job_runs(days: int = None):
+    cutoff = datetime.utcnow() - timedelta(days=days or settings.JOB_RUN_RETENTION_DAYS)
+    with Session(engine) as session:
+        result = session.exec(delete(JobRun).where(JobRun.started_at < cutoff))
+        session.commit()
+    return {"deleted": result.rowcount}
+
+def _latest(condition, column):
+    """(job, column) of the newest run per job matching condition, in one query."""
+    newest = select(func.max(JobRun.id)).where(condition).group_by(JobRun.job)
+    with Session(read_engine) as session:
+        return session.exec(select(JobRun.job, column).where(JobRun.id.in_(newest))).all()
+
+def job_status() -> list:
+    now = datetime.now(timezone.utc)
+    with Session(read_engine) as session:
+        newest = select(func.max(JobRun.id)).group_by(JobRun.job)
+        last_runs = {run.job: run for run in session.exec(select(JobRun).where(JobRun.id.in_(newest))).all()}
+    last_success = dict(_latest(JobRun.status == "success", JobRun.finished_at))
+    return [
+        {
+            "name": job.name,
+            "description": job.description,
+            "schedule": str(job.trigger),
+            "heavy": job.heavy,
+            "running": is_running(job.name),
+            "next_run_time": job.trigger.get_next_fire_time(None, now),
+            "last_run": last_runs.get(job.name),
+            "last_success_at": last_success.get(job.name),
+        }
+        for job in jobs.values()
+    ]
+
+def recent_runs(name: str, limit: int = 20) -> list:
+    with Session(read_engine) as session:
+        return session.exec(
+            select(JobRun).where(JobRun.job == name).order_by(JobRun.id.desc()).limit(limit)
+        ).all()
@@ -0,0 +1,115 @@
+"""
+Advisory file locks shared by the worker processes of one host, and the
+in-process gate that holds requests back during a restore.
+
+The OS releases a file lock when the process holding it exits, so a crashed
+worker never leaves a stale lock behind.
+"""
+import asyncio
+import os
+import threading
+import time
+
+try:
+    import fcntl
+except ImportError:  # Windows: no flock, only single-process deployments are supported
+    fcntl = None
+
+class FileLock:
+    def __init__(self, path: str):
+        self.path = path
+        self.fd = None
+
+    @property
+    def held(self) -> bool:
+        return self.fd is not None
+
+    def acquire(self, blocking: bool = True, timeout: float = None) -> bool:
+        """With a timeout the lock is polled, flock itself cannot time out."""
+        if self.held:
+            return True
+        if fcntl is None:
+            self.fd = -1
+            return True
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        deadline = time.monotonic() + timeout if timeout is not None else None
+        while True:
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | (fcntl.LOCK_NB if not blocking or deadline else 0))
+                break
+            except BlockingIOError:
+                if not blocking or time.monotonic() >= deadline:
+                    os.close(fd)
+                    return False
+                time.sleep(0.5)
+        # Holder's pid, for whoever wonders which worker runs the scheduler
+        os.ftruncate(fd, 0)
+        os.write(fd, str(os.getpid()).encode())
+        self.fd = fd
+        return True
+
+    def release(self):
+        if self.fd is None:
+            return
+        if self.fd >= 0:
+            fcntl.flock(self.fd, fcntl.LOCK_UN)
+            os.close(self.fd)
+        self.fd = None
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
+
+class Gate:
+    """
+    Many holders enter(), one caller close()s: closing stops new entries and waits
+    for the current holders to leave, until open() is called.
+    """
+
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._active = 0
+        self._closed = False
+
+    @property
+    def closed(self) -> bool:
+        return self._closed
+
+    def try_enter(self) -> bool:
+        with self._cond:
+            if self._closed:
+                return False
+            self._active += 1
+            return True
+
+    async def enter(self, timeout: float) -> bool:
+        """Polled, so waiting requests do not tie up threads of the event loop's pool."""
+        deadline = time.monotonic() + timeout
+        while not self.try_enter():
+            if time.monotonic() >= deadline:
+                return False
+            await asyncio.sleep(0.02)
+        return True
+
+    def leave(self):
+        with self._cond:
+            self._active -= 1
+            self._cond.notify_all()
+
+    def close(self, timeout: float) -> bool:
+        """False (and the gate stays open) if it is already closed or the holders did not leave in time."""
+        with self._cond:
+            if self._closed:
+                return False
+            self._closed = True
+            if not self._cond.wait_for(lambda: self._active == 0, timeout):
+                self._closed = False
+                return False
+            return True
+
+    def open(self):
+        with self._cond:
+            self._closed = False
@@ -0,0 +1,264 @@
+"""
+Minimal Prometheus text-format metrics.
+
+Metric children (one per label set) are created up front where the labels are
+known (routes, scheduler jobs) so recording a request is a dict lookup plus a
+few integer additions.
+"""
+import bisect
+import threading
+import time
+from typing import Dict, Tuple
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+JOB_BUCKETS = (0.1, 0.5, 1.0, 5.0, 15.0, 60.0, 300.0, 900.0, 3600.0)
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _format_labels(names: Tuple[str, ...], values: Tuple[str, ...], extra: str = "") -> str:
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+class _CounterChild:
+    __slots__ = ("value", "_lock")
+
+    def __init__(self):
+        self.value = 0.0
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0):
+        with self._lock:
+            self.value += amount
+
+class _GaugeChild(_CounterChild):
+    __slots__ = ()
+
+    def set(self, value: float):
+        self.value = value
+
+    def dec(self, amount: float = 1.0):
+        with self._lock:
+            self.value -= amount
+
+class _HistogramChild:
+    __slots__ = ("buckets", "counts", "sum", "count", "_lock")
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # last slot is +Inf
+        self.sum = 0.0
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.sum += value
+            self.count += 1
+
+class Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children: Dict[Tuple[str, ...], object] = {}
+        self._lock = threading.Lock()
+        if not self.labelnames:
+            self._children[()] = self._new_child()
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def labels(self, *values) -> object:
+        values = tuple(str(v) for v in values)
+        child = self._children.get(values)
+        if child is None:
+            with self._lock:
+                child = self._children.setdefault(values, self._new_child())
+        return child
+
+    def collect(self):
+        yield f"# HELP {self.name} {self.documentation}"
+        yield f"# TYPE {self.name} {self.kind}"
+        for values, child in list(self._children.items()):
+            yield from self._collect_child(values, child)
+
+    def _collect_child(self, values, child):
+        yield f"{self.name}{_format_labels(self.labelnames, values)} {child.value}"
+
+class Counter(Metric):
+    kind = "counter"
+
+    def _new_child(self):
+        return _CounterChild()
+
+    def inc(self, amount: float = 1.0):
+        self._children[()].inc(amount)
+
+class Gauge(Metric):
+    kind = "gauge"
+
+    def _new_child(self):
+        return _GaugeChild()
+
+    def set(self, value: float):
+        self._children[()].set(value)
+
+    def inc(self, amount: float = 1.0):
+        self._children[()].inc(amount)
+
+    def dec(self, amount: float = 1.0):
+        self._children[()].dec(amount)
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = (), buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        super().__init__(name, documentation, labelnames)
+
+    def _new_child(self):
+        return _HistogramChild(self.buckets)
+
+    def observe(self, value: float):
+        self._children[()].observe(value)
+
+    def _collect_child(self, values, child):
+        cumulative = 0
+        for bound, count in zip(self.buckets + (float("inf"),), child.counts):
+            cumulative += count
+            le = 'le="+Inf"' if bound == float("inf") else f'le="{bound!r}"'
+            yield f"{self.name}_bucket{_format_labels(self.labelnames, values, le)} {cumulative}"
+        yield f"{self.name}_sum{_format_labels(self.labelnames, values)} {child.sum}"
+        yield f"{self.name}_count{_format_labels(self.labelnames, values)} {child.count}"
+
+class Registry:
+    def __init__(self):
+        self.metrics = []
+        self.collectors = []
+
+    def register(self, metric: Metric) -> Metric:
+        self.metrics.append(metric)
+        return metric
+
+    def add_collector(self, func):
+        """func() is called at scrape time to refresh gauges (pool stats etc.)."""
+        self.collectors.append(func)
+
+    def render(self) -> str:
+        for collector in self.collectors:
+            collector()
+        lines = []
+        for metric in self.metrics:
+            lines.extend(metric.collect())
+        return "\n".join(lines) + "\n"
+
+registry = Registry()
+
+# HTTP
+http_requests_total = registry.register(Counter("http_requests_total", "HTTP requests by route and status", ("method", "route", "status")))
+http_request_duration_seconds = registry.register(Histogram("http_request_duration_seconds", "HTTP request latency", ("method", "route")))
+http_requests_in_flight = registry.register(Gauge("http_requests_in_flight", "HTTP requests currently being served"))
+
+# Scheduler
+job_runs_total = registry.register(Counter("scheduler_job_runs_total", "Scheduler job runs by outcome", ("job", "outcome")))
+job_duration_seconds = registry.register(Histogram("scheduler_job_duration_seconds", "Scheduler job duration", ("job",), buckets=JOB_BUCKETS))
+job_last_success = registry.register(Gauge("scheduler_job_last_success_timestamp_seconds", "Unix time of the last successful run", ("job",)))
+
+# Backups
+backup_runs_total = registry.register(Counter("backup_runs_total", "Database backups by outcome", ("outcome",)))
+backup_duration_seconds = registry.register(Histogram("backup_duration_seconds", "Database backup duration", buckets=JOB_BUCKETS))
+backup_size_bytes = registry.register(Gauge("backup_last_size_bytes", "Size of the most recent backup"))
+restore_downtime_seconds = registry.register(Gauge("restore_last_downtime_seconds", "Time requests were held back by the most recent restore"))
+
+# Database pools, refreshed at scrape time
+db_pool_checked_out = registry.register(Gauge("db_pool_checked_out", "Connections currently checked out", ("pool",)))
+db_pool_idle = registry.register(Gauge("db_pool_idle", "Idle connections in the pool", ("pool",)))
+db_pool_overflow = registry.register(Gauge("db_pool_overflow", "Connections beyond pool_size", ("pool",)))
+db_writer_waiting = registry.register(Gauge("db_writer_waiting", "Callers queued for the SQLite writer connection"))
+db_writer_wait_seconds_total = registry.register(Gauge("db_writer_wait_seconds_total", "Total time spent waiting for the writer connection"))
+db_writer_acquired_total = registry.register(Gauge("db_writer_acquired_total", "Writer connection checkouts"))
+
+class RouteMetrics:
+    """Pre-resolved metric children for one (method, route) pair."""
+    __slots__ = ("method", "route", "duration", "statuses")
+
+    def __init__(self, method: str, route: str):
+        self.method = method
+        self.route = route
+        self.duration = http_request_duration_seconds.labels(method, route)
+        self.statuses = {}
+
+    def record(self, status: int, elapsed: float):
+        self.duration.observe(elapsed)
+        counter = self.statuses.get(status)
+        if counter is None:
+            counter = self.statuses[status] = http_requests_total.labels(self.method, self.route, status)
+        counter.inc()
+
+# Keyed by (endpoint, method); labelled with the route template ("/users/{user_id}"),
+# never the raw path, so label cardinality stays bounded
+route_metrics: Dict[Tuple[object, str], RouteMetrics] = {}
+
+def register_routes(routes):
+    """Creates the children for the app's routes up front so the first request does not pay for it."""
+    for route in routes:
+        endpoint = getattr(route, "endpoint", None)
+        for method in getattr(route, "methods", None) or ():
+            metrics = route_metrics[(endpoint, method)] = RouteMetrics(method, route.path)
+            for status in (200, 201, 400, 401, 403, 404, 500):
+                metrics.statuses[status] = http_requests_total.labels(method, route.path, status)
+
+def route_template(scope) -> str:
+    """Rebuilds the path template by putting the parameter names back into the request path."""
+    segments = scope["path"].split("/")
+    # Parameters come in template order: match them right to left so equal values land on the right segment
+    for name, value in reversed(list((scope.get("path_params") or {}).items())):
+        value = str(value)
+        for i in range(len(segments) - 1, -1, -1):
+            if segments[i] == value:
+                segments[i] = "{" + name + "}"
+                break
+    return "/".join(segments)
+
+def metrics_for(scope) -> RouteMetrics:
+    method = scope["method"]
+    endpoint = scope.get("endpoint")
+    metrics = route_metrics.get((endpoint, method))
+    if metrics is None:
+        # Unknown paths (404) share one "unmatched" bucket per method
+        path = route_template(scope) if endpoint is not None else "unmatched"
+        metrics = route_metrics.setdefault((endpoint, method), RouteMetrics(method, path))
+    return metrics
+
+def record_job(job: str, started: float, outcome: str):
+    job_duration_seconds.labels(job).observe(time.perf_counter() - started)
+    job_runs_total.labels(job, outcome).inc()
+    if outcome == "success":
+        job_last_success.labels(job).set(time.time())
+
+def render() -> str:
+    return registry.render()
+
+def collect_db_pools():
+    from app.database import engine, read_engine, async_read_engine, writer_stats
+    pools = {"writer": engine.pool, "async_reader": async_read_engine.sync_engine.pool}
+    if read_engine is not engine:
+        pools["reader"] = read_engine.pool
+    for name, pool in pools.items():
+        if hasattr(pool, "checkedout"):
+            db_pool_checked_out.labels(name).set(pool.checkedout())
+            db_pool_idle.labels(name).set(pool.checkedin())
+            db_pool_overflow.labels(name).set(max(pool.overflow(), 0))
+    snapshot = writer_stats.snapshot()
+    db_writer_waiting.set(snapshot["waiting"])
+    db_writer_wait_seconds_total.set(snapshot["total_wait_seconds"])
+    db_writer_acquired_total.set(snapshot["acquired"])
+
+registry.add_collector(collect_db_pools)
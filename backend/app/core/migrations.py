@@ -0,0 +1,146 @@
+"""
+Versioned schema migrations.
+
+`SQLModel.metadata.create_all` only creates missing tables, so new indexes and
+columns never reach an existing database. Scripts in `app/migrations/` named
+`mNNNN_<description>.py` define `upgrade(ctx)` and are applied in order at
+startup. Applied versions are recorded in the `schema_version` table.
+
+The whole run happens under a lock so several workers starting together apply
+each migration once: SQLite uses a single `BEGIN IMMEDIATE` transaction,
+PostgreSQL a session advisory lock.
+"""
+import importlib
+import logging
+import os
+import pkgutil
+import re
+import time
+from typing import List, Tuple
+from sqlalchemy import inspect, text
+from sqlalchemy.engine import Connection, Engine
+
+logger = logging.getLogger(__name__)
+
+MIGRATIONS_PACKAGE = "app.migrations"
+MIGRATIONS_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), "migrations")
+MIGRATION_NAME = re.compile(r"^m(\d{4})_(\w+)$")
+# Arbitrary key for pg_advisory_lock
+PG_LOCK_KEY = 7305114
+
+class MigrationContext:
+    """Helpers passed to each migration's upgrade()."""
+
+    def __init__(self, conn: Connection, in_transaction: bool):
+        self.conn = conn
+        self.dialect = conn.dialect.name
+        self.in_transaction = in_transaction
+
+    @property
+    def is_sqlite(self) -> bool:
+        return self.dialect == "sqlite"
+
+    def execute(self, sql: str, params: dict = None):
+        return self.conn.execute(text(sql), params or {})
+
+    def has_table(self, table: str) -> bool:
+        return inspect(self.conn).has_table(table)
+
+    def has_column(self, table: str, column: str) -> bool:
+        return column in {c["name"] for c in inspect(self.conn).get_columns(table)}
+
+    def create_index(self, name: str, table: str, columns: List[str], unique: bool = False, using: str = None):
+        """Creates an index if missing. On PostgreSQL outside a transaction it is built CONCURRENTLY."""
+        cols = ", ".join(columns)
+        concurrently = " CONCURRENTLY" if self.dialect == "postgresql" and not self.in_transaction else ""
+        unique_sql = "UNIQUE " if unique else ""
+        using_sql = f" USING {using}" if using else ""
+        self.execute(f'CREATE {unique_sql}INDEX{concurrently} IF NOT EXISTS {name} ON "{table}"{using_sql} ({cols})')
+
+    def drop_index(self, name: str):
+        concurrently = " CONCURRENTLY" if self.dialect == "postgresql" and not self.in_transaction else ""
+        self.execute(f"DROP INDEX{concurrently} IF EXISTS {name}")
+
+    def add_column(self, table: str, column):
+        """Adds a sqlalchemy Column to an existing table if missing."""
+        if self.has_column(table, column.name):
+            return
+        col_type = column.type.compile(dialect=self.conn.dialect)
+        ddl = f'ALTER TABLE "{table}" ADD COLUMN {column.name} {col_type}'
+        if column.server_default is not None:
+            ddl += f" DEFAULT {column.server_default.arg}"
+        self.execute(ddl)
+
+def discover_migrations() -> List[Tuple[int, str, object]]:
+    migrations = []
+    for module_info in pkgutil.iter_modules([MIGRATIONS_DIR]):
+        match = MIGRATION_NAME.match(module_info.name)
+        if not match:
+            continue
+        module = importlib.import_module(f"{MIGRATIONS_PACKAGE}.{module_info.name}")
+        migrations.append((int(match.group(1)), match.group(2), module))
+    migrations.sort(key=lambda m: m[0])
+    versions = [m[0] for m in migrations]
+    if len(versions) != len(set(versions)):
+        raise RuntimeError(f"Duplicate migration versions in {MIGRATIONS_DIR}")
+    return migrations
+
+def applied_versions(conn: Connection) -> set:
+    return {row[0] for row in conn.execute(text("SELECT version FROM schema_version"))}
+
+def record_version(conn: Connection, version: int, description: str):
+    conn.execute(
+        text("INSERT INTO schema_version (version, description, applied_at) VALUES (:v, :d, CURRENT_TIMESTAMP)"),
+        {"v": version, "d": description},
+    )
+
+def run_migrations(engine: Engine):
+    """Applies pending migrations. Expects create_all() to have created schema_version."""
+    migrations = discover_migrations()
+    # Autocommit at the driver level, transactions are issued explicitly below
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        if conn.dialect.name == "sqlite":
+            run_sqlite(conn, migrations)
+        else:
+            run_locked(conn, migrations)
+
+def run_sqlite(conn: Connection, migrations):
+    # BEGIN IMMEDIATE takes the database write lock up front; other workers wait on busy_timeout
+    conn.exec_driver_sql("BEGIN IMMEDIATE")
+    try:
+        done = applied_versions(conn)
+        for version, description, module in migrations:
+            if version in done:
+                continue
+            apply(MigrationContext(conn, in_transaction=True), version, description, module)
+        conn.exec_driver_sql("COMMIT")
+    except Exception:
+        conn.exec_driver_sql("ROLLBACK")
+        raise
+
+def run_locked(conn: Connection, migrations):
+    conn.execute(text("SELECT pg_advisory_lock(:key)"), {"key": PG_LOCK_KEY})
+    try:
+        done = applied_versions(conn)
+        for version, description, module in migrations:
+            if version in done:
+                continue
+            if getattr(module, "TRANSACTIONAL", True):
+                conn.exec_driver_sql("BEGIN")
+                try:
+                    apply(MigrationContext(conn, in_transaction=True), version, description, module)
+                    conn.exec_driver_sql("COMMIT")
+                except Exception:
+                    conn.exec_driver_sql("ROLLBACK")
+                    raise
+            else:
+                # Index-only migrations run outside a transaction so indexes build concurrently
+                apply(MigrationContext(conn, in_transaction=False), version, description, module)
+    finally:
+        conn.execute(text("SELECT pg_advisory_unlock(:key)"), {"key": PG_LOCK_KEY})
+
+def apply(ctx: MigrationContext, version: int, description: str, module):
+    started = time.perf_counter()
+    module.upgrade(ctx)
+    record_version(ctx.conn, version, getattr(module, "DESCRIPTION", description))
+    logger.info(f"Applied migration {version:04d} {description} in {time.perf_counter() - started:.2f}s")
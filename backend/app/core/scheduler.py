@@ -1,14 +1,21 @@
 from apscheduler.schedulers.background import BackgroundScheduler
-from app.database import engine
+from apscheduler.triggers.cron import CronTrigger
+from apscheduler.triggers.interval import IntervalTrigger
+from app.database import read_engine, is_sqlite
 from sqlmodel import Session, select
 from app.services.email_service import check_timesheet_compliance, check_approval_compliance
 import logging
+import os
+import threading
+from app.core import jobs
+from app.core.config import settings
+from app.core.locks import FileLock
 
 logging.basicConfig()
 logging.getLogger('apscheduler').setLevel(logging.DEBUG)
 
 def run_timesheet_check():
-    with Session(engine) as session:
+    with Session(read_engine) as session:
         from app.models import SMTPSettings
         settings = session.exec(select(SMTPSettings)).first()
         if settings and settings.checking_service_enabled:
@@ -19,7 +26,7 @@ def run_timesheet_check():
             print("Skipping scheduled timesheet check (disabled)")
 
 def run_approval_check():
-    with Session(engine) as session:
+    with Session(read_engine) as session:
         from app.models import SMTPSettings
         settings = session.exec(select(SMTPSettings)).first()
         if settings and settings.checking_service_enabled:
@@ -29,18 +36,90 @@ def run_approval_check():
         else:
             print("Skipping scheduled approval check (disabled)")
 
+leader_lock = FileLock(settings.SCHEDULER_LOCK_FILE)
+scheduler = None
+
 def start_scheduler():
-    scheduler = BackgroundScheduler()
-    
-    # Schedule jobs for Monday at 10:00 AM
-    scheduler.add_job(run_timesheet_check, 'cron', day_of_week='mon', hour=10, minute=0)
-    scheduler.add_job(run_approval_check, 'cron', day_of_week='mon', hour=10, minute=0)
+    """
+    Only one worker process runs the jobs: the one holding the leader lock.
+    The others wait on the lock in a background thread and take over when the leader exits.
+    """
+    if not settings.SCHEDULER_ENABLED:
+        print("Scheduler disabled (SCHEDULER_ENABLED=false)")
+        return
+    if leader_lock.acquire(blocking=False):
+        run_scheduler()
+    else:
+        print(f"Worker {os.getpid()}: scheduler runs in another worker, standing by")
+        threading.Thread(target=wait_for_leadership, name="scheduler-failover", daemon=True).start()
+
+def wait_for_leadership():
+    leader_lock.acquire(blocking=True)
+    print(f"Worker {os.getpid()} took over the scheduler")
+    run_scheduler()
+
+def stop_scheduler():
+    global scheduler
+    if scheduler is not None:
+        scheduler.shutdown(wait=False)
+        scheduler = None
+    # Hand the lock to a standby worker right away instead of at process exit
+    leader_lock.release()
+
+# Heavy jobs wait for each other (app/core/jobs.py): backups, VACUUM and the compliance scans never overlap
+from app.services.backup_service import backup_database, clean_old_backups
+from app.services.token_service import clean_expired_refresh_tokens
+from app.services.db_maintenance import wal_checkpoint, optimize, incremental_vacuum
+
+# Compliance reminders on Monday at 10:00 AM
+jobs.register("timesheet_check", run_timesheet_check, CronTrigger(day_of_week='mon', hour=10, minute=0), heavy=True,
+              description="Remind employees with missing timesheets")
+jobs.register("approval_check", run_approval_check, CronTrigger(day_of_week='mon', hour=10, minute=0), heavy=True,
+              description="Remind team leaders of pending approvals")
+# Move old activity logs to the archive before the nightly backup, so backups stay small
+from app.services.log_archive import archive_old_logs
+jobs.register("archive_activity_logs", archive_old_logs, CronTrigger(hour=2, minute=30), heavy=True,
+              description="Move activity logs past ACTIVITY_LOG_RETENTION_DAYS to the archive")
+# Backup database every day at 03:00, cleanup old backups at 03:30
+jobs.register("backup", backup_database, CronTrigger(hour=3, minute=0), heavy=True,
+              description="Snapshot of the database")
+jobs.register("clean_old_backups", clean_old_backups, CronTrigger(hour=3, minute=30),
+              description="Keep daily/weekly/monthly backups per BACKUP_KEEP_*, delete the rest")
+# Continuous archiving of captured row changes for point-in-time recovery (SQLite only)
+from app.services.changelog import archive_changes
+if is_sqlite and settings.CHANGELOG_ENABLED:
+    jobs.register("archive_changes", archive_changes, IntervalTrigger(seconds=settings.CHANGELOG_ARCHIVE_SECONDS), catch_up=False,
+                  description="Copy captured row changes to backups/wal/ for point-in-time recovery")
+# Purge expired refresh tokens and old job history once a day
+jobs.register("clean_expired_refresh_tokens", clean_expired_refresh_tokens, CronTrigger(hour=3, minute=45),
+              description="Delete expired refresh tokens")
+jobs.register("prune_job_runs", jobs.prune_job_runs, CronTrigger(hour=3, minute=50),
+              description="Delete job history older than JOB_RUN_RETENTION_DAYS")
+# SQLite maintenance: keep the WAL small, planner statistics fresh and return free pages
+jobs.register("wal_checkpoint", wal_checkpoint, IntervalTrigger(minutes=15),
+              description="Truncate the SQLite WAL")
+jobs.register("optimize", optimize, CronTrigger(hour=4, minute=0), heavy=True,
+              description="Refresh query planner statistics")
+jobs.register("incremental_vacuum", incremental_vacuum, CronTrigger(day_of_week='sun', hour=4, minute=30), heavy=True,
+              description="Return free pages to the file system")
+
+def run_scheduler():
+    global scheduler
+    scheduler = BackgroundScheduler(job_defaults={
+        # A job still running when its next time comes is not started twice,
+        # and runs missed while the process was busy collapse into one
+        "max_instances": 1,
+        "coalesce": True,
+        "misfire_grace_time": 3600,
+    })
+    for job in jobs.jobs.values():
+        scheduler.add_job(jobs.run_job, job.trigger, args=[job.name], id=job.name, name=job.name)
     
-    # Backup database every day at 3 Midnight (03:00)
-    from app.services.backup_service import backup_database, clean_old_backups
-    scheduler.add_job(backup_database, 'cron', hour=3, minute=0)
-    # Cleanup old backups once a day at 03:30
-    scheduler.add_job(clean_old_backups, 'cron', hour=3, minute=30, kwargs={'days': 30})
+    jobs.mark_interrupted()
+    # Runs whose time passed while no worker held the scheduler (restart, deploy, crash)
+    for name in jobs.missed_jobs():
+        print(f"Catching up missed job {name}")
+        scheduler.add_job(jobs.run_job, 'date', args=[name, "catch_up"], id=f"{name}_catch_up")
     
     scheduler.start()
-    print("Scheduler started. Jobs scheduled for Monday 10:00 AM.")
+    print(f"Scheduler started with {len(jobs.jobs)} jobs.")
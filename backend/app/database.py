@@ -1,25 +1,174 @@
+import time
+import logging
+import threading
 from sqlmodel import SQLModel, create_engine, Session
+from sqlmodel.ext.asyncio.session import AsyncSession
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import create_async_engine
+from sqlalchemy.engine import make_url
+from sqlalchemy.pool import QueuePool
+from app.core.config import settings
+from app.core.locks import Gate
+
+logger = logging.getLogger(__name__)
+
+database_url = make_url(settings.DATABASE_URL)
+is_sqlite = database_url.get_backend_name() == "sqlite"
+is_sqlite_memory = is_sqlite and database_url.database in (None, "", ":memory:")
+
+class WriterStats:
+    """Wait times for the single SQLite writer connection."""
+
+    SLOW_WAIT_SECONDS = 1.0
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.waiting = 0
+        self.acquired = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+        self.slow_waits = 0
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                "waiting": self.waiting,
+                "acquired": self.acquired,
+                "total_wait_seconds": round(self.total_wait, 6),
+                "avg_wait_seconds": round(self.total_wait / self.acquired, 6) if self.acquired else 0.0,
+                "max_wait_seconds": round(self.max_wait, 6),
+                "slow_waits": self.slow_waits,
+            }
+
+writer_stats = WriterStats()
+
+class WriterPool(QueuePool):
+    """QueuePool that records how long callers queue for a connection."""
+
+    def _do_get(self):
+        with writer_stats._lock:
+            writer_stats.waiting += 1
+        started = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            waited = time.perf_counter() - started
+            with writer_stats._lock:
+                writer_stats.waiting -= 1
+                writer_stats.acquired += 1
+                writer_stats.total_wait += waited
+                writer_stats.max_wait = max(writer_stats.max_wait, waited)
+                if waited >= WriterStats.SLOW_WAIT_SECONDS:
+                    writer_stats.slow_waits += 1
+            if waited >= WriterStats.SLOW_WAIT_SECONDS:
+                logger.warning(f"Waited {waited:.2f}s for the database writer")
+
+def build_engine(pool_size: int, max_overflow: int, **kwargs):
+    engine_kwargs = {
+        "echo": False,
+        "pool_pre_ping": settings.DB_POOL_PRE_PING,
+        "pool_recycle": settings.DB_POOL_RECYCLE,
+    }
+    if is_sqlite:
+        engine_kwargs["connect_args"] = {"check_same_thread": False}
+    if not is_sqlite_memory:
+        # In-memory SQLite uses a singleton pool which takes no sizing arguments
+        engine_kwargs["pool_size"] = pool_size
+        engine_kwargs["max_overflow"] = max_overflow
+    engine_kwargs.update(kwargs)
+    return create_engine(database_url, **engine_kwargs)
+
+if is_sqlite and not is_sqlite_memory:
+    # SQLite has a single writer anyway: queue writers on one connection in-process instead of
+    # letting them spin on busy_timeout, and serve reads from a separate query_only pool.
+    engine = build_engine(1, 0, poolclass=WriterPool, pool_timeout=settings.DB_WRITER_TIMEOUT)
+    read_engine = build_engine(settings.DB_READ_POOL_SIZE, settings.DB_MAX_OVERFLOW)
+else:
+    engine = build_engine(settings.DB_POOL_SIZE, settings.DB_MAX_OVERFLOW)
+    read_engine = engine
 
-sqlite_file_name = "database.db"
-sqlite_url = f"sqlite:///{sqlite_file_name}"
+def async_database_url():
+    """Same database through an asyncio driver (aiosqlite / psycopg 3)."""
+    if is_sqlite:
+        return database_url.set(drivername="sqlite+aiosqlite")
+    if database_url.drivername in ("postgresql", "postgresql+psycopg2"):
+        return database_url.set(drivername="postgresql+psycopg")
+    return database_url
 
-connect_args = {"check_same_thread": False}
-engine = create_engine(sqlite_url, echo=False, connect_args=connect_args)
+# Async engine for the hot read endpoints. Requests awaiting it do not hold a worker thread.
+# The scheduler and backup service keep using the sync engines above.
+async_engine_kwargs = {"echo": False, "pool_pre_ping": settings.DB_POOL_PRE_PING, "pool_recycle": settings.DB_POOL_RECYCLE}
+if not is_sqlite_memory:
+    async_engine_kwargs["pool_size"] = settings.DB_READ_POOL_SIZE if is_sqlite else settings.DB_POOL_SIZE
+    async_engine_kwargs["max_overflow"] = settings.DB_MAX_OVERFLOW
+async_read_engine = create_async_engine(async_database_url(), **async_engine_kwargs)
+
+from app.core.instrumentation import instrument_engine
+for instrumented in {engine, read_engine, async_read_engine.sync_engine}:
+    instrument_engine(instrumented)
+
+# Path of the SQLite database file, None for other backends
+sqlite_file_name = database_url.database if is_sqlite else None
+
+# Closed by a restore: HTTP requests wait at the door (see main.py) until the data is swapped
+db_gate = Gate()
 
 def create_db_and_tables():
+    from app.core.migrations import run_migrations
+    from app.services.changelog import install_triggers
     SQLModel.metadata.create_all(engine)
+    # create_all never alters existing tables, migrations bring indexes and columns to old databases
+    run_migrations(engine)
+    # Generated from the models as they are now, so they follow every migration
+    install_triggers(engine)
 
-from sqlalchemy import event
+# Per-connection SQLite tuning. cache_size is negative KiB, mmap_size bytes.
+SQLITE_PRAGMA_PROFILES = {
+    "safe": {"synchronous": "FULL", "cache_size": -8192, "temp_store": "DEFAULT", "mmap_size": 0},
+    "balanced": {"synchronous": "NORMAL", "cache_size": -32768, "temp_store": "MEMORY", "mmap_size": 268435456},
+    "performance": {"synchronous": "NORMAL", "cache_size": -131072, "temp_store": "MEMORY", "mmap_size": 1073741824, "wal_autocheckpoint": 4000},
+}
+
+def sqlite_pragmas() -> dict:
+    if settings.SQLITE_PRAGMA_PROFILE not in SQLITE_PRAGMA_PROFILES:
+        raise ValueError(f"Unknown SQLITE_PRAGMA_PROFILE {settings.SQLITE_PRAGMA_PROFILE!r}")
+    return {**SQLITE_PRAGMA_PROFILES[settings.SQLITE_PRAGMA_PROFILE], **settings.SQLITE_PRAGMAS}
+
+if is_sqlite:
+    # Enable WAL mode for better concurrency
+    def set_sqlite_pragma(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        # Only takes effect for a new database, existing ones are converted with app.tools.convert_auto_vacuum
+        cursor.execute("PRAGMA auto_vacuum=INCREMENTAL")
+        cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.execute("PRAGMA busy_timeout=5000")
+        for name, value in sqlite_pragmas().items():
+            cursor.execute(f"PRAGMA {name}={value}")
+        cursor.close()
 
-# Enable WAL mode for better concurrency
-@event.listens_for(engine, "connect")
-def set_sqlite_pragma(dbapi_connection, connection_record):
-    cursor = dbapi_connection.cursor()
-    cursor.execute("PRAGMA journal_mode=WAL")
-    cursor.execute("PRAGMA synchronous=NORMAL")
-    cursor.execute("PRAGMA busy_timeout=5000")
-    cursor.close()
+    def set_sqlite_read_only(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        cursor.execute("PRAGMA query_only=ON")
+        cursor.close()
+
+    event.listen(engine, "connect", set_sqlite_pragma)
+    if read_engine is not engine:
+        event.listen(read_engine, "connect", set_sqlite_pragma)
+        event.listen(read_engine, "connect", set_sqlite_read_only)
+    event.listen(async_read_engine.sync_engine, "connect", set_sqlite_pragma)
+    if not is_sqlite_memory:
+        event.listen(async_read_engine.sync_engine, "connect", set_sqlite_read_only)
 
 def get_session():
     with Session(engine) as session:
         yield session
+
+def get_read_session():
+    """Session for GET endpoints and reports. On SQLite it never touches the writer connection."""
+    with Session(read_engine) as session:
+        yield session
+
+async def get_async_session():
+    """Async read-only session for the high-traffic GET endpoints."""
+    async with AsyncSession(async_read_engine) as session:
+        yield session
@@ -1,6 +1,11 @@
-from fastapi import FastAPI
+import time
+from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
-from app.database import create_db_and_tables, get_session, engine
+from fastapi.responses import JSONResponse, PlainTextResponse
+from app.core import config, metrics
+from app.core.locks import FileLock
+from app.core.instrumentation import begin_request, end_request, server_timing
+from app.database import create_db_and_tables, get_session, engine, db_gate
 from app.api import auth, projects, timesheets, reports, activity_logs, users, settings, cost_centers
 
 from app.models import Project, User, Role
@@ -19,8 +24,43 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    # Cursor pagination returns the next page's cursor in a header, backup downloads their checksum
+    expose_headers=["X-Next-Cursor", "X-Checksum-SHA256", "ETag"],
 )
 
+# The restore request itself must not wait for the gate it closes
+GATE_EXEMPT_PATHS = {"/backups/restore", "/metrics"}
+
+@app.middleware("http")
+async def database_gate(request: Request, call_next):
+    # Held back while a restore swaps the database; the fast path is one uncontended lock
+    if request.url.path in GATE_EXEMPT_PATHS:
+        return await call_next(request)
+    if not db_gate.try_enter() and not await db_gate.enter(config.settings.RESTORE_REQUEST_WAIT_SECONDS):
+        return JSONResponse({"detail": "Database restore in progress"}, status_code=503, headers={"Retry-After": "5"})
+    try:
+        return await call_next(request)
+    finally:
+        db_gate.leave()
+
+@app.middleware("http")
+async def observe_request(request: Request, call_next):
+    # Query instrumentation (Server-Timing, N+1 detection) and Prometheus request metrics
+    started = time.perf_counter()
+    token = begin_request(f"{request.method} {request.url.path}")
+    metrics.http_requests_in_flight.inc()
+    status_code = 500
+    try:
+        response = await call_next(request)
+        status_code = response.status_code
+    finally:
+        stats = end_request(token)
+        metrics.http_requests_in_flight.dec()
+        elapsed = time.perf_counter() - started
+        metrics.metrics_for(request.scope).record(status_code, elapsed)
+    response.headers["Server-Timing"] = server_timing(stats, elapsed)
+    return response
+
 app.include_router(auth.router, prefix="/auth", tags=["auth"])
 app.include_router(projects.router, prefix="/projects", tags=["projects"])
 app.include_router(timesheets.router, prefix="/timesheets", tags=["timesheets"])
@@ -36,11 +76,25 @@ app.include_router(workdays.router, prefix="/workdays", tags=["workdays"])
 from app.api import backup
 app.include_router(backup.router, prefix="/backups", tags=["backups"])
 
+from app.api import admin
+app.include_router(admin.router, prefix="/admin", tags=["admin"])
+
 
 @app.on_event("startup")
 def on_startup():
+    metrics.register_routes(app.routes)
+    # Workers started together take turns, so tables, migrations and defaults are created once
+    with FileLock(config.settings.STARTUP_LOCK_FILE):
+        init_database()
     from app.core.scheduler import start_scheduler
     start_scheduler()
+
+@app.on_event("shutdown")
+def on_shutdown():
+    from app.core.scheduler import stop_scheduler
+    stop_scheduler()
+
+def init_database():
     create_db_and_tables()
     
     # Initialize default projects and admin user
@@ -66,3 +120,8 @@ def on_startup():
 @app.get("/")
 def read_root():
     return {"message": "Welcome to the Timesheet System API"}
+
+@app.get("/metrics", response_class=PlainTextResponse, include_in_schema=False)
+def read_metrics():
+    """Prometheus text exposition format."""
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
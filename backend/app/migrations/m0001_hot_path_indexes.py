@@ -0,0 +1,17 @@
+DESCRIPTION = "Indexes for timesheet, activity log and team lookups"
+# Index-only: on PostgreSQL the indexes are built CONCURRENTLY outside a transaction
+TRANSACTIONAL = False
+
+def upgrade(ctx):
+    # Weekly limits, compliance checks and LogWork filter timesheets by user and date range
+    ctx.create_index("ix_timesheet_user_id_date", "timesheet", ["user_id", "date"])
+    # Weekly report scans all users' timesheets by date range
+    ctx.create_index("ix_timesheet_date", "timesheet", ["date"])
+    # Activity log is always read newest first
+    ctx.create_index("ix_activitylog_timestamp", "activitylog", ["timestamp"])
+    # Team scoping (read_users, pending approvals, approval reminders)
+    ctx.create_index("ix_user_team_leader_id", "user", ["team_leader_id"])
+    # Project member lookups, the primary key only covers (user_id, project_id)
+    ctx.create_index("ix_userprojectlink_project_id", "userprojectlink", ["project_id"])
+    if ctx.is_sqlite:
+        ctx.execute("ANALYZE")
@@ -0,0 +1,13 @@
+DESCRIPTION = "Activity log indexes for keyset pagination and filters"
+TRANSACTIONAL = False
+
+def upgrade(ctx):
+    # Cursor pagination orders and seeks on (timestamp, id)
+    ctx.create_index("ix_activitylog_timestamp_id", "activitylog", ["timestamp", "id"])
+    # Filtered listings: one user's history, one action type
+    ctx.create_index("ix_activitylog_user_id_timestamp", "activitylog", ["user_id", "timestamp"])
+    ctx.create_index("ix_activitylog_action_timestamp", "activitylog", ["action", "timestamp"])
+    # Superseded by ix_activitylog_timestamp_id
+    ctx.drop_index("ix_activitylog_timestamp")
+    if ctx.is_sqlite:
+        ctx.execute("ANALYZE activitylog")
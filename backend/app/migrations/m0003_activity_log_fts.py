@@ -0,0 +1,34 @@
+DESCRIPTION = "Full-text search over activity logs"
+# The PostgreSQL GIN index is built CONCURRENTLY; SQLite still runs in one transaction
+TRANSACTIONAL = False
+
+def upgrade(ctx):
+    if not ctx.is_sqlite:
+        # Same expression as app/services/log_search.py PG_DOCUMENT
+        ctx.create_index(
+            "ix_activitylog_fts", "activitylog",
+            ["to_tsvector('simple', coalesce(action, '') || ' ' || coalesce(details, ''))"],
+            using="gin",
+        )
+        return
+
+    # External content table: the text stays in activitylog, FTS5 only stores the index
+    ctx.execute(
+        "CREATE VIRTUAL TABLE IF NOT EXISTS activitylog_fts USING fts5("
+        "action, details, content='activitylog', content_rowid='id', tokenize='unicode61')"
+    )
+    ctx.execute(
+        "CREATE TRIGGER IF NOT EXISTS activitylog_fts_ai AFTER INSERT ON activitylog BEGIN "
+        "INSERT INTO activitylog_fts(rowid, action, details) VALUES (new.id, new.action, new.details); END"
+    )
+    ctx.execute(
+        "CREATE TRIGGER IF NOT EXISTS activitylog_fts_ad AFTER DELETE ON activitylog BEGIN "
+        "INSERT INTO activitylog_fts(activitylog_fts, rowid, action, details) VALUES ('delete', old.id, old.action, old.details); END"
+    )
+    ctx.execute(
+        "CREATE TRIGGER IF NOT EXISTS activitylog_fts_au AFTER UPDATE OF action, details ON activitylog BEGIN "
+        "INSERT INTO activitylog_fts(activitylog_fts, rowid, action, details) VALUES ('delete', old.id, old.action, old.details); "
+        "INSERT INTO activitylog_fts(rowid, action, details) VALUES (new.id, new.action, new.details); END"
+    )
+    # Index the existing rows
+    ctx.execute("INSERT INTO activitylog_fts(activitylog_fts) VALUES ('rebuild')")
@@ -0,0 +1,10 @@
+DESCRIPTION = "Project indexes for filtered keyset listing"
+TRANSACTIONAL = False
+
+def upgrade(ctx):
+    # Listing pages through live projects by id
+    ctx.create_index("ix_project_is_deleted_id", "project", ["is_deleted", "id"])
+    # Status filter, same order
+    ctx.create_index("ix_project_is_deleted_status_id", "project", ["is_deleted", "status", "id"])
+    if ctx.is_sqlite:
+        ctx.execute("ANALYZE project")
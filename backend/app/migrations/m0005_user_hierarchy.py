@@ -0,0 +1,21 @@
+DESCRIPTION = "Build the user_hierarchy closure table from team_leader_id"
+TRANSACTIONAL = True
+
+# Far deeper than any org chart; stops the recursion if the data already holds a cycle
+MAX_DEPTH = 64
+
+def upgrade(ctx):
+    # The table itself comes from create_all; this fills it for the users that already exist
+    ctx.execute("DELETE FROM user_hierarchy")
+    ctx.execute(
+        "INSERT INTO user_hierarchy (ancestor_id, descendant_id, depth) "
+        "WITH RECURSIVE chain (ancestor_id, descendant_id, depth) AS ("
+        ' SELECT team_leader_id, id, 1 FROM "user" WHERE team_leader_id IS NOT NULL'
+        " UNION ALL"
+        ' SELECT u.team_leader_id, chain.descendant_id, chain.depth + 1 FROM chain JOIN "user" u ON u.id = chain.ancestor_id'
+        " WHERE u.team_leader_id IS NOT NULL AND chain.depth < :max_depth"
+        ") "
+        "SELECT ancestor_id, descendant_id, MIN(depth) FROM chain "
+        "WHERE ancestor_id <> descendant_id GROUP BY ancestor_id, descendant_id",
+        {"max_depth": MAX_DEPTH},
+    )
@@ -1,6 +1,7 @@
 from typing import Optional, List
 from datetime import datetime, date as DtDate, timezone
 from sqlmodel import Field, SQLModel, Relationship
+from sqlalchemy import Index, text
 from enum import Enum
 
 class Role(str, Enum):
@@ -34,6 +35,8 @@ class SMTPSettings(SQLModel, table=True):
 
 
 class UserProjectLink(SQLModel, table=True):
+    __table_args__ = (Index("ix_userprojectlink_project_id", "project_id"),)
+
     user_id: Optional[int] = Field(default=None, foreign_key="user.id", primary_key=True)
     project_id: Optional[int] = Field(default=None, foreign_key="project.id", primary_key=True)
 
@@ -49,7 +52,7 @@ class User(SQLModel, table=True):
     password_hash: str
     role: Role = Field(default=Role.EMPLOYEE)
     is_deleted: bool = Field(default=False)
-    team_leader_id: Optional[int] = Field(default=None, foreign_key="user.id")
+    team_leader_id: Optional[int] = Field(default=None, foreign_key="user.id", index=True)
     
     timesheets: List["Timesheet"] = Relationship(back_populates="user")
     activity_logs: List["ActivityLog"] = Relationship(back_populates="user")
@@ -58,7 +61,24 @@ class User(SQLModel, table=True):
     team_leader: Optional["User"] = Relationship(back_populates="employees", sa_relationship_kwargs={"remote_side": "User.id"})
     employees: List["User"] = Relationship(back_populates="team_leader")
 
+class UserHierarchy(SQLModel, table=True):
+    """
+    Closure table of the team_leader_id tree: one row per manager and everyone below them,
+    at any depth (1 for direct reports). Maintained by app/services/hierarchy.py.
+    """
+    __tablename__ = "user_hierarchy"
+    # Subtrees are read by the primary key (ancestor_id first), chains of managers by this one
+    __table_args__ = (Index("ix_user_hierarchy_descendant_id", "descendant_id"),)
+
+    ancestor_id: int = Field(foreign_key="user.id", primary_key=True)
+    descendant_id: int = Field(foreign_key="user.id", primary_key=True)
+    depth: int
+
 class Project(SQLModel, table=True):
+    __table_args__ = (
+        Index("ix_project_is_deleted_id", "is_deleted", "id"),
+        Index("ix_project_is_deleted_status_id", "is_deleted", "status", "id"),
+    )
     id: Optional[int] = Field(default=None, primary_key=True)
     name: str = Field(index=True, unique=True)
     full_name: Optional[str] = None
@@ -78,6 +98,11 @@ class Project(SQLModel, table=True):
     users: List["User"] = Relationship(back_populates="projects", link_model=UserProjectLink)
 
 class Timesheet(SQLModel, table=True):
+    __table_args__ = (
+        Index("ix_timesheet_user_id_date", "user_id", "date"),
+        Index("ix_timesheet_date", "date"),
+    )
+
     id: Optional[int] = Field(default=None, primary_key=True)
     user_id: int = Field(foreign_key="user.id")
     project_id: int = Field(foreign_key="project.id")
@@ -91,6 +116,18 @@ class Timesheet(SQLModel, table=True):
     project: Project = Relationship(back_populates="timesheets")
 
 class ActivityLog(SQLModel, table=True):
+    __table_args__ = (
+        Index("ix_activitylog_timestamp_id", "timestamp", "id"),
+        Index("ix_activitylog_user_id_timestamp", "user_id", "timestamp"),
+        Index("ix_activitylog_action_timestamp", "action", "timestamp"),
+        # Full-text search on PostgreSQL (app/services/log_search.py); SQLite uses the FTS5 table from migration 0003
+        Index(
+            "ix_activitylog_fts",
+            text("to_tsvector('simple', coalesce(action, '') || ' ' || coalesce(details, ''))"),
+            postgresql_using="gin",
+        ).ddl_if(dialect="postgresql"),
+    )
+
     id: Optional[int] = Field(default=None, primary_key=True)
     user_id: int = Field(foreign_key="user.id")
     action: str
@@ -98,3 +135,59 @@ class ActivityLog(SQLModel, table=True):
     timestamp: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
     
     user: User = Relationship(back_populates="activity_logs")
+
+class RefreshToken(SQLModel, table=True):
+    id: Optional[int] = Field(default=None, primary_key=True)
+    user_id: int = Field(foreign_key="user.id", index=True)
+    # Only the SHA-256 of the token is stored, the raw value is handed to the client once
+    token_hash: str = Field(index=True, unique=True)
+    # All tokens produced by rotating the same login share a family, so a replayed token revokes the whole chain
+    family_id: str = Field(index=True)
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+    expires_at: datetime
+    revoked_at: Optional[datetime] = None
+
+class SchemaVersion(SQLModel, table=True):
+    __tablename__ = "schema_version"
+
+    version: int = Field(primary_key=True)
+    description: str
+    applied_at: datetime = Field(default_factory=datetime.utcnow)
+
+class ChangeCounter(SQLModel, table=True):
+    """Bumped with every write to a cached table so workers can tell their caches are stale (app/core/cache.py)."""
+    __tablename__ = "change_counter"
+
+    name: str = Field(primary_key=True)
+    version: int = Field(default=0)
+
+class JobRun(SQLModel, table=True):
+    """One execution of a scheduled job (app/core/jobs.py)."""
+    __tablename__ = "job_run"
+    __table_args__ = (Index("ix_job_run_job_started_at", "job", "started_at"),)
+
+    id: Optional[int] = Field(default=None, primary_key=True)
+    job: str
+    trigger: str = Field(default="schedule")  # schedule, manual, catch_up
+    status: str = Field(default="running")  # running, success, failure, skipped, interrupted
+    started_at: datetime = Field(default_factory=datetime.utcnow)
+    finished_at: Optional[datetime] = None
+    duration_ms: Optional[int] = None
+    result: Optional[str] = None
+    error: Optional[str] = None
+
+class ChangeLog(SQLModel, table=True):
+    """
+    Row changes captured by SQLite triggers for point-in-time recovery (app/services/changelog.py).
+    Rows are moved to the archive in backups/wal/ by the archive_changes job.
+    """
+    __tablename__ = "change_log"
+    # AUTOINCREMENT: ids are never reused, even after archived rows are deleted
+    __table_args__ = {"sqlite_autoincrement": True}
+
+    id: Optional[int] = Field(default=None, primary_key=True)
+    changed_at: str  # UTC, 'YYYY-MM-DD HH:MM:SS.SSS', set by the trigger
+    table_name: str
+    op: str  # I, U, D
+    row_key: str  # JSON of the primary key before the change (after it for inserts)
+    data: Optional[str] = None  # JSON of the row after the change, NULL for deletes
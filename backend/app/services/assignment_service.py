@@ -0,0 +1,35 @@
+from typing import Iterable, Set, Tuple
+from sqlalchemy import tuple_
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlmodel import select
+from app.core.cache import execute_tracked
+from app.models import UserProjectLink
+
+Pair = Tuple[int, int]
+
+def current_links(session, user_ids: Iterable[int] = None, project_ids: Iterable[int] = None) -> Set[Pair]:
+    """(user_id, project_id) of the existing assignments of those users and/or projects."""
+    query = select(UserProjectLink.user_id, UserProjectLink.project_id)
+    if user_ids is not None:
+        query = query.where(UserProjectLink.user_id.in_(list(user_ids)))
+    if project_ids is not None:
+        query = query.where(UserProjectLink.project_id.in_(list(project_ids)))
+    return set(session.exec(query).all())
+
+def apply_links(session, add: Set[Pair], remove: Set[Pair]):
+    """
+    Inserts and deletes assignments with one statement each and bumps the link counter once.
+    Pairs that are already there (or already gone) are ignored; the caller commits.
+    """
+    table = UserProjectLink.__table__
+    statements = []
+    if add:
+        insert = postgresql.insert if session.get_bind().dialect.name == "postgresql" else sqlite.insert
+        statements.append(
+            insert(table)
+            .values([{"user_id": user_id, "project_id": project_id} for user_id, project_id in sorted(add)])
+            .on_conflict_do_nothing()
+        )
+    if remove:
+        statements.append(table.delete().where(tuple_(table.c.user_id, table.c.project_id).in_(sorted(remove))))
+    execute_tracked(session, UserProjectLink, *statements)
@@ -1,72 +1,246 @@
-import shutil
+import hashlib
 import os
-from datetime import datetime, timedelta, date
+import json
+import sqlite3
+import subprocess
+import time
+from contextlib import closing
+from datetime import datetime, date
 import logging
+from sqlalchemy import text
+from app.core import cache, jobs, metrics
 from app.core.config import settings
 from app.core.security import verify_password
-from app.database import engine
-from sqlmodel import Session, text
+from app.database import engine, read_engine, db_gate, create_db_and_tables, is_sqlite, sqlite_file_name, database_url
+from app.services import backup_store, changelog
+from app.services.backup_store import BACKUP_DIR, BACKUP_EXTENSIONS, UploadTooLarge, ensure_backup_dir
 import base64
 
 # Configure logging
 logger = logging.getLogger(__name__)
 
-BACKUP_DIR = "backups"
-DB_FILE = "database.db"
+DB_FILE = sqlite_file_name
+STATUS_FILE = ".backup_status.json"
+CANCEL_FILE = ".backup_cancel"
+# How far restore moves the change counters past their current values
+COUNTER_MARGIN = 1000
 
-def ensure_backup_dir():
-    if not os.path.exists(BACKUP_DIR):
-        os.makedirs(BACKUP_DIR)
+def pg_connection_args():
+    """pg_dump/pg_restore arguments and environment for the configured PostgreSQL database."""
+    args = ["--dbname", database_url.database]
+    if database_url.host:
+        args += ["--host", database_url.host]
+    if database_url.port:
+        args += ["--port", str(database_url.port)]
+    if database_url.username:
+        args += ["--username", database_url.username]
+    env = dict(os.environ)
+    if database_url.password:
+        env["PGPASSWORD"] = database_url.password
+    return args, env
+
+class BackupCancelled(Exception):
+    pass
+
+class _RestartLimit(Exception):
+    pass
+
+class RestoreBusy(Exception):
+    pass
+
+def status_path() -> str:
+    return os.path.join(BACKUP_DIR, STATUS_FILE)
+
+def cancel_path() -> str:
+    return os.path.join(BACKUP_DIR, CANCEL_FILE)
+
+def write_status(**status):
+    """Progress of the current/last backup, in a file so every worker can report it."""
+    tmp_path = f"{status_path()}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(status, f)
+    os.replace(tmp_path, status_path())
+
+def backup_status() -> dict:
+    try:
+        with open(status_path()) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {"state": "idle"}
+
+def request_cancel():
+    ensure_backup_dir()
+    open(cancel_path(), "w").close()
+
+def clear_cancel():
+    if os.path.exists(cancel_path()):
+        os.remove(cancel_path())
 
 def backup_database():
-    """Creates a timestamped copy of the database."""
+    """Creates a timestamped copy of the database. Raises if the backup failed or was cancelled."""
+    started = time.perf_counter()
+    try:
+        backup_path = run_backup()
+    except BackupCancelled:
+        metrics.backup_runs_total.labels("cancelled").inc()
+        raise
+    except Exception:
+        metrics.backup_runs_total.labels("failure").inc()
+        raise
+    metrics.backup_duration_seconds.observe(time.perf_counter() - started)
+    metrics.backup_runs_total.labels("success").inc()
+    metrics.backup_size_bytes.set(os.path.getsize(backup_path))
+    return backup_path
+
+def run_backup():
+    """Takes a snapshot into the backup store and returns its path (the previous one's if nothing changed)."""
     ensure_backup_dir()
-    timestamp = datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
-    backup_filename = f"db_{timestamp}.sqlite"
-    backup_path = os.path.join(BACKUP_DIR, backup_filename)
-    
+    created_at = datetime.now()
+    timestamp = created_at.strftime("%Y-%m-%d_%H-%M-%S")
+    if not is_sqlite:
+        backup_path = backup_postgres(os.path.join(BACKUP_DIR, backup_store.unique_name(f"db_{timestamp}", ".dump")))
+        if backup_path is None:
+            raise RuntimeError("pg_dump failed")
+        backup_store.store_file(backup_path, created_at)
+        return backup_path
+
+    # The online copy goes to a hidden file, the store compresses it into db_<timestamp>.sqlite.gz
+    raw_path = os.path.join(BACKUP_DIR, f".db_{timestamp}.sqlite")
+    status = {"state": "running", "file": f"db_{timestamp}.sqlite.gz", "started_at": created_at.isoformat()}
+    write_status(**status)
+    clear_cancel()
     try:
-        # For SQLite, a simple file copy works, though WAL mode might have separate files.
-        # Ideally we use the SQLite backup API, but for simple usage shutil.copy2 is often "good enough" 
-        # if the DB isn't under extremely heavy write load. 
-        # With WAL enabled, we should also grab -wal and -shm if they exist, or use the VACUUM INTO command.
-        # VACUUM INTO is cleaner for live backups.
-        
-        with Session(engine) as session:
-            # Requires SQLite 3.27+
-            session.exec(text(f"VACUUM INTO '{backup_path}'"))
-            
+        status.update(online_backup(raw_path, status))
+        write_status(**{**status, "state": "compressing"})
+        entry = backup_store.store_sqlite_snapshot(raw_path, created_at)
+        status.update(file=entry["filename"], size=entry["size"], raw_size=entry.get("raw_size"),
+                      sha256=entry["sha256"], deduplicated=entry.get("deduplicated", False))
+    except Exception as e:
+        if os.path.exists(raw_path):
+            os.remove(raw_path)
+        state = "cancelled" if isinstance(e, BackupCancelled) else "failed"
+        write_status(**{**status, "state": state, "error": str(e) or None, "finished_at": datetime.now().isoformat()})
+        logger.error(f"Backup {state}: {e}")
+        raise
+    finally:
+        clear_cancel()
+    write_status(**{**status, "state": "succeeded", "finished_at": datetime.now().isoformat()})
+    backup_path = os.path.join(BACKUP_DIR, entry["filename"])
+    logger.info(f"Database backed up successfully to {backup_path}")
+    return backup_path
+
+def online_backup(backup_path: str, status: dict) -> dict:
+    """
+    Copies the live database with the SQLite backup API, BACKUP_PAGES_PER_STEP pages at a time.
+    No lock is held between steps, so writers are never kept waiting on the backup.
+    A write by another connection makes SQLite restart the copy; after BACKUP_MAX_RESTARTS
+    restarts the rest is copied in one step, which in WAL mode only holds a read snapshot.
+    The copy is written to a .partial file and only renamed once PRAGMA integrity_check passes.
+    """
+    partial_path = f"{backup_path}.partial"
+    progress_state = {"restarts": 0, "remaining": None}
+
+    def progress(step_status, remaining, total):
+        if progress_state["remaining"] is not None and remaining > progress_state["remaining"]:
+            progress_state["restarts"] += 1
+            if progress_state["restarts"] > settings.BACKUP_MAX_RESTARTS:
+                raise _RestartLimit()
+        progress_state["remaining"] = remaining
+        write_status(**status, pages_total=total, pages_done=total - remaining,
+                     percent=round(100 * (total - remaining) / total, 1) if total else 100.0,
+                     restarts=progress_state["restarts"])
+        if os.path.exists(cancel_path()):
+            raise BackupCancelled("Backup cancelled")
+        time.sleep(settings.BACKUP_STEP_SLEEP_MS / 1000)
+
+    try:
+        with closing(sqlite3.connect(DB_FILE, timeout=settings.DB_WRITER_TIMEOUT)) as source, closing(sqlite3.connect(partial_path)) as target:
+            try:
+                source.backup(target, pages=settings.BACKUP_PAGES_PER_STEP, progress=progress)
+            except _RestartLimit:
+                logger.warning("Database busy, finishing the backup in a single step")
+                source.backup(target)
+            result = target.execute("PRAGMA integrity_check").fetchall()
+            pages = source.execute("PRAGMA page_count").fetchone()[0]
+        if result != [("ok",)]:
+            raise RuntimeError(f"Integrity check failed on the copy: {result[:5]}")
+        os.replace(partial_path, backup_path)
+    finally:
+        if os.path.exists(partial_path):
+            os.remove(partial_path)
+    return {"pages_total": pages, "pages_done": pages, "percent": 100.0, "restarts": progress_state["restarts"], "integrity_check": "ok"}
+
+def backup_postgres(backup_path: str):
+    """Dumps the PostgreSQL database with pg_dump (custom format)."""
+    args, env = pg_connection_args()
+    try:
+        subprocess.run(["pg_dump", "--format=custom", "--file", backup_path] + args, env=env, check=True, capture_output=True)
         logger.info(f"Database backed up successfully to {backup_path}")
         return backup_path
-    except Exception as e:
+    except (OSError, subprocess.CalledProcessError) as e:
         logger.error(f"Backup failed: {e}")
-        # Fallback to copy if VACUUM INTO fails (e.g. old sqlite version)
-        try:
-            shutil.copy2(DB_FILE, backup_path)
-            logger.info(f"Database backed up (fallback copy) to {backup_path}")
-            return backup_path
-        except Exception as copy_error:
-            logger.error(f"Fallback backup failed: {copy_error}")
-            return None
-
-def clean_old_backups(days=30):
-    """Deletes backups older than `days`."""
+        return None
+
+def clean_old_backups():
+    """Applies the daily/weekly/monthly retention to the backup store, then drops change archives no snapshot needs."""
     ensure_backup_dir()
-    cutoff_date = datetime.now() - timedelta(days=days)
-    
-    for filename in os.listdir(BACKUP_DIR):
-        if not filename.endswith(".sqlite"):
-            continue
-            
-        file_path = os.path.join(BACKUP_DIR, filename)
-        file_mtime = datetime.fromtimestamp(os.path.getmtime(file_path))
-        
-        if file_mtime < cutoff_date:
-            try:
-                os.remove(file_path)
-                logger.info(f"Deleted old backup: {filename}")
-            except Exception as e:
-                logger.error(f"Failed to delete {filename}: {e}")
+    result = backup_store.apply_retention()
+    if is_sqlite:
+        result["change_segments_deleted"] = changelog.prune_archive(backup_store.load_manifest())
+    return result
+
+class BackupUpload:
+    """
+    An uploaded backup written into the backup directory as it arrives: size-checked and hashed per
+    chunk, then validated by finish() (SQLite integrity or pg_restore --list) before it shows up in the
+    backup list. Raises ValueError for a wrong file name, UploadTooLarge past BACKUP_UPLOAD_MAX_MB.
+    """
+
+    def __init__(self, filename: str):
+        extensions = (".sqlite.gz", ".sqlite") if is_sqlite else (".dump",)
+        if not filename.endswith(extensions):
+            raise ValueError(f"Expected a {' or '.join(extensions)} file")
+        ensure_backup_dir()
+        self.filename = filename
+        self.path = os.path.join(BACKUP_DIR, f".upload_{os.getpid()}_{time.monotonic_ns()}")
+        self.limit = settings.BACKUP_UPLOAD_MAX_MB * 1024 * 1024
+        self.size = 0
+        self._digest = hashlib.sha256()
+        self._file = open(self.path, "wb")
+
+    def write(self, chunk: bytes):
+        self.size += len(chunk)
+        if self.size > self.limit:
+            raise UploadTooLarge(f"Upload exceeds {settings.BACKUP_UPLOAD_MAX_MB} MB")
+        self._digest.update(chunk)
+        self._file.write(chunk)
+
+    def finish(self, expected_sha256: str = None) -> dict:
+        """Checks the checksum and the content and adds the file to the store; the upload is gone afterwards."""
+        try:
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            self._file.close()
+            sha256 = self._digest.hexdigest()
+            if expected_sha256 and expected_sha256.lower() != sha256:
+                raise ValueError(f"Checksum mismatch: received {sha256}")
+            if is_sqlite:
+                return backup_store.add_uploaded(self.path, self.filename, sha256)
+
+            args, env = pg_connection_args()
+            listing = subprocess.run(["pg_restore", "--list", self.path], env=env, capture_output=True)
+            if listing.returncode != 0:
+                raise ValueError(f"Not a pg_dump archive: {listing.stderr.decode(errors='replace')[:200]}")
+            path = os.path.join(BACKUP_DIR, backup_store.unique_name(f"uploaded_{datetime.now():%Y-%m-%d_%H-%M-%S}", ".dump"))
+            os.replace(self.path, path)
+            return backup_store.store_file(path, datetime.now(), kind="uploaded", uploaded_as=self.filename)
+        finally:
+            self.discard()
+
+    def discard(self):
+        self._file.close()
+        if os.path.exists(self.path):
+            os.remove(self.path)
 
 def verify_super_code(super_code: str, admin_hash: str) -> bool:
     """
@@ -100,49 +274,118 @@ def verify_super_code(super_code: str, admin_hash: str) -> bool:
         logger.error(f"Super code verification error: {e}")
         return False
 
-def restore_database(filename: str):
-    """Restores the database from a backup file."""
+def restore_database(filename: str) -> dict:
+    """
+    Restores a backup into the running application, no restart needed.
+
+    The backup is verified and unpacked and a pre-restore snapshot taken first. Then
+    this worker's requests are held back (db_gate) while the data is copied into the
+    live database with the SQLite backup API, so open connections of any worker stay
+    valid and simply see the restored data. Migrations bring an older snapshot up to
+    the current schema and the change counters are moved past their current values,
+    so every worker's caches reload. downtime_ms is how long requests were held back.
+    """
     backup_path = os.path.join(BACKUP_DIR, filename)
-    if not os.path.exists(backup_path):
+    entry = backup_store.find_entry(filename)
+    if entry is None or not os.path.exists(backup_path):
         raise FileNotFoundError(f"Backup file {filename} not found")
-        
-    # We must be careful here. Replacing the DB file while the app is running is risky.
-    # Ideally, we should stop the app, swap, and restart.
-    # But for a simple app, we can try to close connections.
-    # Since we can't easily "stop" the app from within (it's running via uvicorn),
-    # we will overwrite the file.
-    
-    # 1. Create a "restore_safety" backup of current state just in case
-    timestamp = datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
-    safety_backup = f"pre_restore_{timestamp}.sqlite"
-    try:
-        shutil.copy2(DB_FILE, os.path.join(BACKUP_DIR, safety_backup))
-    except:
-        pass # If fails, proceed anyway? strict? let's proceed.
+    if is_sqlite and not filename.endswith((".sqlite.gz", ".sqlite")):
+        raise ValueError(f"{filename} is not a SQLite backup")
 
-    # 2. Overwrite DB
+    # Backups, VACUUM and the archiver must not run against data that is being replaced
+    heavy_lock = jobs.job_lock(jobs.HEAVY_LOCK)
+    if not heavy_lock.acquire(blocking=False):
+        raise RestoreBusy("A backup or maintenance job is running, try again later")
+    restore_path = f"{DB_FILE}.restore" if is_sqlite else None
     try:
-        # Dispose engine to close connections
-        engine.dispose()
-        
-        # Copy backup to DB_FILE
-        shutil.copy2(backup_path, DB_FILE)
-        
-        # IMPORTANT: Since we are in WAL mode, we must remove the old WAL/SHM files
-        # otherwise SQLite might try to use the old WAL with the new DB file, causing corruption or seeing old state.
-        for ext in ["-wal", "-shm"]:
-            wal_file = f"{DB_FILE}{ext}"
-            if os.path.exists(wal_file):
-                try:
-                    os.remove(wal_file)
-                    logger.info(f"Removed stale {ext} file during restore")
-                except Exception as wal_error:
-                    logger.warning(f"Could not remove {wal_file}: {wal_error}")
-        
-        # Re-create engine/connection? 
-        # SQLAlchemy engine usually reconnects automatically.
-        logger.info(f"Database restored from {filename}")
-        return True
+        started = time.perf_counter()
+        # Checksums verified and decompressed before anything is touched
+        if is_sqlite:
+            backup_store.extract_sqlite(filename, restore_path)
+        elif not backup_store.verify(entry):
+            raise ValueError(f"{filename} does not match its recorded checksum")
+        save_pre_restore_snapshot()
+        counters_before = read_counters()
+        if is_sqlite:
+            with engine.connect() as conn:
+                position_before = changelog.current_position(conn)
+        prepared = time.perf_counter()
+
+        if not db_gate.close(settings.RESTORE_DRAIN_SECONDS):
+            raise RestoreBusy(f"Requests still running after {settings.RESTORE_DRAIN_SECONDS}s, nothing was restored")
+        drained = time.perf_counter()
+        try:
+            if is_sqlite:
+                with closing(sqlite3.connect(restore_path)) as source, closing(sqlite3.connect(DB_FILE, timeout=settings.DB_WRITER_TIMEOUT)) as target:
+                    source.backup(target)
+            else:
+                restore_postgres(backup_path)
+            create_db_and_tables()
+            if is_sqlite:
+                changelog.after_restore(filename, position_before)
+            move_counters_past(counters_before)
+            cache.clear_all()
+        finally:
+            db_gate.open()
+            downtime = time.perf_counter() - prepared
+            metrics.restore_downtime_seconds.set(downtime)
     except Exception as e:
         logger.error(f"Restore failed: {e}")
-        raise e
+        raise
+    finally:
+        heavy_lock.release()
+        if restore_path and os.path.exists(restore_path):
+            os.remove(restore_path)
+
+    logger.info(f"Database restored from {filename}, requests held back for {downtime * 1000:.0f} ms")
+    return {
+        "filename": filename,
+        "downtime_ms": round(downtime * 1000),
+        "drain_ms": round((drained - prepared) * 1000),
+        "total_ms": round((time.perf_counter() - started) * 1000),
+    }
+
+def save_pre_restore_snapshot():
+    created_at = datetime.now()
+    if not is_sqlite:
+        safety_path = backup_postgres(os.path.join(BACKUP_DIR, f"pre_restore_{created_at:%Y-%m-%d_%H-%M-%S}.dump"))
+        if safety_path is None:
+            raise RuntimeError("Could not save pre-restore snapshot")
+        backup_store.store_file(safety_path, created_at, kind="pre_restore")
+        return
+    safety_path = os.path.join(BACKUP_DIR, f".pre_restore_{created_at:%Y-%m-%d_%H-%M-%S}.sqlite")
+    with closing(sqlite3.connect(DB_FILE, timeout=settings.DB_WRITER_TIMEOUT)) as source, closing(sqlite3.connect(safety_path)) as target:
+        source.backup(target)
+    backup_store.store_sqlite_snapshot(safety_path, created_at, kind="pre_restore")
+
+def read_counters() -> dict:
+    with engine.connect() as conn:
+        return dict(conn.execute(text("SELECT name, version FROM change_counter")).all())
+
+def move_counters_past(before: dict):
+    """
+    Sets every change counter well past both its pre-restore and its restored value.
+    The margin covers bumps other workers made between reading `before` and the copy,
+    so no worker can hold a cache built at the new version.
+    """
+    with engine.begin() as conn:
+        restored = dict(conn.execute(text("SELECT name, version FROM change_counter")).all())
+        for name in set(before) | set(restored):
+            conn.execute(
+                text(
+                    "INSERT INTO change_counter (name, version) VALUES (:name, :version) "
+                    "ON CONFLICT (name) DO UPDATE SET version = excluded.version"
+                ),
+                {"name": name, "version": max(before.get(name, 0), restored.get(name, 0)) + COUNTER_MARGIN},
+            )
+
+def restore_postgres(backup_path: str):
+    """Restores a pg_dump archive over the current PostgreSQL database, in one transaction."""
+    args, env = pg_connection_args()
+    # pg_restore --clean drops tables, which waits for every open transaction of this worker's pool
+    engine.dispose()
+    read_engine.dispose()
+    try:
+        subprocess.run(["pg_restore", "--clean", "--if-exists", "--single-transaction", backup_path] + args, env=env, check=True, capture_output=True)
+    except subprocess.CalledProcessError as e:
+        raise RuntimeError(f"pg_restore failed: {e.stderr.decode(errors='replace')}") from e
@@ -0,0 +1,333 @@
+"""
+Backup store: compressed snapshots described by a manifest.
+
+SQLite snapshots are stored gzip-compressed (`db_<timestamp>.sqlite.gz`),
+PostgreSQL ones as pg_dump archives (already compressed). `manifest.json`
+describes each file: size, SHA-256 of the stored file and of the database
+inside it, a hash of the table contents, row counts and schema version. The listing is served from the
+manifest, cached in memory until its mtime changes.
+
+A snapshot whose content hash equals the newest one's is not stored again.
+The hash covers the rows of the application tables except job bookkeeping,
+which changes with every run (including the backup's own).
+Retention is grandfather-father-son: the newest backup of each of the last
+BACKUP_KEEP_DAILY days, BACKUP_KEEP_WEEKLY ISO weeks and BACKUP_KEEP_MONTHLY
+months is kept, everything else is deleted.
+"""
+import gzip
+import hashlib
+import json
+import logging
+import os
+import shutil
+import sqlite3
+import threading
+from contextlib import closing
+from datetime import datetime
+from typing import List, Optional
+from app.core.config import settings
+from app.core.locks import FileLock
+
+logger = logging.getLogger(__name__)
+
+BACKUP_DIR = "backups"
+MANIFEST_FILE = "manifest.json"
+# Compressed SQLite snapshots, legacy uncompressed ones, PostgreSQL pg_dump archives
+BACKUP_EXTENSIONS = (".sqlite.gz", ".sqlite", ".dump")
+CHUNK_SIZE = 1024 * 1024
+# Written by the job runner and the change archiver, so they would make every snapshot unique
+UNHASHED_TABLES = {"job_run", "change_log"}
+
+class UploadTooLarge(Exception):
+    pass
+
+_cache = {"mtime": None, "entries": []}
+_cache_lock = threading.Lock()
+
+def ensure_backup_dir():
+    os.makedirs(BACKUP_DIR, exist_ok=True)
+
+def manifest_path() -> str:
+    return os.path.join(BACKUP_DIR, MANIFEST_FILE)
+
+def manifest_lock() -> FileLock:
+    ensure_backup_dir()
+    return FileLock(os.path.join(BACKUP_DIR, ".manifest.lock"))
+
+def load_manifest() -> List[dict]:
+    """Entries newest first. One stat() per call, the file is only parsed when it changed."""
+    try:
+        return _parse_manifest()
+    except FileNotFoundError:
+        if not os.path.isdir(BACKUP_DIR):
+            return []
+        with manifest_lock():
+            return _read_manifest()
+
+def _read_manifest() -> List[dict]:
+    """load_manifest() for callers already holding manifest_lock(): a missing manifest is rebuilt from the directory."""
+    if not os.path.exists(manifest_path()):
+        save_manifest(scan_backup_dir())
+    return _parse_manifest()
+
+def _parse_manifest() -> List[dict]:
+    mtime = os.stat(manifest_path()).st_mtime_ns
+    with _cache_lock:
+        if _cache["mtime"] != mtime:
+            with open(manifest_path()) as f:
+                _cache["entries"] = json.load(f)["backups"]
+            _cache["mtime"] = mtime
+        return _cache["entries"]
+
+def save_manifest(entries: List[dict]):
+    entries = sorted(entries, key=lambda e: e["created_at"], reverse=True)
+    tmp_path = f"{manifest_path()}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump({"backups": entries}, f, indent=1)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, manifest_path())
+
+def find_entry(filename: str) -> Optional[dict]:
+    return next((e for e in load_manifest() if e["filename"] == filename), None)
+
+def sha256_file(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def inspect_sqlite(path: str) -> dict:
+    """Row counts, content hash and schema version of a SQLite snapshot, in one pass over each table."""
+    from sqlmodel import SQLModel
+    import app.models  # noqa: F401  (registers all tables on SQLModel.metadata)
+    content = hashlib.sha256()
+    row_counts = {}
+    with closing(sqlite3.connect(path)) as conn:
+        # Snapshots are standalone files: no -wal/-shm next to them
+        conn.execute("PRAGMA journal_mode=DELETE")
+        existing = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+        for name in sorted(SQLModel.metadata.tables):
+            if name not in existing:
+                continue
+            count = 0
+            content.update(f"\0{name}\0".encode())
+            for row in conn.execute(f'SELECT * FROM "{name}" ORDER BY rowid'):
+                count += 1
+                if name not in UNHASHED_TABLES:
+                    content.update(repr(row).encode())
+            row_counts[name] = count
+        schema_version = conn.execute("SELECT max(version) FROM schema_version").fetchone()[0] if "schema_version" in existing else None
+        # Newest captured change contained in the snapshot, where point-in-time replay starts (app/services/changelog.py)
+        position = conn.execute("SELECT seq FROM sqlite_sequence WHERE name = 'change_log'").fetchone() if "sqlite_sequence" in existing else None
+    return {
+        "row_counts": row_counts,
+        "schema_version": schema_version,
+        "content_sha256": content.hexdigest(),
+        "changelog_position": position[0] if position else 0,
+    }
+
+def compress(src_path: str, dst_path: str) -> dict:
+    """Streams src into a gzip file, hashing the input and the output on the way."""
+    raw_digest, digest = hashlib.sha256(), hashlib.sha256()
+    raw_size = 0
+    with open(src_path, "rb") as src, open(dst_path, "wb") as raw_dst:
+        with gzip.GzipFile(fileobj=_HashingWriter(raw_dst, digest), mode="wb", compresslevel=6, mtime=0) as dst:
+            for chunk in iter(lambda: src.read(CHUNK_SIZE), b""):
+                raw_digest.update(chunk)
+                raw_size += len(chunk)
+                dst.write(chunk)
+        raw_dst.flush()
+        os.fsync(raw_dst.fileno())
+    return {"raw_size": raw_size, "raw_sha256": raw_digest.hexdigest(), "sha256": digest.hexdigest()}
+
+class _HashingWriter:
+    def __init__(self, f, digest):
+        self.f = f
+        self.digest = digest
+
+    def write(self, data):
+        self.digest.update(data)
+        return self.f.write(data)
+
+    def flush(self):
+        self.f.flush()
+
+def unique_name(stem: str, extension: str) -> str:
+    name, counter = f"{stem}{extension}", 1
+    while os.path.exists(os.path.join(BACKUP_DIR, name)):
+        name, counter = f"{stem}-{counter}{extension}", counter + 1
+    return name
+
+def store_sqlite_snapshot(raw_path: str, created_at: datetime, kind: str = "scheduled", **extra) -> dict:
+    """
+    Compresses a finished SQLite copy into the store and records it.
+    Returns the new entry, or the newest existing one (with "deduplicated": True) if the data is unchanged.
+    """
+    # The copy is complete, so it holds nothing newer than this (UTC, like the change log)
+    snapshot_at = datetime.utcnow().isoformat(sep=" ", timespec="milliseconds")
+    try:
+        details = inspect_sqlite(raw_path)
+    except Exception:
+        os.remove(raw_path)
+        raise
+    latest = next((e for e in load_manifest() if e.get("kind", "scheduled") == "scheduled"), None)
+    if kind == "scheduled" and latest and latest.get("content_sha256") == details["content_sha256"]:
+        os.remove(raw_path)
+        logger.info(f"Database unchanged since {latest['filename']}, snapshot skipped")
+        return {**latest, "deduplicated": True}
+
+    prefix = kind if kind in ("pre_restore", "pitr", "uploaded") else "db"
+    filename = unique_name(f"{prefix}_{created_at:%Y-%m-%d_%H-%M-%S}", ".sqlite.gz")
+    path = os.path.join(BACKUP_DIR, filename)
+    entry = {"filename": filename, "kind": kind, "created_at": created_at.isoformat(timespec="seconds"), "snapshot_at": snapshot_at, **details, **extra}
+    try:
+        entry.update(compress(raw_path, f"{path}.partial"))
+        os.replace(f"{path}.partial", path)
+    finally:
+        for leftover in (raw_path, f"{path}.partial"):
+            if os.path.exists(leftover):
+                os.remove(leftover)
+    entry["size"] = os.path.getsize(path)
+    add_entry(entry)
+    logger.info(f"Stored {filename}: {entry['raw_size']} -> {entry['size']} bytes")
+    return entry
+
+def store_file(path: str, created_at: datetime, kind: str = "scheduled", **extra) -> dict:
+    """Records an already written backup file (pg_dump archives)."""
+    entry = {
+        "filename": os.path.basename(path),
+        "kind": kind,
+        "created_at": created_at.isoformat(timespec="seconds"),
+        "size": os.path.getsize(path),
+        "sha256": sha256_file(path),
+        **extra,
+    }
+    add_entry(entry)
+    return entry
+
+def add_entry(entry: dict):
+    with manifest_lock():
+        entries = [e for e in _read_manifest() if e["filename"] != entry["filename"]]
+        save_manifest(entries + [entry])
+
+def scan_backup_dir() -> List[dict]:
+    """Manifest entries for files that predate the manifest (or were copied in by hand)."""
+    entries = []
+    for filename in os.listdir(BACKUP_DIR):
+        # Dot files are copies still being written
+        if filename.startswith(".") or not filename.endswith(BACKUP_EXTENSIONS):
+            continue
+        path = os.path.join(BACKUP_DIR, filename)
+        entries.append({
+            "filename": filename,
+            "kind": "pre_restore" if filename.startswith("pre_restore") else "scheduled",
+            "created_at": datetime.fromtimestamp(os.path.getmtime(path)).isoformat(timespec="seconds"),
+            "size": os.path.getsize(path),
+            "sha256": sha256_file(path),
+        })
+    return entries
+
+def verify(entry: dict) -> bool:
+    path = os.path.join(BACKUP_DIR, entry["filename"])
+    return os.path.exists(path) and sha256_file(path) == entry.get("sha256")
+
+def extract_sqlite(filename: str, dst_path: str):
+    """Writes the plain database of a SQLite backup to dst_path after checking its checksums."""
+    entry = find_entry(filename)
+    if entry is None or not filename.endswith((".sqlite.gz", ".sqlite")):
+        raise FileNotFoundError(f"Backup file {filename} not found")
+    if not verify(entry):
+        raise ValueError(f"{filename} does not match its recorded checksum")
+    src_path = os.path.join(BACKUP_DIR, filename)
+    if filename.endswith(".gz"):
+        with gzip.open(src_path, "rb") as src, open(dst_path, "wb") as dst:
+            shutil.copyfileobj(src, dst, CHUNK_SIZE)
+        if entry.get("raw_sha256") and sha256_file(dst_path) != entry["raw_sha256"]:
+            raise ValueError(f"{filename} decompressed to unexpected content")
+    else:
+        shutil.copyfile(src_path, dst_path)
+
+def add_uploaded(path: str, original_name: str, sha256: str) -> dict:
+    """
+    Checks an uploaded SQLite backup (gzip, SQLite integrity, schema of this application, not newer than
+    this code) and adds it to the store. path is consumed; raises ValueError if it is not restorable,
+    UploadTooLarge if it unpacks to more than BACKUP_UPLOAD_MAX_RAW_MB.
+    """
+    from app.core.migrations import discover_migrations
+    raw_path = path
+    try:
+        if original_name.endswith(".gz"):
+            raw_path = f"{path}.raw"
+            try:
+                # Counted while unpacking: a small gzip bomb must not fill the disk
+                limit, size = settings.BACKUP_UPLOAD_MAX_RAW_MB * 1024 * 1024, 0
+                with gzip.open(path, "rb") as src, open(raw_path, "wb") as dst:
+                    for chunk in iter(lambda: src.read(CHUNK_SIZE), b""):
+                        size += len(chunk)
+                        if size > limit:
+                            raise UploadTooLarge(f"Upload unpacks to more than {settings.BACKUP_UPLOAD_MAX_RAW_MB} MB")
+                        dst.write(chunk)
+            except (OSError, EOFError) as e:
+                raise ValueError(f"Not a valid gzip file: {e}")
+        try:
+            with closing(sqlite3.connect(f"file:{raw_path}?mode=ro", uri=True)) as conn:
+                result = conn.execute("PRAGMA integrity_check").fetchall()
+                tables = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+                schema_version = conn.execute("SELECT max(version) FROM schema_version").fetchone()[0] if "schema_version" in tables else None
+        except sqlite3.DatabaseError as e:
+            raise ValueError(f"Not a SQLite database: {e}")
+        if result != [("ok",)]:
+            raise ValueError(f"Integrity check failed: {result[:5]}")
+        if not {"user", "timesheet", "schema_version"} <= tables:
+            raise ValueError("Not a database of this application")
+        latest = max((version for version, _, _ in discover_migrations()), default=0)
+        if (schema_version or 0) > latest:
+            raise ValueError(f"Schema version {schema_version} is newer than this server ({latest})")
+        return store_sqlite_snapshot(raw_path, datetime.now(), kind="uploaded", uploaded_as=original_name, uploaded_sha256=sha256)
+    finally:
+        for leftover in {path, raw_path}:
+            if os.path.exists(leftover):
+                os.remove(leftover)
+
+def gfs_keep(entries: List[dict]) -> set:
+    """Filenames to keep: the newest backup per day, ISO week and month, within the configured counts."""
+    keep = set()
+    buckets = (
+        (settings.BACKUP_KEEP_DAILY, lambda d: d.date()),
+        (settings.BACKUP_KEEP_WEEKLY, lambda d: d.isocalendar()[:2]),
+        (settings.BACKUP_KEEP_MONTHLY, lambda d: (d.year, d.month)),
+    )
+    for count, period_of in buckets:
+        seen = []
+        for entry in sorted(entries, key=lambda e: e["created_at"], reverse=True):
+            period = period_of(datetime.fromisoformat(entry["created_at"]))
+            if period in seen:
+                continue
+            if len(seen) >= count:
+                break
+            seen.append(period)
+            keep.add(entry["filename"])
+    return keep
+
+def apply_retention() -> dict:
+    """Deletes backups outside the GFS schedule. Pre-restore and recovered (pitr) files: the newest BACKUP_KEEP_DAILY are kept."""
+    with manifest_lock():
+        entries = _read_manifest()
+        regular = [e for e in entries if e.get("kind", "scheduled") == "scheduled"]
+        others = [e for e in entries if e.get("kind", "scheduled") != "scheduled"]
+        keep = gfs_keep(regular)
+        keep |= {e["filename"] for e in sorted(others, key=lambda e: e["created_at"], reverse=True)[:settings.BACKUP_KEEP_DAILY]}
+        deleted = []
+        for entry in entries:
+            if entry["filename"] in keep:
+                continue
+            try:
+                os.remove(os.path.join(BACKUP_DIR, entry["filename"]))
+            except FileNotFoundError:
+                pass
+            deleted.append(entry["filename"])
+            logger.info(f"Deleted old backup: {entry['filename']}")
+        save_manifest([e for e in entries if e["filename"] in keep])
+    return {"deleted": deleted, "kept": len(keep)}
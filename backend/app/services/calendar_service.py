@@ -0,0 +1,115 @@
+import re
+from datetime import date, timedelta
+from typing import Dict, List, Optional
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlmodel import select
+from app.core.cache import VersionedCache, execute_tracked, track_changes
+from app.models import WorkDay, WorkDayType
+
+track_changes(WorkDay)
+
+# The calendar only holds exceptions (holidays, half days, working weekends): a few rows per year
+workday_calendar = VersionedCache(
+    WorkDay.__table__.name,
+    lambda session: {wd.date: wd.day_type for wd in session.exec(select(WorkDay))},
+)
+
+def get_calendar(session) -> Dict[date, WorkDayType]:
+    return workday_calendar.get(session)
+
+def day_type(calendar: Dict[date, WorkDayType], day: date) -> WorkDayType:
+    exception = calendar.get(day)
+    if exception:
+        return exception
+    return WorkDayType.WORK if day.weekday() < 5 else WorkDayType.OFF
+
+def weekly_limit(calendar: Dict[date, WorkDayType], start_of_week: date) -> float:
+    limit = 0.0
+    for i in range(7):
+        d_type = day_type(calendar, start_of_week + timedelta(days=i))
+        if d_type == WorkDayType.WORK:
+            limit += 8.0
+        elif d_type == WorkDayType.HALF_OFF:
+            limit += 4.0
+        # OFF adds 0
+    return limit
+
+# One event may span at most this many days (guards against a malformed DTEND)
+MAX_EVENT_DAYS = 366
+_ICS_DATE = re.compile(r"(\d{4})(\d{2})(\d{2})$")
+
+def parse_ics(content: str, day_type: WorkDayType) -> List[dict]:
+    """
+    All-day events of an iCalendar file as workday rows (SUMMARY becomes the remark); timed events
+    (a DATE-TIME in DTSTART or DTEND) are skipped. DTEND is exclusive, as in the spec.
+    Recurrence rules are not expanded: holiday feeds list each date.
+    """
+    # Unfold continuation lines (RFC 5545 3.1)
+    lines = re.sub(r"\r?\n[ \t]", "", content).splitlines()
+    rows, event = [], None
+    for line in lines:
+        name, _, value = line.partition(":")
+        name, *params = name.upper().split(";")
+        if name == "BEGIN" and value.strip().upper() == "VEVENT":
+            event = {}
+        elif name == "END" and value.strip().upper() == "VEVENT" and event is not None:
+            start = event.get("DTSTART")
+            if start and not event.get("timed"):
+                end = event.get("DTEND") or start + timedelta(days=1)
+                days = min(max((end - start).days, 1), MAX_EVENT_DAYS)
+                remark = event.get("SUMMARY")
+                rows.extend({"date": start + timedelta(days=i), "day_type": day_type, "remark": remark} for i in range(days))
+            event = None
+        elif event is not None and name in ("DTSTART", "DTEND"):
+            value = value.strip()
+            if "VALUE=DATE-TIME" in params or re.fullmatch(r"\d{8}T\d{6}Z?", value):
+                event["timed"] = True
+                continue
+            match = _ICS_DATE.match(value)
+            if not match:
+                raise ValueError(f"Invalid {name}: {value}")
+            event[name] = date(*map(int, match.groups()))
+        elif event is not None and name == "SUMMARY":
+            event[name] = value.strip().replace("\\,", ",").replace("\\;", ";")[:200]
+    return rows
+
+def import_workdays(session, rows: List[dict], replace: bool = False) -> dict:
+    """
+    Upserts calendar rows with one INSERT ... ON CONFLICT and bumps the calendar counter once.
+    With replace, exceptions between the first and last imported date that are not in rows are deleted.
+    Returns the diff against the previous calendar; the caller commits.
+    """
+    # The last row for a date wins, like applying them one by one
+    incoming = {row["date"]: row for row in rows}
+    diff = {"added": [], "changed": [], "removed": [], "unchanged": 0}
+    if not incoming:
+        return diff
+    first, last = min(incoming), max(incoming)
+    existing = {wd.date: wd for wd in session.exec(select(WorkDay).where(WorkDay.date >= first, WorkDay.date <= last))}
+
+    for day, row in sorted(incoming.items()):
+        old = existing.get(day)
+        if old is None:
+            diff["added"].append({"date": day, "day_type": row["day_type"], "remark": row.get("remark")})
+        elif (old.day_type, old.remark) != (row["day_type"], row.get("remark")):
+            diff["changed"].append({"date": day, "from": old.day_type, "to": row["day_type"], "remark": row.get("remark")})
+        else:
+            diff["unchanged"] += 1
+    removed = sorted(day for day in existing if day not in incoming) if replace else []
+    diff["removed"] = [{"date": day, "day_type": existing[day].day_type} for day in removed]
+
+    table = WorkDay.__table__
+    dialect = session.get_bind().dialect.name
+    insert = postgresql.insert if dialect == "postgresql" else sqlite.insert
+    statement = insert(table).values([
+        {"date": day, "day_type": row["day_type"], "remark": row.get("remark")} for day, row in incoming.items()
+    ])
+    statement = statement.on_conflict_do_update(
+        index_elements=[table.c.date],
+        set_={"day_type": statement.excluded.day_type, "remark": statement.excluded.remark},
+    )
+    statements = [statement] if diff["added"] or diff["changed"] else []
+    if removed:
+        statements.append(table.delete().where(table.c.date.in_(removed)))
+    execute_tracked(session, WorkDay, *statements)
+    return diff
@@ -0,0 +1,252 @@
+"""
+Continuous archiving for point-in-time recovery (SQLite).
+
+Triggers on every application table write one `change_log` row per inserted,
+updated or deleted row, in the same transaction as the change. The
+archive_changes job moves those rows every CHANGELOG_ARCHIVE_SECONDS into
+gzip NDJSON segments in backups/wal/ (`changes-<first id>-<last id>.ndjson.gz`),
+so between two nightly snapshots nothing is lost but the last few seconds.
+
+Every snapshot records the change_log position it contains (manifest
+`changelog_position`). app/tools/pitr.py rebuilds the database at any time by
+taking the newest snapshot before it and replaying the changes after its
+position. Replaying is idempotent (upserts and deletes by key).
+
+A restore starts a new timeline: it is recorded in timeline.json with the
+restored file and the position after it, and ids continue above everything
+already archived, so changes of the abandoned timeline are never replayed
+onto the new one.
+
+PostgreSQL has its own WAL archiving (archive_command, recovery_target_time);
+these triggers are only installed on SQLite.
+"""
+import gzip
+import json
+import logging
+import os
+import re
+from datetime import datetime, timezone
+from typing import Iterator, List, Optional
+from sqlalchemy import text
+from sqlmodel import SQLModel
+from app.core.config import settings
+from app.services.backup_store import BACKUP_DIR
+
+logger = logging.getLogger(__name__)
+
+ARCHIVE_DIR = os.path.join(BACKUP_DIR, "wal")
+TIMELINE_FILE = "timeline.json"
+SEGMENT_NAME = re.compile(r"^changes-(\d+)-(\d+)\.ndjson\.gz$")
+BATCH_SIZE = 5000
+TRIGGER_PREFIX = "changelog_"
+# Bookkeeping that is either derived, rewritten by every job run, or the log itself
+UNCAPTURED_TABLES = {"change_log", "change_counter", "job_run", "schema_version"}
+
+def captured_tables():
+    import app.models  # noqa: F401  (registers all tables on SQLModel.metadata)
+    return [t for t in SQLModel.metadata.sorted_tables if t.name not in UNCAPTURED_TABLES]
+
+def _json_object(table, alias: str) -> str:
+    return "json_object(" + ", ".join(f"'{c.name}', {alias}.\"{c.name}\"" for c in table.columns) + ")"
+
+def _key_object(table, alias: str) -> str:
+    return "json_object(" + ", ".join(f"'{c.name}', {alias}.\"{c.name}\"" for c in table.primary_key.columns) + ")"
+
+def trigger_statements(table) -> List[str]:
+    now = "strftime('%Y-%m-%d %H:%M:%f', 'now')"
+    insert = f"INSERT INTO change_log (changed_at, table_name, op, row_key, data) VALUES ({now}, '{table.name}'"
+    return [
+        f'CREATE TRIGGER {TRIGGER_PREFIX}{table.name}_i AFTER INSERT ON "{table.name}" BEGIN '
+        f"{insert}, 'I', {_key_object(table, 'NEW')}, {_json_object(table, 'NEW')}); END",
+        f'CREATE TRIGGER {TRIGGER_PREFIX}{table.name}_u AFTER UPDATE ON "{table.name}" BEGIN '
+        f"{insert}, 'U', {_key_object(table, 'OLD')}, {_json_object(table, 'NEW')}); END",
+        f'CREATE TRIGGER {TRIGGER_PREFIX}{table.name}_d AFTER DELETE ON "{table.name}" BEGIN '
+        f"{insert}, 'D', {_key_object(table, 'OLD')}, NULL); END",
+    ]
+
+def drop_triggers(conn):
+    names = conn.execute(
+        text("SELECT name FROM sqlite_master WHERE type = 'trigger' AND name LIKE :prefix"), {"prefix": f"{TRIGGER_PREFIX}%"}
+    ).scalars().all()
+    for name in names:
+        conn.exec_driver_sql(f'DROP TRIGGER "{name}"')
+
+def install_triggers(engine):
+    """(Re)creates the capture triggers from the current models; called after migrations at startup."""
+    if engine.dialect.name != "sqlite":
+        return
+    with engine.begin() as conn:
+        drop_triggers(conn)
+        if not settings.CHANGELOG_ENABLED:
+            return
+        for table in captured_tables():
+            for statement in trigger_statements(table):
+                conn.exec_driver_sql(statement)
+
+def _segments() -> List[tuple]:
+    """(first id, last id, filename) of the archive segments, oldest first."""
+    if not os.path.isdir(ARCHIVE_DIR):
+        return []
+    segments = []
+    for filename in os.listdir(ARCHIVE_DIR):
+        match = SEGMENT_NAME.match(filename)
+        if match:
+            segments.append((int(match.group(1)), int(match.group(2)), filename))
+    return sorted(segments)
+
+def archived_position() -> int:
+    """Id of the newest archived change, 0 if nothing was archived yet."""
+    segments = _segments()
+    return segments[-1][1] if segments else 0
+
+def _write_segment(rows: List[dict]):
+    filename = f"changes-{rows[0]['id']:012d}-{rows[-1]['id']:012d}.ndjson.gz"
+    path = os.path.join(ARCHIVE_DIR, filename)
+    payload = "".join(json.dumps(r, separators=(",", ":")) + "\n" for r in rows).encode()
+    with open(f"{path}.partial", "wb") as f:
+        f.write(gzip.compress(payload))
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(f"{path}.partial", path)
+
+def archive_changes() -> dict:
+    """
+    Moves captured changes into archive segments. A segment is written (fsync, rename) before its rows
+    are deleted; a crash in between leaves rows at or below the archived position, deleted on the next run.
+    """
+    from app.database import engine
+    os.makedirs(ARCHIVE_DIR, exist_ok=True)
+    position = archived_position()
+    archived = 0
+    while True:
+        with engine.connect() as conn:
+            rows = [dict(r) for r in conn.execute(
+                text("SELECT id, changed_at, table_name, op, row_key, data FROM change_log WHERE id > :position ORDER BY id LIMIT :limit"),
+                {"position": position, "limit": BATCH_SIZE},
+            ).mappings()]
+        if rows:
+            _write_segment(rows)
+            position = rows[-1]["id"]
+            archived += len(rows)
+        with engine.begin() as conn:
+            conn.execute(text("DELETE FROM change_log WHERE id <= :position"), {"position": position})
+        if len(rows) < BATCH_SIZE:
+            break
+    return {"archived": archived, "position": position}
+
+def current_position(conn) -> int:
+    """Highest change id ever assigned in this database (sqlite_sequence survives deletes)."""
+    row = conn.execute(text("SELECT seq FROM sqlite_sequence WHERE name = 'change_log'")).first()
+    return row[0] if row else 0
+
+def load_timeline() -> List[dict]:
+    path = os.path.join(ARCHIVE_DIR, TIMELINE_FILE)
+    if not os.path.exists(path):
+        return []
+    with open(path) as f:
+        return json.load(f)
+
+def after_restore(filename: str, position_before: int):
+    """
+    Starts a new timeline after `filename` was restored: new change ids continue above anything the old
+    timeline produced, and the restore is recorded as a recovery base.
+    """
+    from app.database import engine
+    with engine.begin() as conn:
+        position = max(current_position(conn), position_before, archived_position())
+        conn.execute(text("DELETE FROM change_log"))
+        conn.execute(text("DELETE FROM sqlite_sequence WHERE name = 'change_log'"))
+        conn.execute(text("INSERT INTO sqlite_sequence (name, seq) VALUES ('change_log', :seq)"), {"seq": position})
+    os.makedirs(ARCHIVE_DIR, exist_ok=True)
+    timeline = load_timeline() + [{
+        "restored_at": datetime.now(timezone.utc).replace(tzinfo=None).isoformat(sep=" ", timespec="milliseconds"),
+        "filename": filename,
+        "position": position,
+    }]
+    path = os.path.join(ARCHIVE_DIR, TIMELINE_FILE)
+    with open(f"{path}.tmp", "w") as f:
+        json.dump(timeline, f, indent=1)
+    os.replace(f"{path}.tmp", path)
+
+def iter_changes(after: int, until: str, live_conn=None) -> Iterator[dict]:
+    """
+    Changes with id > after and changed_at <= until (UTC, same format as changed_at), oldest first:
+    the archive first, then rows of the live change_log that were not archived yet.
+    """
+    last = after
+    for first_id, last_id, filename in _segments():
+        if last_id <= after:
+            continue
+        with gzip.open(os.path.join(ARCHIVE_DIR, filename), "rt") as f:
+            for line in f:
+                change = json.loads(line)
+                if change["id"] <= last:
+                    continue
+                # Ids follow commit order (one writer at a time), so nothing later can be older
+                if change["changed_at"] > until:
+                    return
+                last = change["id"]
+                yield change
+    if live_conn is not None:
+        for row in live_conn.execute(
+            "SELECT id, changed_at, table_name, op, row_key, data FROM change_log WHERE id > ? AND changed_at <= ? ORDER BY id",
+            (last, until),
+        ):
+            yield dict(zip(("id", "changed_at", "table_name", "op", "row_key", "data"), row))
+
+def apply_change(conn, change: dict, columns: dict):
+    """Replays one change on a sqlite3 connection. columns: table name -> columns present in that database."""
+    table = change["table_name"]
+    key = json.loads(change["row_key"])
+    where = " AND ".join(f'"{name}" IS ?' for name in key)
+    if change["op"] == "D" or (change["op"] == "U" and key != {k: json.loads(change["data"])[k] for k in key}):
+        # Deletes, and updates that changed the primary key
+        conn.execute(f'DELETE FROM "{table}" WHERE {where}', tuple(key.values()))
+    if change["op"] in ("I", "U"):
+        data = {k: v for k, v in json.loads(change["data"]).items() if k in columns[table]}
+        names = ", ".join(f'"{k}"' for k in data)
+        conn.execute(f'INSERT OR REPLACE INTO "{table}" ({names}) VALUES ({", ".join("?" * len(data))})', tuple(data.values()))
+
+def recovery_bases(entries: List[dict]) -> List[dict]:
+    """
+    Points replay can start from, newest first: snapshots with a recorded position and restores.
+    `at` is UTC in the changed_at format; a snapshot's is taken after its copy finished, so it holds nothing newer.
+    """
+    bases = []
+    for entry in entries:
+        # Recovered (pitr) and uploaded files do not hold this database's state at their snapshot time
+        if entry.get("kind", "scheduled") not in ("scheduled", "pre_restore"):
+            continue
+        if entry.get("changelog_position") is None or not entry.get("snapshot_at") or not entry["filename"].endswith((".sqlite.gz", ".sqlite")):
+            continue
+        bases.append({"at": entry["snapshot_at"], "filename": entry["filename"], "position": entry["changelog_position"]})
+    for restore in load_timeline():
+        bases.append({"at": restore["restored_at"], "filename": restore["filename"], "position": restore["position"], "restore": True})
+    return sorted(bases, key=lambda b: b["at"], reverse=True)
+
+def choose_base(entries: List[dict], until: str, filename: Optional[str] = None) -> dict:
+    bases = [b for b in recovery_bases(entries) if b["at"] <= until]
+    if filename:
+        chosen = next((b for b in bases if b["filename"] == filename), None)
+        if chosen is None:
+            raise ValueError(f"{filename} is not a recovery base before {until}")
+        # A restore between the base and the target switched timelines
+        if any(b.get("restore") and chosen["at"] < b["at"] <= until for b in bases):
+            raise ValueError(f"The database was restored after {filename}; use a newer base")
+        return chosen
+    if not bases:
+        raise ValueError(f"No snapshot with a change log position was taken before {until}")
+    return bases[0]
+
+def prune_archive(entries: List[dict]) -> int:
+    """Deletes segments that only hold changes older than every remaining recovery base."""
+    positions = [b["position"] for b in recovery_bases(entries)]
+    if not positions:
+        return 0
+    oldest = min(positions)
+    deleted = 0
+    for first_id, last_id, filename in _segments():
+        if last_id <= oldest:
+            os.remove(os.path.join(ARCHIVE_DIR, filename))
+            deleted += 1
+    return deleted
@@ -0,0 +1,95 @@
+import os
+import logging
+from sqlalchemy import text
+from app.core.config import settings
+from app.database import engine, read_engine, is_sqlite, sqlite_file_name, sqlite_pragmas
+
+logger = logging.getLogger(__name__)
+
+def wal_checkpoint():
+    """Copies the WAL back into the database and truncates it, so the -wal file does not grow unbounded."""
+    if not is_sqlite:
+        return None
+    # Through the writer pool: the checkpoint queues behind in-flight writes instead of failing on them
+    with engine.connect() as conn:
+        busy, wal_frames, checkpointed = conn.exec_driver_sql("PRAGMA wal_checkpoint(TRUNCATE)").one()
+    if busy:
+        logger.warning(f"WAL checkpoint incomplete (readers active): {checkpointed}/{wal_frames} frames")
+    else:
+        logger.info(f"WAL checkpoint done: {checkpointed} frames")
+    return {"busy": bool(busy), "wal_frames": wal_frames, "checkpointed": checkpointed}
+
+def optimize():
+    """Refreshes query planner statistics where they are stale (PRAGMA optimize, ANALYZE elsewhere)."""
+    with engine.connect() as conn:
+        if is_sqlite:
+            conn.exec_driver_sql("PRAGMA optimize")
+        else:
+            conn.execute(text("ANALYZE"))
+        conn.commit()
+    logger.info("Database statistics optimized")
+
+def incremental_vacuum(max_pages: int = 0):
+    """
+    Returns free pages to the file system. Skipped on databases created before auto_vacuum=INCREMENTAL
+    was set: converting them needs a full VACUUM, run explicitly with app.tools.convert_auto_vacuum.
+    """
+    if not is_sqlite:
+        return None
+    with engine.connect() as conn:
+        mode = conn.exec_driver_sql("PRAGMA auto_vacuum").scalar()
+        if mode != 2:
+            logger.warning("Incremental vacuum skipped: auto_vacuum is not INCREMENTAL, run python -m app.tools.convert_auto_vacuum")
+            return {"skipped": "auto_vacuum is not INCREMENTAL"}
+        freelist = conn.exec_driver_sql("PRAGMA freelist_count").scalar()
+        # incremental_vacuum frees one page per step, fetch all rows to run it to completion
+        result = conn.exec_driver_sql(f"PRAGMA incremental_vacuum({max_pages})")
+        if result.returns_rows:
+            result.fetchall()
+        conn.commit()
+    logger.info(f"Vacuum done, {freelist} free pages released")
+    return {"freed_pages": freelist}
+
+def convert_to_incremental_vacuum() -> dict:
+    """
+    Switches the database to auto_vacuum=INCREMENTAL. This rewrites the whole file with VACUUM and
+    holds the writer for the whole run, so it is only run on request, not by the scheduler.
+    """
+    with engine.connect() as conn:
+        if conn.exec_driver_sql("PRAGMA auto_vacuum").scalar() == 2:
+            return {"converted": False, "auto_vacuum": "incremental"}
+        conn.exec_driver_sql("PRAGMA auto_vacuum=INCREMENTAL")
+        conn.exec_driver_sql("VACUUM")
+        mode = conn.exec_driver_sql("PRAGMA auto_vacuum").scalar()
+    logger.info("Database converted to auto_vacuum=INCREMENTAL")
+    return {"converted": mode == 2, "auto_vacuum": {0: "none", 1: "full", 2: "incremental"}.get(mode)}
+
+def database_stats() -> dict:
+    if not is_sqlite:
+        with read_engine.connect() as conn:
+            size = conn.execute(text("SELECT pg_database_size(current_database())")).scalar()
+        return {"dialect": engine.dialect.name, "size_bytes": size}
+
+    wal_file = f"{sqlite_file_name}-wal"
+    with read_engine.connect() as conn:
+        pragma = lambda name: conn.exec_driver_sql(f"PRAGMA {name}").scalar()
+        page_size = pragma("page_size")
+        page_count = pragma("page_count")
+        freelist_count = pragma("freelist_count")
+        stats = {
+            "dialect": "sqlite",
+            "profile": settings.SQLITE_PRAGMA_PROFILE,
+            "pragmas": sqlite_pragmas(),
+            "journal_mode": pragma("journal_mode"),
+            "auto_vacuum": {0: "none", 1: "full", 2: "incremental"}.get(pragma("auto_vacuum")),
+            "page_size": page_size,
+            "page_count": page_count,
+            "freelist_count": freelist_count,
+            "free_ratio": round(freelist_count / page_count, 4) if page_count else 0.0,
+            "file_size_bytes": os.path.getsize(sqlite_file_name) if os.path.exists(sqlite_file_name) else 0,
+            "wal_size_bytes": os.path.getsize(wal_file) if os.path.exists(wal_file) else 0,
+            "cache_size": pragma("cache_size"),
+            "mmap_size": pragma("mmap_size"),
+            "temp_store": {0: "default", 1: "file", 2: "memory"}.get(pragma("temp_store")),
+        }
+    return stats
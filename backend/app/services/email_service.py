@@ -1,5 +1,6 @@
 from sqlmodel import Session, select
 from app.models import User, Role, SMTPSettings, Timesheet
+from app.services import hierarchy
 from datetime import date, timedelta
 from sqlalchemy import func
 import smtplib
@@ -104,7 +105,7 @@ def check_approval_compliance(session: Session):
         has_unapproved = session.exec(
             select(Timesheet)
             .join(User)
-            .where(User.team_leader_id == tl.id)
+            .where(User.id.in_(hierarchy.subtree_query(tl.id)))
             .where(Timesheet.date >= start_date)
             .where(Timesheet.date <= end_date)
             .where(Timesheet.hours > 0)
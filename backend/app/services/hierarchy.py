@@ -0,0 +1,95 @@
+"""
+Reporting lines (User.team_leader_id) as a closure table, so a manager's whole
+subtree is one indexed lookup instead of a walk down the tree.
+
+`user_hierarchy` holds a row for every (manager, report) pair at any depth;
+users without a manager and without reports have no rows. The rows are kept in
+step with team_leader_id by set_manager() whenever a manager changes (and
+add_new_users() for bulk imports), in the same transaction. Migration m0005 built them for existing data.
+"""
+from typing import Dict, Iterable, Optional, Set
+from sqlmodel import select
+from app.models import UserHierarchy
+
+hierarchy = UserHierarchy.__table__
+
+def is_in_subtree(session, ancestor_id: int, user_id: int) -> bool:
+    """True if user_id reports to ancestor_id, directly or through other managers (primary key lookup)."""
+    return session.exec(
+        select(UserHierarchy.depth).where(UserHierarchy.ancestor_id == ancestor_id, UserHierarchy.descendant_id == user_id)
+    ).first() is not None
+
+def subtree_query(ancestor_id: int):
+    """Ids of everyone below ancestor_id, as a subquery for `User.id.in_(...)`."""
+    return select(UserHierarchy.descendant_id).where(UserHierarchy.ancestor_id == ancestor_id)
+
+def subtree_ids(session, ancestor_id: int) -> Set[int]:
+    return set(session.exec(subtree_query(ancestor_id)).all())
+
+def outside_subtree(session, ancestor_id: int, user_ids: Iterable[int]) -> Set[int]:
+    """The user_ids that are not below ancestor_id."""
+    user_ids = set(user_ids)
+    if not user_ids:
+        return set()
+    inside = session.exec(subtree_query(ancestor_id).where(UserHierarchy.descendant_id.in_(user_ids))).all()
+    return user_ids - set(inside)
+
+def set_manager(session, user_id: int, manager_id: Optional[int]):
+    """
+    Moves user_id, with everyone below them, under manager_id (None: no manager). The caller sets
+    team_leader_id and commits. Raises ValueError if the move would make a cycle.
+    """
+    if manager_id is not None and (manager_id == user_id or is_in_subtree(session, user_id, manager_id)):
+        raise ValueError("A user cannot report to themselves or to someone who reports to them")
+    connection = session.connection()
+    # Depth of each member of the moved subtree below user_id
+    moved = {user_id: 0}
+    moved.update(connection.execute(
+        select(hierarchy.c.descendant_id, hierarchy.c.depth).where(hierarchy.c.ancestor_id == user_id)
+    ).all())
+    # Paths from the old managers into the subtree go; paths inside it stay
+    connection.execute(hierarchy.delete().where(
+        hierarchy.c.descendant_id.in_(list(moved)),
+        hierarchy.c.ancestor_id.not_in(list(moved)),
+    ))
+    if manager_id is None:
+        return
+    # Depth of manager_id below each of its managers
+    above = {manager_id: 0}
+    above.update(connection.execute(
+        select(hierarchy.c.ancestor_id, hierarchy.c.depth).where(hierarchy.c.descendant_id == manager_id)
+    ).all())
+    connection.execute(hierarchy.insert(), [
+        {"ancestor_id": ancestor, "descendant_id": descendant, "depth": up + 1 + down}
+        for ancestor, up in above.items()
+        for descendant, down in moved.items()
+    ])
+
+def add_new_users(session, managers: Dict[int, Optional[int]]):
+    """
+    Rows for users that were just inserted in bulk: managers maps each new user id to their manager,
+    an existing user or another new one. New users have no reports outside the mapping, and the
+    mapping must not contain cycles.
+    """
+    connection = session.connection()
+    # Managers of each user involved, with their depth above it
+    above: Dict[int, Dict[int, int]] = {m: {} for m in managers.values() if m is not None and m not in managers}
+    if above:
+        for ancestor, descendant, depth in connection.execute(
+            select(hierarchy.c.ancestor_id, hierarchy.c.descendant_id, hierarchy.c.depth).where(hierarchy.c.descendant_id.in_(list(above)))
+        ):
+            above[descendant][ancestor] = depth
+
+    def chain(user_id: int) -> Dict[int, int]:
+        if user_id not in above:
+            manager = managers[user_id]
+            above[user_id] = {} if manager is None else {manager: 1, **{a: d + 1 for a, d in chain(manager).items()}}
+        return above[user_id]
+
+    rows = [
+        {"ancestor_id": ancestor, "descendant_id": user_id, "depth": depth}
+        for user_id in managers
+        for ancestor, depth in chain(user_id).items()
+    ]
+    if rows:
+        connection.execute(hierarchy.insert(), rows)
@@ -0,0 +1,211 @@
+"""
+Activity log retention.
+
+Logs older than ACTIVITY_LOG_RETENTION_DAYS are moved out of the database into
+monthly, append-only archive files (`activitylog-YYYY-MM.ndjson.gz`, one JSON
+object per line). Every archiving batch is appended as a separate gzip member,
+so files never need rewriting; readers decompress them as one stream.
+
+`index.json` holds, per month, the committed file size, row count and time
+range, plus the (timestamp, id) watermark of the newest archived row. The order
+of a batch is append + fsync, then index, then delete from the database:
+- a crash before the index is written leaves bytes past the recorded size, which are truncated on the next run;
+- a crash before the delete leaves rows at or below the watermark, which the next run deletes without archiving them again.
+"""
+import gzip
+import heapq
+import json
+import logging
+import os
+from datetime import datetime, timedelta
+from typing import Iterator, List, Optional, Tuple
+from sqlalchemy import tuple_
+from sqlmodel import Session, select, delete
+from app.core.config import settings
+from app.database import engine
+from app.models import ActivityLog, User
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = 5000
+INDEX_FILE = "index.json"
+
+def archive_dir() -> str:
+    return settings.ACTIVITY_LOG_ARCHIVE_DIR
+
+def month_file(month: str) -> str:
+    return f"activitylog-{month}.ndjson.gz"
+
+def load_index() -> dict:
+    path = os.path.join(archive_dir(), INDEX_FILE)
+    if not os.path.exists(path):
+        return {"watermark": None, "months": {}}
+    with open(path) as f:
+        return json.load(f)
+
+def save_index(index: dict):
+    path = os.path.join(archive_dir(), INDEX_FILE)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(index, f, indent=1, sort_keys=True)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+def repair(index: dict):
+    """Drops bytes appended after the last index update (interrupted run)."""
+    for month, entry in index["months"].items():
+        path = os.path.join(archive_dir(), entry["file"])
+        if os.path.exists(path) and os.path.getsize(path) > entry["bytes"]:
+            logger.warning(f"Truncating uncommitted tail of {entry['file']}")
+            with open(path, "r+b") as f:
+                f.truncate(entry["bytes"])
+
+def serialize(log: ActivityLog, username: Optional[str]) -> dict:
+    return {
+        "id": log.id,
+        "user_id": log.user_id,
+        "username": username,
+        "action": log.action,
+        "details": log.details,
+        "timestamp": log.timestamp.isoformat(),
+    }
+
+def append_month(index: dict, month: str, records: List[dict]):
+    entry = index["months"].setdefault(month, {"file": month_file(month), "bytes": 0, "count": 0, "min_ts": None, "max_ts": None})
+    path = os.path.join(archive_dir(), entry["file"])
+    payload = "".join(json.dumps(r, separators=(",", ":")) + "\n" for r in records).encode()
+    with open(path, "ab") as f:
+        f.write(gzip.compress(payload))
+        f.flush()
+        os.fsync(f.fileno())
+        entry["bytes"] = f.tell()
+    entry["count"] += len(records)
+    timestamps = [r["timestamp"] for r in records]
+    entry["min_ts"] = min(filter(None, [entry["min_ts"], min(timestamps)]))
+    entry["max_ts"] = max(filter(None, [entry["max_ts"], max(timestamps)]))
+
+def archive_old_logs(days: Optional[int] = None) -> dict:
+    """Moves activity logs older than the retention period into the archive."""
+    days = settings.ACTIVITY_LOG_RETENTION_DAYS if days is None else days
+    if days <= 0:
+        return {"archived": 0, "disabled": True}
+    os.makedirs(archive_dir(), exist_ok=True)
+    index = load_index()
+    repair(index)
+    cutoff = datetime.utcnow() - timedelta(days=days)
+    archived = 0
+
+    with Session(engine) as session:
+        while True:
+            query = (
+                select(ActivityLog, User.username)
+                .outerjoin(User, ActivityLog.user_id == User.id)
+                .where(ActivityLog.timestamp < cutoff)
+                .order_by(ActivityLog.timestamp, ActivityLog.id)
+                .limit(BATCH_SIZE)
+            )
+            if index["watermark"]:
+                watermark_ts, watermark_id = index["watermark"]
+                query = query.where(tuple_(ActivityLog.timestamp, ActivityLog.id) > (datetime.fromisoformat(watermark_ts), watermark_id))
+            rows = session.exec(query).all()
+
+            if rows:
+                by_month = {}
+                for log, username in rows:
+                    by_month.setdefault(log.timestamp.strftime("%Y-%m"), []).append(serialize(log, username))
+                for month, records in by_month.items():
+                    append_month(index, month, records)
+                last = rows[-1][0]
+                index["watermark"] = [last.timestamp.isoformat(), last.id]
+                save_index(index)
+                archived += len(rows)
+
+            # Also removes rows archived by a run that died before its delete
+            if index["watermark"]:
+                watermark_ts, watermark_id = index["watermark"]
+                session.exec(delete(ActivityLog).where(
+                    tuple_(ActivityLog.timestamp, ActivityLog.id) <= (datetime.fromisoformat(watermark_ts), watermark_id)
+                ))
+                session.commit()
+            if len(rows) < BATCH_SIZE:
+                break
+
+    logger.info(f"Archived {archived} activity logs older than {cutoff:%Y-%m-%d}")
+    return {"archived": archived, "cutoff": cutoff.isoformat()}
+
+def iter_month(entry: dict) -> Iterator[dict]:
+    """Streams one month's records; only the committed part of the file is read."""
+    path = os.path.join(archive_dir(), entry["file"])
+    if not os.path.exists(path):
+        return
+    with open(path, "rb") as raw:
+        with gzip.GzipFile(fileobj=_Limited(raw, entry["bytes"])) as f:
+            for line in f:
+                yield json.loads(line)
+
+class _Limited:
+    """Read-only file wrapper that stops at `limit` bytes."""
+
+    def __init__(self, f, limit: int):
+        self.f = f
+        self.remaining = limit
+
+    def read(self, size: int = -1) -> bytes:
+        if size < 0 or size > self.remaining:
+            size = self.remaining
+        data = self.f.read(size)
+        self.remaining -= len(data)
+        return data
+
+def query_archive(
+    limit: int,
+    before: Optional[Tuple[datetime, int]] = None,
+    user_id: Optional[int] = None,
+    action: Optional[str] = None,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+) -> List[dict]:
+    """
+    Newest-first archived logs matching the filters, older than the (timestamp, id) key `before`.
+    Months outside the range are skipped from the index; the others are decompressed as a stream
+    and only the `limit` newest matches are kept in memory.
+    """
+    index = load_index()
+    results = []
+    for month in sorted(index["months"], reverse=True):
+        entry = index["months"][month]
+        min_ts, max_ts = datetime.fromisoformat(entry["min_ts"]), datetime.fromisoformat(entry["max_ts"])
+        if (start and max_ts < start) or (end and min_ts >= end) or (before and min_ts > before[0]):
+            continue
+
+        def matches():
+            for record in iter_month(entry):
+                ts = datetime.fromisoformat(record["timestamp"])
+                if user_id is not None and record["user_id"] != user_id:
+                    continue
+                if action and record["action"] != action:
+                    continue
+                if (start and ts < start) or (end and ts >= end):
+                    continue
+                key = (ts, record["id"])
+                if before and key >= before:
+                    continue
+                yield key, record
+
+        results.extend(r for _, r in heapq.nlargest(limit - len(results), matches(), key=lambda m: m[0]))
+        # Months are disjoint and visited newest first: once the page is full, older months cannot contribute
+        if len(results) >= limit:
+            break
+    return results
+
+def archive_summary() -> dict:
+    index = load_index()
+    return {
+        "retention_days": settings.ACTIVITY_LOG_RETENTION_DAYS,
+        "watermark": index["watermark"],
+        "months": [
+            {"month": month, **entry}
+            for month, entry in sorted(index["months"].items(), reverse=True)
+        ],
+    }
@@ -0,0 +1,106 @@
+"""
+Full-text search over activity logs.
+
+SQLite uses the `activitylog_fts` FTS5 table (external content, kept in sync by
+triggers, see migration 0003), PostgreSQL a GIN index on a tsvector of the same
+columns. User input is parsed into terms here and re-quoted for each engine, so
+FTS syntax characters in a search box can never produce a query error.
+
+Supported syntax: words (all must match), "quoted phrases" and prefix*.
+"""
+import re
+from typing import List, Optional, Tuple
+from sqlalchemy import DateTime, bindparam, text
+
+_TOKEN = re.compile(r'"([^"]*)"|(\S+)')
+_WORD = re.compile(r"\w+", re.UNICODE)
+
+# Same expression as the ix_activitylog_fts index on PostgreSQL
+PG_DOCUMENT = "to_tsvector('simple', coalesce(a.action, '') || ' ' || coalesce(a.details, ''))"
+
+class Term:
+    def __init__(self, words: List[str], prefix: bool = False):
+        self.words = words
+        self.prefix = prefix
+
+def parse_query(q: str) -> List[Term]:
+    terms = []
+    for phrase, word in _TOKEN.findall(q):
+        words = _WORD.findall(phrase or word)
+        if words:
+            terms.append(Term(words, prefix=bool(word) and word.endswith("*")))
+    return terms
+
+def fts5_query(terms: List[Term]) -> str:
+    parts = []
+    for term in terms:
+        quoted = '"' + " ".join(term.words) + '"'
+        parts.append(quoted + "*" if term.prefix else quoted)
+    return " ".join(parts)
+
+def pg_tsquery(terms: List[Term]) -> str:
+    parts = []
+    for term in terms:
+        words = [w.lower() for w in term.words]
+        if term.prefix:
+            words[-1] += ":*"
+        parts.append("(" + " <-> ".join(words) + ")" if len(words) > 1 else words[0])
+    return " & ".join(parts)
+
+def search_statement(
+    dialect: str,
+    terms: List[Term],
+    limit: int,
+    after: Optional[Tuple[float, int]] = None,
+    user_id: Optional[int] = None,
+    action: Optional[str] = None,
+    start=None,
+    end=None,
+):
+    """
+    Best matches first, ordered by (rank, id DESC), where a lower rank is better.
+    `after` is the (rank, id) of the last row of the previous page.
+    """
+    params = {"limit": limit}
+    filters = []
+    if user_id is not None:
+        filters.append("a.user_id = :user_id")
+        params["user_id"] = user_id
+    if action:
+        filters.append("a.action = :action")
+        params["action"] = action
+    if start:
+        filters.append("a.timestamp >= :start")
+        params["start"] = start
+    if end:
+        filters.append("a.timestamp < :end")
+        params["end"] = end
+
+    if dialect == "sqlite":
+        params["q"] = fts5_query(terms)
+        rank = "activitylog_fts.rank"
+        source = "activitylog_fts JOIN activitylog a ON a.id = activitylog_fts.rowid"
+        match = "activitylog_fts MATCH :q"
+        snippet = "snippet(activitylog_fts, 1, '[', ']', '…', 12)"
+    else:
+        params["q"] = pg_tsquery(terms)
+        # ts_rank is higher-is-better, negated so both engines sort ascending
+        rank = f"-ts_rank({PG_DOCUMENT}, to_tsquery('simple', :q))"
+        source = "activitylog a"
+        match = f"{PG_DOCUMENT} @@ to_tsquery('simple', :q)"
+        snippet = "ts_headline('simple', coalesce(a.details, ''), to_tsquery('simple', :q), 'StartSel=[, StopSel=], MaxWords=24')"
+
+    if after:
+        filters.append(f"({rank} > :after_rank OR ({rank} = :after_rank AND a.id < :after_id))")
+        params["after_rank"], params["after_id"] = after
+
+    sql = (
+        f"SELECT a.id, a.user_id, a.action, a.details, a.timestamp, u.username, {rank} AS rank, {snippet} AS snippet "
+        f'FROM {source} LEFT JOIN "user" u ON u.id = a.user_id '
+        f"WHERE {' AND '.join([match] + filters)} "
+        "ORDER BY rank, a.id DESC LIMIT :limit"
+    )
+    statement = text(sql)
+    # Typed so SQLite gets the same datetime string format the ORM stores
+    statement = statement.bindparams(*(bindparam(name, type_=DateTime) for name in ("start", "end") if name in params))
+    return statement, params
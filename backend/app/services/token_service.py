@@ -0,0 +1,86 @@
+import uuid
+import logging
+from datetime import datetime, timedelta
+from typing import Optional, Tuple
+from sqlmodel import Session, select, delete, update
+from app.core.config import settings
+from app.core.security import generate_refresh_token, hash_refresh_token
+from app.database import engine
+from app.models import RefreshToken, User
+
+logger = logging.getLogger(__name__)
+
+def issue_refresh_token(session: Session, user: User, family_id: Optional[str] = None) -> str:
+    """Creates a refresh token for the user and returns the raw token. Caller commits."""
+    raw_token = generate_refresh_token()
+    session.add(RefreshToken(
+        user_id=user.id,
+        token_hash=hash_refresh_token(raw_token),
+        family_id=family_id or uuid.uuid4().hex,
+        expires_at=datetime.utcnow() + timedelta(days=settings.REFRESH_TOKEN_EXPIRE_DAYS),
+    ))
+    return raw_token
+
+def rotate_refresh_token(session: Session, raw_token: str) -> Optional[Tuple[User, str]]:
+    """
+    Exchanges a refresh token for a new one in the same family.
+    Returns (user, new_raw_token), or None if the token is unknown, expired or revoked.
+    Presenting an already rotated token revokes the whole family (token theft).
+    """
+    now = datetime.utcnow()
+    token = session.exec(
+        select(RefreshToken).where(RefreshToken.token_hash == hash_refresh_token(raw_token))
+    ).first()
+    if not token:
+        return None
+
+    if token.revoked_at is not None:
+        logger.warning(f"Refresh token reuse detected for user {token.user_id}, revoking family {token.family_id}")
+        revoke_family(session, token.family_id)
+        session.commit()
+        return None
+
+    if token.expires_at < now:
+        return None
+
+    user = session.get(User, token.user_id)
+    if not user or user.is_deleted:
+        return None
+
+    token.revoked_at = now
+    session.add(token)
+    new_raw_token = issue_refresh_token(session, user, family_id=token.family_id)
+    session.commit()
+    return user, new_raw_token
+
+def revoke_family(session: Session, family_id: str):
+    session.exec(
+        update(RefreshToken)
+        .where(RefreshToken.family_id == family_id)
+        .where(RefreshToken.revoked_at == None)
+        .values(revoked_at=datetime.utcnow())
+    )
+
+def revoke_refresh_token(session: Session, raw_token: str):
+    """Revokes the token's whole family (logout). Caller commits."""
+    token = session.exec(
+        select(RefreshToken).where(RefreshToken.token_hash == hash_refresh_token(raw_token))
+    ).first()
+    if token:
+        revoke_family(session, token.family_id)
+
+def revoke_user_tokens(session: Session, user_id: int):
+    """Revokes every refresh token of a user, e.g. after a password change. Caller commits."""
+    session.exec(
+        update(RefreshToken)
+        .where(RefreshToken.user_id == user_id)
+        .where(RefreshToken.revoked_at == None)
+        .values(revoked_at=datetime.utcnow())
+    )
+
+def clean_expired_refresh_tokens():
+    """Deletes expired refresh tokens. Revoked ones are kept until expiry for reuse detection."""
+    with Session(engine) as session:
+        result = session.exec(delete(RefreshToken).where(RefreshToken.expires_at < datetime.utcnow()))
+        session.commit()
+        logger.info(f"Deleted {result.rowcount} expired refresh tokens")
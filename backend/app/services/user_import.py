@@ -0,0 +1,261 @@
+"""
+Bulk user import from a CSV or XLSX file (POST /users/import).
+
+Rows are read one at a time and checked against sets loaded once up front
+(usernames, cost centers, team leaders) instead of a query per row. Argon2 is
+slow on purpose, so the passwords of the valid rows are hashed in a process
+pool across all cores, before the writer connection is touched: on SQLite
+there is only one, and every other write would queue behind the hashing. The
+writer transaction then only inserts the users with one statement, their
+hierarchy rows and the log entry. Invalid rows are skipped and reported with
+their errors.
+"""
+import csv
+import io
+import multiprocessing
+import os
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date, datetime
+from typing import Dict, Iterator, List, Optional, Tuple
+from sqlalchemy import bindparam
+from sqlalchemy.exc import IntegrityError
+from sqlmodel import select
+from app.api.cost_centers import load_cost_centers
+from app.core.config import settings
+from app.core.security import get_password_hash
+from app.models import ActivityLog, Role, User
+from app.services import hierarchy
+
+COLUMNS = ("username", "password", "full_name", "email", "role", "cost_center", "team_leader", "start_date", "end_date", "remark")
+REQUIRED_COLUMNS = ("username", "password")
+MAX_ROWS = 5000
+MIN_PASSWORD_LENGTH = 6
+
+def _header(values) -> List[str]:
+    return [str(v or "").strip().lower().replace(" ", "_") for v in values]
+
+def _check_header(header: List[str]):
+    missing = [c for c in REQUIRED_COLUMNS if c not in header]
+    if missing:
+        raise ValueError(f"Missing columns: {', '.join(missing)} (the first row must name the columns)")
+
+def _read_csv(file) -> Iterator[Tuple[int, dict]]:
+    text = io.TextIOWrapper(file, encoding="utf-8-sig", newline="")
+    try:
+        reader = csv.reader(text)
+        header = _header(next(reader, []))
+        _check_header(header)
+        for values in reader:
+            if any(v.strip() for v in values):
+                yield reader.line_num, dict(zip(header, values))
+    except UnicodeDecodeError:
+        raise ValueError("CSV files must be UTF-8 encoded")
+    finally:
+        # Leave the upload's file open, FastAPI closes it
+        text.detach()
+
+def _read_xlsx(file) -> Iterator[Tuple[int, dict]]:
+    try:
+        from openpyxl import load_workbook
+    except ImportError:
+        raise ValueError("XLSX import needs openpyxl on the server; upload a CSV file instead")
+    try:
+        # read_only streams the sheet instead of loading every cell
+        workbook = load_workbook(file, read_only=True, data_only=True)
+    except (zipfile.BadZipFile, KeyError, OSError):
+        raise ValueError("Not a valid XLSX file")
+    try:
+        rows = workbook.active.iter_rows(values_only=True)
+        header = _header(next(rows, []))
+        _check_header(header)
+        for number, values in enumerate(rows, start=2):
+            if any(v not in (None, "") for v in values):
+                yield number, dict(zip(header, values))
+    finally:
+        workbook.close()
+
+def read_rows(file, filename: str) -> Iterator[Tuple[int, dict]]:
+    """(row number in the file, {column: value}) per non-empty data row."""
+    if filename.lower().endswith((".xlsx", ".xlsm")):
+        return _read_xlsx(file)
+    return _read_csv(file)
+
+def _text(value) -> Optional[str]:
+    if value is None:
+        return None
+    if isinstance(value, float) and value.is_integer():
+        # Spreadsheets store numeric passwords and ids as floats
+        value = int(value)
+    value = str(value).strip()
+    return value or None
+
+def _date(value, column: str, errors: List[str]) -> Optional[date]:
+    if value in (None, ""):
+        return None
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    try:
+        return date.fromisoformat(str(value).strip())
+    except ValueError:
+        errors.append(f"{column} must be a date (YYYY-MM-DD)")
+        return None
+
+def _parse(number: int, raw: dict, usernames: set, cost_centers: set) -> dict:
+    errors = []
+    values = {column: _text(raw.get(column)) for column in COLUMNS if column not in ("start_date", "end_date")}
+    username = values["username"]
+    if not username:
+        errors.append("username is required")
+    elif username in usernames:
+        errors.append("username already exists")
+    password = values["password"]
+    if not password or len(password) < MIN_PASSWORD_LENGTH:
+        errors.append(f"password must have at least {MIN_PASSWORD_LENGTH} characters")
+    role = None
+    try:
+        role = Role((values["role"] or Role.EMPLOYEE.value).lower())
+    except ValueError:
+        errors.append(f"role must be one of {', '.join(r.value for r in Role)}")
+    if values["cost_center"] and values["cost_center"] not in cost_centers:
+        errors.append(f"unknown cost center {values['cost_center']}")
+    start_date = _date(raw.get("start_date"), "start_date", errors)
+    end_date = _date(raw.get("end_date"), "end_date", errors)
+    if start_date and end_date and end_date < start_date:
+        errors.append("end_date is before start_date")
+    return {
+        "row": number, "username": username, "password": password, "role": role, "team_leader": values["team_leader"],
+        "user": {
+            "username": username, "full_name": values["full_name"], "email": values["email"], "role": role,
+            "cost_center": values["cost_center"], "remark": values["remark"],
+            "start_date": start_date, "end_date": end_date, "is_deleted": False,
+        },
+        "errors": errors,
+    }
+
+def _resolve_leaders(entries: List[dict], leaders: Dict[str, int], current_user: User, allowed_leaders: Optional[set]):
+    """Sets "leader" (existing id) or "new_leader" (username of a new row) on each entry, or adds errors."""
+    new_leaders = {}
+    for entry in entries:
+        if entry["role"] == Role.TEAM_LEADER and entry["username"]:
+            # The first row of a repeated username is the one that counts
+            new_leaders.setdefault(entry["username"], entry)
+    for entry in entries:
+        name = entry["team_leader"]
+        if current_user.role == Role.TEAM_LEADER:
+            if entry["role"] not in (None, Role.EMPLOYEE):
+                entry["errors"].append("Team Leaders can only create Employees")
+            # Their own team by default, or a team leader below them
+            name = name or current_user.username
+            if name not in leaders or leaders[name] not in allowed_leaders:
+                entry["errors"].append(f"{name} is not a team leader in your team")
+                continue
+        if not name:
+            entry["leader"] = None
+        elif name in leaders:
+            entry["leader"] = leaders[name]
+        elif name in new_leaders and name != entry["username"]:
+            entry["new_leader"] = name
+        else:
+            entry["errors"].append(f"unknown team leader {name}")
+
+    # A row that depends on a rejected row, or on a cycle of new rows, is rejected as well
+    changed = True
+    while changed:
+        changed = False
+        for entry in entries:
+            if entry["errors"] or "new_leader" not in entry:
+                continue
+            seen = {entry["username"]}
+            leader = new_leaders[entry["new_leader"]]
+            while not leader["errors"] and "new_leader" in leader and leader["username"] not in seen:
+                seen.add(leader["username"])
+                leader = new_leaders[leader["new_leader"]]
+            if leader["errors"]:
+                entry["errors"].append(f"team leader {entry['new_leader']} is not imported")
+                changed = True
+            elif leader["username"] in seen:
+                entry["errors"].append("team leaders of the imported rows form a cycle")
+                changed = True
+
+def hash_passwords(passwords: List[str]) -> List[str]:
+    workers = min(len(passwords), settings.USER_IMPORT_WORKERS or os.cpu_count() or 1)
+    if workers <= 1:
+        return [get_password_hash(p) for p in passwords]
+    # spawn: forking a server process that runs threads (scheduler, thread pools) is not safe
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn")) as pool:
+        return list(pool.map(get_password_hash, passwords, chunksize=max(1, len(passwords) // (workers * 4))))
+
+def import_users(read_session, session, file, filename: str, current_user: User, dry_run: bool = False) -> dict:
+    """
+    Checks the file on read_session and creates the valid rows in one transaction on session
+    (nothing with dry_run), then commits. Raises ValueError if the file itself cannot be read.
+    """
+    usernames = set(read_session.exec(select(User.username)).all())
+    cost_centers = set(load_cost_centers())
+    leaders = dict(read_session.exec(
+        select(User.username, User.id).where(User.role == Role.TEAM_LEADER, User.is_deleted == False)
+    ).all())
+    allowed_leaders = None
+    if current_user.role == Role.TEAM_LEADER:
+        allowed_leaders = hierarchy.subtree_ids(read_session, current_user.id) | {current_user.id}
+    # Do not keep a read snapshot open while the file is parsed and hashed
+    read_session.close()
+
+    entries = []
+    seen = set()
+    for number, raw in read_rows(file, filename):
+        if len(entries) >= MAX_ROWS:
+            raise ValueError(f"At most {MAX_ROWS} users per import")
+        entry = _parse(number, raw, usernames, cost_centers)
+        if entry["username"] and entry["username"] in seen:
+            entry["errors"].append("username appears more than once in the file")
+        seen.add(entry["username"])
+        entries.append(entry)
+    if not entries:
+        raise ValueError("The file has no user rows")
+    _resolve_leaders(entries, leaders, current_user, allowed_leaders)
+
+    valid = [e for e in entries if not e["errors"]]
+    if valid and not dry_run:
+        hashes = hash_passwords([e["password"] for e in valid])
+        # First statement on the writer: the connection is checked out from here to the commit
+        table = User.__table__
+        connection = session.connection()
+        try:
+            connection.execute(table.insert(), [
+                {**e["user"], "password_hash": h, "team_leader_id": e.get("leader")} for e, h in zip(valid, hashes)
+            ])
+        except IntegrityError:
+            session.rollback()
+            raise ValueError("Some of the usernames were created while the file was imported; import it again")
+        ids = dict(session.exec(select(User.username, User.id).where(User.username.in_([e["username"] for e in valid]))).all())
+        # Leaders created by this import only have ids now
+        followers = [{"user_id": ids[e["username"]], "leader_id": ids[e["new_leader"]]} for e in valid if "new_leader" in e]
+        if followers:
+            connection.execute(
+                table.update().where(table.c.id == bindparam("user_id")).values(team_leader_id=bindparam("leader_id")),
+                followers,
+            )
+        hierarchy.add_new_users(session, {
+            ids[e["username"]]: ids[e["new_leader"]] if "new_leader" in e else e["leader"] for e in valid
+        })
+        session.add(ActivityLog(
+            user_id=current_user.id,
+            action="IMPORT_USERS",
+            details=f"Imported {len(valid)} users from {filename or 'upload'} ({len(entries) - len(valid)} rows rejected)",
+        ))
+        session.commit()
+
+    status = "valid" if dry_run else "created"
+    return {
+        "dry_run": dry_run,
+        "created": 0 if dry_run else len(valid),
+        "rejected": len(entries) - len(valid),
+        "rows": [
+            {"row": e["row"], "username": e["username"], "status": "error" if e["errors"] else status, "errors": e["errors"]}
+            for e in entries
+        ],
+    }
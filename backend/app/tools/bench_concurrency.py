@@ -0,0 +1,80 @@
+"""
+Throughput benchmark for the read endpoints under many concurrent clients.
+
+Usage (against a running backend, requires `pip install httpx`):
+    python -m app.tools.bench_concurrency --url http://localhost:8003 \
+        --username admin --password admin123 --clients 200 --duration 15
+
+Every endpoint is hammered separately by N clients for the given duration, and
+requests/s plus latency percentiles are printed. Run it once against the
+current tree and once against a checkout with sync endpoints to compare.
+"""
+import argparse
+import asyncio
+import statistics
+import time
+
+DEFAULT_PATHS = [
+    "/timesheets/",
+    "/projects/",
+    "/workdays/",
+    "/users/me/compliance",
+    "/users/me/pending-approvals",
+    "/activity_logs/",
+]
+
+async def client_loop(client, path, headers, deadline, latencies, errors):
+    while time.perf_counter() < deadline:
+        started = time.perf_counter()
+        try:
+            response = await client.get(path, headers=headers)
+            if response.status_code >= 400:
+                errors.append(response.status_code)
+            else:
+                latencies.append(time.perf_counter() - started)
+        except Exception as e:
+            errors.append(type(e).__name__)
+
+async def bench_path(client, path, headers, clients, duration):
+    latencies, errors = [], []
+    deadline = time.perf_counter() + duration
+    await asyncio.gather(*[client_loop(client, path, headers, deadline, latencies, errors) for _ in range(clients)])
+    return latencies, errors
+
+def percentile(values, p):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))]
+
+async def run(args):
+    import httpx
+
+    limits = httpx.Limits(max_connections=args.clients, max_keepalive_connections=args.clients)
+    async with httpx.AsyncClient(base_url=args.url, limits=limits, timeout=60) as client:
+        login = await client.post("/auth/token", data={"username": args.username, "password": args.password})
+        login.raise_for_status()
+        headers = {"Authorization": f"Bearer {login.json()['access_token']}"}
+
+        print(f"{args.clients} concurrent clients, {args.duration}s per endpoint")
+        print(f"{'endpoint':32} {'req/s':>9} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'errors':>7}")
+        for path in args.paths:
+            latencies, errors = await bench_path(client, path, headers, args.clients, args.duration)
+            print(
+                f"{path:32} {len(latencies) / args.duration:9.1f} "
+                f"{statistics.median(latencies) * 1000 if latencies else 0:9.1f} "
+                f"{percentile(latencies, 0.95) * 1000:9.1f} {percentile(latencies, 0.99) * 1000:9.1f} {len(errors):7}"
+            )
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Concurrent read throughput benchmark")
+    parser.add_argument("--url", default="http://localhost:8003")
+    parser.add_argument("--username", default="admin")
+    parser.add_argument("--password", default="admin123")
+    parser.add_argument("--clients", type=int, default=200)
+    parser.add_argument("--duration", type=float, default=15)
+    parser.add_argument("--paths", nargs="+", default=DEFAULT_PATHS)
+    asyncio.run(run(parser.parse_args(argv)))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,30 @@
+"""
+Converts an existing SQLite database to auto_vacuum=INCREMENTAL, so the weekly
+incremental_vacuum job can return free pages to the file system.
+
+Usage (from the backend directory):
+    python -m app.tools.convert_auto_vacuum
+
+The conversion is a full VACUUM: the whole file is rewritten and every write
+waits until it is done. Run it in a maintenance window, ideally with the
+server stopped. Databases created by this version are already incremental.
+"""
+import sys
+import time
+from app.database import is_sqlite
+from app.services.db_maintenance import convert_to_incremental_vacuum
+
+def main():
+    if not is_sqlite:
+        sys.exit("auto_vacuum is a SQLite setting; PostgreSQL reclaims space with autovacuum")
+    started = time.perf_counter()
+    result = convert_to_incremental_vacuum()
+    if not result["converted"] and result["auto_vacuum"] == "incremental":
+        print("Database already uses auto_vacuum=INCREMENTAL, nothing to do")
+        return
+    if not result["converted"]:
+        sys.exit(f"Conversion failed, auto_vacuum is still {result['auto_vacuum']}")
+    print(f"Converted to auto_vacuum=INCREMENTAL in {time.perf_counter() - started:.1f}s")
+
+if __name__ == "__main__":
+    main()
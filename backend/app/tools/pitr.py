@@ -0,0 +1,97 @@
+"""
+Point-in-time recovery for SQLite: rebuilds the database as it was at a given time.
+
+Usage (from the backend directory):
+    python -m app.tools.pitr --to "2026-03-02 14:35:10"
+    python -m app.tools.pitr --to 2026-03-02T14:35:10+01:00 --base db_2026-03-02_03-00-00.sqlite.gz --output recovered.db
+
+Naive times are local time. The newest snapshot (or restore) before the target
+is unpacked, brought to the current schema, and the captured changes after it
+are replayed up to the target from backups/wal/ and, while the database file
+is still there, from its not yet archived change_log rows.
+
+Without --output the result is added to the backup store as
+pitr_<timestamp>.sqlite.gz and can be restored from the Backup Manager like
+any other backup. The live database is never modified by this tool.
+"""
+import argparse
+import os
+import sqlite3
+import sys
+import time
+from contextlib import closing
+from datetime import datetime, timezone
+from sqlalchemy import create_engine
+from sqlmodel import SQLModel
+import app.models  # noqa: F401  (registers all tables on SQLModel.metadata)
+from app.core.migrations import run_migrations
+from app.database import is_sqlite, sqlite_file_name
+from app.services import backup_store, changelog
+
+def to_utc(value: str) -> str:
+    moment = datetime.fromisoformat(value)
+    if moment.tzinfo is None:
+        moment = moment.astimezone()
+    return moment.astimezone(timezone.utc).replace(tzinfo=None).isoformat(sep=" ", timespec="milliseconds")
+
+def recover(until: str, output: str, base: str = None, live_path: str = None) -> dict:
+    """Writes the database as of `until` (UTC, changed_at format) to output."""
+    chosen = changelog.choose_base(backup_store.load_manifest(), until, base)
+    backup_store.extract_sqlite(chosen["filename"], output)
+
+    # Older snapshots are migrated first, so every replayed column exists
+    target = create_engine(f"sqlite:///{output}")
+    SQLModel.metadata.create_all(target)
+    run_migrations(target)
+    with target.begin() as conn:
+        # Replayed rows must not be captured again
+        changelog.drop_triggers(conn)
+    target.dispose()
+
+    replayed = 0
+    live = sqlite3.connect(f"file:{live_path}?mode=ro", uri=True) if live_path and os.path.exists(live_path) else None
+    try:
+        with closing(sqlite3.connect(output)) as conn:
+            columns = {
+                table.name: {row[1] for row in conn.execute(f'PRAGMA table_info("{table.name}")')}
+                for table in changelog.captured_tables()
+            }
+            for change in changelog.iter_changes(chosen["position"], until, live):
+                changelog.apply_change(conn, change, columns)
+                replayed += 1
+            conn.execute("DELETE FROM change_log")
+            conn.commit()
+            result = conn.execute("PRAGMA integrity_check").fetchall()
+    finally:
+        if live is not None:
+            live.close()
+    if result != [("ok",)]:
+        raise RuntimeError(f"Integrity check failed on the recovered database: {result[:5]}")
+    return {"base": chosen["filename"], "base_at": chosen["at"], "replayed": replayed}
+
+def main():
+    parser = argparse.ArgumentParser(description="Rebuild the SQLite database as of a point in time")
+    parser.add_argument("--to", required=True, help="Target time (ISO 8601, local time unless an offset is given)")
+    parser.add_argument("--base", help="Snapshot to start from (default: the newest one before the target)")
+    parser.add_argument("--output", help="Write the database here instead of adding it to the backup store")
+    args = parser.parse_args()
+    if not is_sqlite:
+        sys.exit("Point-in-time recovery here is for SQLite; use PostgreSQL's recovery_target_time instead")
+
+    until = to_utc(args.to)
+    started = time.perf_counter()
+    output = args.output or os.path.join(backup_store.BACKUP_DIR, f".pitr_{datetime.now():%Y-%m-%d_%H-%M-%S}.sqlite")
+    try:
+        result = recover(until, output, args.base, live_path=sqlite_file_name)
+    except (ValueError, FileNotFoundError) as e:
+        sys.exit(str(e))
+    print(f"Base {result['base']} ({result['base_at']} UTC), replayed {result['replayed']} changes up to {until} UTC")
+    if args.output:
+        print(f"Wrote {args.output}")
+    else:
+        entry = backup_store.store_sqlite_snapshot(output, datetime.now(), kind="pitr")
+        print(f"Stored as {entry['filename']}, restore it from the Backup Manager")
+    print(f"Done in {time.perf_counter() - started:.1f}s")
+
+if __name__ == "__main__":
+    main()
@@ -1,4 +1,13 @@
+import argparse
+import os
 import uvicorn
 
 if __name__ == "__main__":
-    uvicorn.run("app.main:app", host="0.0.0.0", port=8003, reload=False)
+    parser = argparse.ArgumentParser(description="Run the Timesheet backend")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8003)
+    # Each worker is a separate process; the scheduler runs in exactly one of them (see app/core/scheduler.py)
+    parser.add_argument("--workers", type=int, default=int(os.environ.get("WEB_CONCURRENCY", 1)),
+                        help="number of worker processes (default: $WEB_CONCURRENCY or 1)")
+    args = parser.parse_args()
+    uvicorn.run("app.main:app", host=args.host, port=args.port, reload=False, workers=args.workers)
@@ -7,24 +7,92 @@ const api = axios.create({
     }
 })
 
+// Last ETag and body per GET url: the server answers 304 while they are current.
+// Bodies are copied in and out, views are free to mutate what they get.
+const etagCache = new Map()
+
+const cacheKey = config => `${config.url}?${new URLSearchParams(config.params || {}).toString()}`
+
 api.interceptors.request.use(config => {
     const token = localStorage.getItem('token')
     if (token) {
         config.headers.Authorization = `Bearer ${token}`
     }
+    if ((config.method || 'get').toLowerCase() === 'get' && config.responseType !== 'blob') {
+        const cached = etagCache.get(cacheKey(config))
+        if (cached) {
+            config.headers['If-None-Match'] = cached.etag
+        }
+        config.validateStatus = status => (status >= 200 && status < 300) || status === 304
+    }
     return config
 })
 
+// Single in-flight refresh shared by all requests that hit a 401 at the same time
+let refreshPromise = null
+
+const refreshAccessToken = () => {
+    if (!refreshPromise) {
+        const refreshToken = localStorage.getItem('refresh_token')
+        refreshPromise = axios.post('/api/auth/refresh', { refresh_token: refreshToken })
+            .then(response => {
+                localStorage.setItem('token', response.data.access_token)
+                localStorage.setItem('refresh_token', response.data.refresh_token)
+                return response.data.access_token
+            })
+            .finally(() => {
+                refreshPromise = null
+            })
+    }
+    return refreshPromise
+}
+
 api.interceptors.response.use(
-    response => response,
-    error => {
+    response => {
+        const config = response.config
+        if (response.status === 304) {
+            const cached = etagCache.get(cacheKey(config))
+            if (cached) {
+                return { ...response, status: 200, data: structuredClone(cached.data) }
+            }
+        } else if (response.headers.etag && (config.method || 'get').toLowerCase() === 'get') {
+            etagCache.set(cacheKey(config), { etag: response.headers.etag, data: structuredClone(response.data) })
+        }
+        return response
+    },
+    async error => {
+        const original = error.config
         if (error.response && error.response.status === 401) {
+            const isAuthCall = original && original.url && original.url.startsWith('/auth/')
+            if (!isAuthCall && !original._retried && localStorage.getItem('refresh_token')) {
+                original._retried = true
+                try {
+                    const token = await refreshAccessToken()
+                    original.headers.Authorization = `Bearer ${token}`
+                    return api(original)
+                } catch (refreshError) {
+                    // Fall through to the login redirect
+                }
+            }
             localStorage.removeItem('token')
+            localStorage.removeItem('refresh_token')
+            etagCache.clear()
             window.location.href = '/login'
         }
         return Promise.reject(error)
     }
 )
 
+// Follows X-Next-Cursor until the last page, for lists that need every row (pickers, dropdowns)
+export const getAllPages = async (url, params = {}) => {
+    let rows = []
+    let cursor = null
+    do {
+        const response = await api.get(url, { params: cursor ? { ...params, cursor } : params })
+        rows = rows.concat(response.data)
+        cursor = response.headers['x-next-cursor'] || null
+    } while (cursor)
+    return rows
+}
 
 export default api
@@ -23,12 +23,19 @@ export const useAuthStore = defineStore('auth', {
             })
             this.token = response.data.access_token
             localStorage.setItem('token', this.token)
+            localStorage.setItem('refresh_token', response.data.refresh_token)
             this.decodeToken()
         },
         logout() {
+            const refreshToken = localStorage.getItem('refresh_token')
+            if (refreshToken) {
+                // Best effort: revoke the session server-side
+                api.post('/auth/logout', { refresh_token: refreshToken }).catch(() => {})
+            }
             this.token = null
             this.user = null
             localStorage.removeItem('token')
+            localStorage.removeItem('refresh_token')
         },
         decodeToken() {
             if (this.token) {